@@ -0,0 +1,91 @@
+"""
+Auth latency benchmark: joined single-round-trip lookup vs the old two-query flow.
+
+Needs a reachable mongod (MONGO_URL, default mongodb://localhost:27017).
+Run from backend/:  python -m benchmarks.bench_auth --users 2000 --requests 5000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timezone, timedelta
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "walt_bench_auth")
+
+import repositories  # noqa: E402
+import server  # noqa: E402
+
+
+async def two_query_flow(db, session_token):
+    session_doc = await db.user_sessions.find_one({"session_token": session_token}, {"_id": 0})
+    expires_at = session_doc["expires_at"]
+    if isinstance(expires_at, str):
+        expires_at = datetime.fromisoformat(expires_at)
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    assert expires_at > datetime.now(timezone.utc)
+    return await db.users.find_one({"user_id": session_doc["user_id"]}, {"_id": 0})
+
+
+async def joined_flow(db, session_token):
+    session = await server.resolve_session(session_token)
+    assert session["expires_in_ms"] > 0
+    return session["user"]
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+async def measure(fn, db, tokens, n):
+    samples = []
+    for _ in range(n):
+        token = random.choice(tokens)
+        t0 = time.perf_counter()
+        await fn(db, token)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    db = server.client[os.environ["DB_NAME"]]
+    server.db = db
+    server.repos = repositories.mongo_repositories(db)
+    await db.users.drop()
+    await db.user_sessions.drop()
+    await db.users.create_index("user_id", unique=True)
+    await db.user_sessions.create_index("session_token", unique=True)
+    expires = datetime.now(timezone.utc) + timedelta(days=7)
+    await db.users.insert_many([
+        {"user_id": f"user_{i}", "email": f"u{i}@bench", "name": f"Bench {i}", "livello": "Principiante"}
+        for i in range(args.users)
+    ])
+    await db.user_sessions.insert_many([
+        {"user_id": f"user_{i}", "session_token": f"tok_{i}", "expires_at": expires}
+        for i in range(args.users)
+    ])
+    tokens = [f"tok_{i}" for i in range(args.users)]
+
+    # Warm up connections and caches before measuring
+    await measure(two_query_flow, db, tokens, 200)
+    await measure(joined_flow, db, tokens, 200)
+
+    for name, fn in (("two_query", two_query_flow), ("joined", joined_flow)):
+        samples = await measure(fn, db, tokens, args.requests)
+        print(f"{name:>10}: p50={statistics.median(samples):.3f}ms "
+              f"p99={percentile(samples, 99):.3f}ms mean={statistics.fmean(samples):.3f}ms")
+
+    await server.client.drop_database(os.environ["DB_NAME"])
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
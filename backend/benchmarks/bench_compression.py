@@ -0,0 +1,54 @@
+"""
+Response compression benchmark: bytes saved and CPU time per endpoint payload.
+
+Serializes the synthetic payloads of bench_json plus a /api/plans page,
+then compresses each with gzip and, when the brotli module is installed,
+brotli at several levels. Prints the size before and after, the share of
+bytes saved and the compression time, i.e. the CPU the middleware adds
+per response. Payloads above the middleware's offload threshold are
+compressed in a worker thread.
+Run from backend/:  python -m benchmarks.bench_compression --repeat 100
+"""
+import argparse
+import time
+
+import plan_generator
+from benchmarks.bench_json import NOW, payloads
+from compression import Compressor, brotli
+from http_cache import dump_json
+
+LEVELS = [("gzip", 1), ("gzip", 6), ("gzip", 9)]
+if brotli is not None:
+    LEVELS += [("br", 4), ("br", 6), ("br", 11)]
+
+
+def plans_page(n: int = 10):
+    plans = []
+    for i in range(n):
+        user = {"user_id": "user_bench", "livello": ("Principiante", "Intermedio", "Avanzato")[i % 3], "eta": 74}
+        plans.append(plan_generator.plan_document(user, plan_generator.user_inputs(user, energia=i), NOW))
+    return plans
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    bodies = [(name, dump_json(content)) for name, _, content in payloads()]
+    bodies.append(("plans", dump_json(plans_page())))
+    print(f"{'payload':>8} {'coding':>7} {'bytes':>8} {'out':>7} {'saved':>6} {'us':>8}")
+    for name, body in bodies:
+        for coding, level in LEVELS:
+            compressor = Compressor(gzip_level=level, brotli_quality=level)
+            out = compressor.compress(body, coding)
+            t0 = time.perf_counter()
+            for _ in range(args.repeat):
+                compressor.compress(body, coding)
+            us = (time.perf_counter() - t0) / args.repeat * 1e6
+            print(f"{name:>8} {coding + str(level):>7} {len(body):>8} {len(out):>7} "
+                  f"{1 - len(out) / len(body):>6.1%} {us:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+JSON encoding benchmark for realistic /api/stats, /api/walks, route and plan payloads.
+
+Compares, per payload:
+- stdlib: jsonable_encoder + json.dumps, the old JSONResponse path;
+- model: response_model validation and serialization in pydantic-core,
+  then orjson, the path of routes declaring a response model;
+- orjson: orjson alone, the path of the cached bodies (http_cache.dump_json).
+Payloads come from benchmarks/synthetic.py, so runs are comparable across commits.
+Run from backend/:  python -m benchmarks.bench_json --repeat 200
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timezone
+from typing import List
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+import plan_generator
+import stats_engine
+from benchmarks import synthetic
+from http_cache import dump_json
+from response_models import PlanOut, RouteOut, StatsOut, WalkOut
+
+NOW = datetime(2026, 10, 1, tzinfo=timezone.utc)
+
+
+def payloads():
+    walks, circuits = synthetic.history("veterano", "user_bench", NOW)
+    walks.sort(key=lambda d: d["data"], reverse=True)
+    circuits.sort(key=lambda d: d["data"], reverse=True)
+    page = [{k: v for k, v in w.items() if k != "percorso"} for w in walks[:100]]
+    percorso = synthetic.route(random.Random(3), 60)
+    user = {"user_id": "user_bench", "livello": "Intermedio", "eta": 74}
+    plan = plan_generator.plan_document(user, plan_generator.user_inputs(user), NOW)
+    return [
+        ("stats", StatsOut, stats_engine.compute_stats(walks, circuits, NOW)),
+        ("walks", List[WalkOut], page),
+        ("route", RouteOut, {"walk_id": "walk_bench", "punti": len(percorso), "percorso": percorso}),
+        ("plan", PlanOut, plan),
+    ]
+
+
+def stdlib(content, _):
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def model(content, adapter):
+    value = adapter.validate_python(content)
+    return orjson.dumps(adapter.dump_python(value, mode="json"), option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def orjson_only(content, _):
+    return dump_json(content)
+
+
+def timed(fn, content, adapter, repeat):
+    fn(content, adapter)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(content, adapter)
+    return (time.perf_counter() - t0) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'payload':>8} {'bytes':>8} {'stdlib us':>10} {'model us':>10} {'orjson us':>10}")
+    for name, annotation, content in payloads():
+        adapter = TypeAdapter(annotation)
+        size = len(orjson_only(content, adapter))
+        results = [timed(fn, content, adapter, args.repeat) for fn in (stdlib, model, orjson_only)]
+        print(f"{name:>8} {size:>8} " + " ".join(f"{us:>10.1f}" for us in results))
+
+
+if __name__ == "__main__":
+    main()
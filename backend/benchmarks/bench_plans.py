@@ -0,0 +1,95 @@
+"""
+Batch plan generation benchmark: plans per second for a group of users.
+
+Builds N synthetic users with mixed livello, giorni and per-user options
+and times plan_batch.build_plans with 1..--workers processes. With --mongo
+it also seeds them into a local mongod (MONGO_URL, default
+mongodb://localhost:27017) and times plan_batch.generate_batch end to end,
+writes included.
+Run from backend/:  python -m benchmarks.bench_plans --users 10000 --workers 4 --mongo
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import plan_batch
+
+DB_NAME = "walt_bench_plans"
+LIVELLI = ["Principiante", "Intermedio", "Avanzato"]
+SETTIMANA = ["Lunedì", "Martedì", "Mercoledì", "Giovedì", "Venerdì", "Sabato", "Domenica"]
+CATEGORIE = ["Gambe", "Core", "Braccia", "Spalle", "Petto", "Schiena", "Cardio"]
+DOLORI = ["ginocchia", "spalle", "schiena"]
+
+
+def synthetic_group(n: int, seed: int = 7):
+    rnd = random.Random(seed)
+    users, inputs = [], {}
+    for i in range(n):
+        uid = f"user_bench_{i}"
+        users.append({"user_id": uid, "livello": rnd.choice(LIVELLI), "eta": rnd.randint(65, 90),
+                      "giorni_disponibili": sorted(rnd.sample(SETTIMANA, rnd.randint(2, 7)), key=SETTIMANA.index)})
+        if rnd.random() < 0.5:
+            inputs[uid] = {"energia": rnd.randint(1, 10),
+                           "focus_muscolare": rnd.sample(CATEGORIE, rnd.randint(0, 2)) or None,
+                           "dolori_articolari": rnd.sample(DOLORI, rnd.randint(0, 2))}
+    return users, inputs
+
+
+def generation_rate(users, inputs, workers: int, chunk_size: int) -> float:
+    now = datetime.now(timezone.utc)
+    chunks = [users[i:i + chunk_size] for i in range(0, len(users), chunk_size)]
+    t0 = time.perf_counter()
+    if workers == 1:
+        for chunk in chunks:
+            plan_batch.build_plans(chunk, inputs, now)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(plan_batch.build_plans, chunks, [inputs] * len(chunks), [now] * len(chunks)))
+    return len(users) / (time.perf_counter() - t0)
+
+
+async def end_to_end(users, inputs, workers: int, chunk_size: int) -> dict:
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    from indexes import ensure_indexes
+
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    await client.drop_database(DB_NAME)
+    db = client[DB_NAME]
+    await ensure_indexes(db)
+    await db.users.insert_many([dict(u, email=f"{u['user_id']}@example.com") for u in users])
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        await plan_batch.generate_batch(db, [u["user_id"] for u in users], inputs, pool, chunk_size)
+        # Second run: every user already has an active plan to deactivate
+        report = await plan_batch.generate_batch(db, [u["user_id"] for u in users], inputs, pool, chunk_size)
+    active = await db.plans.count_documents({"attivo": True})
+    await client.drop_database(DB_NAME)
+    return {**report, "piani_attivi": active}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=plan_batch.CHUNK_SIZE)
+    parser.add_argument("--mongo", action="store_true", help="misura anche la scrittura su un mongod locale")
+    args = parser.parse_args()
+
+    users, inputs = synthetic_group(args.users)
+    workers = 1
+    while workers <= args.workers:
+        rate = generation_rate(users, inputs, workers, args.chunk_size)
+        print(f"generazione, {workers} processi: {rate:,.0f} piani/s")
+        workers *= 2
+    if args.mongo:
+        report = asyncio.run(end_to_end(users, inputs, args.workers, args.chunk_size))
+        print(f"end to end, {args.workers} processi: {report['piani_al_secondo']:,.0f} piani/s "
+              f"in {report['secondi']}s, {report['piani_attivi']} piani attivi")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Walk route storage benchmark: inline percorso arrays vs walk_routes.
+
+Builds hour-long synthetic walks (one fix every 5 s) and reports the BSON
+size of both layouts and the cost of decoding a /api/walks page. With
+--mongo it also seeds a local mongod (MONGO_URL, default
+mongodb://localhost:27017) and times the actual reads.
+Run from backend/:  python -m benchmarks.bench_routes --walks 100 --mongo
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+import bson
+
+import walk_routes
+from benchmarks.synthetic import walk
+
+DB_NAME = "walt_bench_routes"
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+async def atimed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def build(n_walks, minutes):
+    rnd = random.Random("bench_routes")
+    now = datetime.now(timezone.utc)
+    inline = [walk(rnd, "user_bench", now - timedelta(days=i), i, with_route=True, minutes=minutes) for i in range(n_walks)]
+    split, routes = [], []
+    for w in inline:
+        doc = {k: v for k, v in w.items() if k != "percorso"}
+        doc["punti_percorso"] = len(w["percorso"])
+        split.append(doc)
+        routes.append(walk_routes.route_doc(w["walk_id"], w["user_id"], w["percorso"]))
+    return inline, split, routes
+
+
+async def mongo_reads(inline, split, routes, repeat):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    await client.drop_database(DB_NAME)
+    db = client[DB_NAME]
+    await db.walks_inline.insert_many([dict(w) for w in inline])
+    await db.walks.insert_many([dict(w) for w in split])
+    await db[walk_routes.ROUTE_COLLECTION].insert_many([dict(r) for r in routes])
+    for name in ("walks_inline", "walks"):
+        await db[name].create_index([("user_id", 1), ("data", -1)])
+    for name in ("walks_inline", "walks", walk_routes.ROUTE_COLLECTION):
+        s = await db.command("collStats", name)
+        print(f"{name:>16}: size={s['size'] / 1024:.0f} KiB storage={s['storageSize'] / 1024:.0f} KiB")
+
+    walk_id = split[0]["walk_id"]
+    print(f"  lista inline: {await atimed(lambda: db.walks_inline.find({'user_id': 'user_bench'}, {'_id': 0}).sort('data', -1).to_list(100), repeat):.2f}ms")
+    print(f"  lista split:  {await atimed(lambda: db.walks.find({'user_id': 'user_bench'}, {'_id': 0}).sort('data', -1).to_list(100), repeat):.2f}ms")
+    print(f"  un percorso:  {await atimed(lambda: walk_routes.load_route(db, walk_id, 'user_bench'), repeat):.2f}ms")
+    await client.drop_database(DB_NAME)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--walks", type=int, default=100)
+    parser.add_argument("--minutes", type=int, default=60)
+    parser.add_argument("--tolleranza", type=float, default=3.0)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--mongo", action="store_true", help="misura anche le letture su mongod")
+    args = parser.parse_args()
+
+    inline, split, routes = build(args.walks, args.minutes)
+    points = sum(len(w["percorso"]) for w in inline)
+    inline_bytes = [bson.encode(w) for w in inline]
+    split_bytes = [bson.encode(w) for w in split]
+    route_bytes = [bson.encode(r) for r in routes]
+    old, new_walks, new_routes = sum(map(len, inline_bytes)), sum(map(len, split_bytes)), sum(map(len, route_bytes))
+    print(f"{args.walks} camminate da {args.minutes} min, {points} punti")
+    print(f"  inline:        {old / 1024:.0f} KiB ({old / points:.1f} B/punto)")
+    print(f"  walks:         {new_walks / 1024:.0f} KiB")
+    print(f"  walk_routes:   {new_routes / 1024:.0f} KiB ({new_routes / points:.1f} B/punto)")
+    print(f"  riduzione:     {old / (new_walks + new_routes):.1f}x totale, {old / new_walks:.0f}x sulla collezione walks")
+
+    decoded = walk_routes.decode_route(routes[0]["percorso"])
+    preview = walk_routes.simplify_route(decoded, args.tolleranza)
+    print(f"  anteprima:     {len(decoded)} -> {len(preview)} punti (tolleranza {args.tolleranza} m)")
+
+    print("decodifica BSON di una pagina /api/walks (client):")
+    print(f"  inline: {timed(lambda: [bson.decode(b) for b in inline_bytes], args.repeat):.2f}ms")
+    print(f"  split:  {timed(lambda: [bson.decode(b) for b in split_bytes], args.repeat):.2f}ms")
+    print(f"  un percorso (decode + semplificazione): "
+          f"{timed(lambda: walk_routes.simplify_route(walk_routes.decode_route(bson.decode(route_bytes[0])['percorso']), args.tolleranza), args.repeat):.2f}ms")
+
+    if args.mongo:
+        asyncio.run(mongo_reads(inline, split, routes, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+OAuth session exchange benchmark: a new client per login vs the pooled SessionExchange.
+
+Starts benchmarks/session_stub.py in-process on a local port and runs
+--logins exchanges at --concurrency, first with a fresh httpx.AsyncClient
+per login (the old create_session), then through one SessionExchange.
+Prints throughput and p50/p99 for both; --fail-rate shows the retries.
+Run from backend/:  python -m benchmarks.bench_session_exchange --logins 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+import uvicorn
+
+from benchmarks.session_stub import create_app
+from session_exchange import InvalidSession, SessionExchange, UpstreamUnavailable
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+async def run(login, n, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+    samples, errors = [], 0
+
+    async def one(i):
+        nonlocal errors
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                await login(f"sess_{i}")
+            except (InvalidSession, UpstreamUnavailable, httpx.HTTPError):
+                errors += 1
+            samples.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    return samples, errors, time.perf_counter() - t0
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = uvicorn.Config(create_app(args.latency_ms, args.fail_rate), host="127.0.0.1", port=args.port,
+                            log_level="warning")
+    stub = uvicorn.Server(config)
+    task = asyncio.create_task(stub.serve())
+    while not stub.started:
+        await asyncio.sleep(0.05)
+    url = f"http://127.0.0.1:{args.port}/session-data"
+
+    async def per_login_client(session_id):
+        async with httpx.AsyncClient() as client:
+            resp = await client.get(url, headers={"X-Session-ID": session_id})
+            if resp.status_code != 200:
+                raise InvalidSession()
+            return resp.json()
+
+    exchange = SessionExchange(url, max_connections=args.concurrency, backoff=0.01)
+    await exchange.start()
+    for name, login in (("per_login", per_login_client), ("pooled", exchange.fetch)):
+        await run(login, min(100, args.logins), args.concurrency)
+        samples, errors, elapsed = await run(login, args.logins, args.concurrency)
+        print(f"{name:>10}: {args.logins / elapsed:8.1f} login/s p50={statistics.median(samples):.2f}ms "
+              f"p99={percentile(samples, 99):.2f}ms errors={errors}")
+    print(exchange.stats())
+    await exchange.stop()
+
+    stub.should_exit = True
+    await task
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,137 @@
+"""
+/api/sfide/check-progress benchmark: per-challenge update_one vs bulk_write.
+
+Seeds synthetic users with open, expired and single-metric challenges into
+a local mongod (MONGO_URL, default mongodb://localhost:27017) and counts
+the commands each implementation sends per call, through a pymongo
+CommandListener, for a first call that updates the challenges and for a
+repeated call with nothing new. Then reports latency.
+Run from backend/:  python -m benchmarks.bench_sfide --users 5 --sfide 6
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+import sfide_progress
+import stats_engine
+from benchmarks.synthetic import history
+from indexes import ensure_indexes
+
+DB_NAME = "walt_bench_sfide"
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = Counter()
+
+    def started(self, event):
+        if event.database_name == DB_NAME:
+            self.commands[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+async def legacy_check_progress(db, uid, now):
+    # The implementation before sfide_progress
+    sfide = await db.sfide.find({"user_id": uid, "completata": False}, {"_id": 0}).to_list(50)
+    week_ago = (now - timedelta(days=7)).isoformat()
+    walks = await db.walks.find({"user_id": uid, "data": {"$gte": week_ago}}, {"_id": 0, "percorso": 0}).to_list(100)
+    circuits = await db.circuits.find({"user_id": uid, "data": {"$gte": week_ago}}, {"_id": 0}).to_list(100)
+    field_map = stats_engine.challenge_metrics(walks, circuits, now)
+    updated = []
+    for s in sfide:
+        if s.get("scadenza", "") < now.isoformat():
+            await db.sfide.update_one({"sfida_id": s["sfida_id"]}, {"$set": {"scaduta": True}})
+            continue
+        cv = field_map.get(s.get("target_field", ""), 0)
+        completata = cv >= s.get("target_value", 0)
+        await db.sfide.update_one({"sfida_id": s["sfida_id"]}, {"$set": {"current_value": round(cv, 1), "completata": completata}})
+        s["current_value"] = round(cv, 1)
+        s["completata"] = completata
+        updated.append(s)
+    return updated
+
+
+async def current_check_progress(db, uid, now):
+    return (await sfide_progress.check_progress(db, uid, now))[0]
+
+
+IMPLEMENTATIONS = {"legacy": legacy_check_progress, "bulk": current_check_progress}
+
+
+def make_sfide(uid, now, count, metrics):
+    sfide = []
+    for i in range(count):
+        expired = i % 4 == 3
+        sfide.append({
+            "sfida_id": f"sfida_{uid}_{i}", "user_id": uid, "target_field": metrics[i % len(metrics)],
+            "target_value": 10 ** 6, "current_value": 0, "completata": False,
+            "created_at": (now - timedelta(days=8 if expired else 2)).isoformat(),
+            "scadenza": (now + timedelta(days=-1 if expired else 5)).isoformat(),
+        })
+    return sfide
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--sfide", type=int, default=6, help="sfide aperte per utente (una su quattro scaduta)")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    counter = CommandCounter()
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"), event_listeners=[counter])
+    await client.drop_database(DB_NAME)
+    db = client[DB_NAME]
+    await ensure_indexes(db)
+    now = datetime.now(timezone.utc)
+    users = [f"user_bench_{i}" for i in range(args.users)]
+    for uid in users:
+        walks, circuits = history("regolare", uid, now)
+        if walks:
+            await db.walks.insert_many(walks)
+        if circuits:
+            await db.circuits.insert_many(circuits)
+
+    scenarios = {
+        "tutte le metriche": list(stats_engine.CHALLENGE_METRICS),
+        "solo km": ["km"],
+        "solo volume": ["volume"],
+    }
+    for scenario, metrics in scenarios.items():
+        print(f"== {scenario}")
+        for name, fn in IMPLEMENTATIONS.items():
+            await db.sfide.delete_many({})
+            await db.sfide.insert_many([s for uid in users for s in make_sfide(uid, now, args.sfide, metrics)])
+            per_call = {}
+            for phase in ("prima", "ripetuta"):
+                counter.commands.clear()
+                for uid in users:
+                    await fn(db, uid, now)
+                per_call[phase] = {cmd: n / len(users) for cmd, n in sorted(counter.commands.items())}
+            samples = []
+            for _ in range(args.repeat):
+                for uid in users:
+                    t0 = time.perf_counter()
+                    await fn(db, uid, now)
+                    samples.append((time.perf_counter() - t0) * 1000)
+            rounds = {phase: sum(c.values()) for phase, c in per_call.items()}
+            print(f"{name:>7}: round trip per chiamata prima={rounds['prima']:.1f} ripetuta={rounds['ripetuta']:.1f} "
+                  f"{per_call['prima']}  p50={statistics.median(samples):.2f}ms")
+
+    await client.drop_database(DB_NAME)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""
+/api/stats backend benchmark: Python scan vs daily rollups vs Mongo aggregation.
+
+Seeds the same synthetic users into a local mongod (MONGO_URL, default
+mongodb://localhost:27017), checks that the three backends agree and
+reports per-backend latency.
+Run from backend/:  python -m benchmarks.bench_stats --profile veterano --users 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from datetime import datetime, timezone
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import rollups
+import stats_aggregation
+import stats_engine
+from benchmarks.synthetic import PROFILES, history
+from indexes import ensure_indexes
+
+DB_NAME = "walt_bench_stats"
+
+
+async def scan_stats(db, uid, now):
+    # The pre-rollup implementation, including its 1000-document cap
+    walks = await db.walks.find({"user_id": uid}, {"_id": 0}).sort("data", -1).to_list(1000)
+    circuits = await db.circuits.find({"user_id": uid}, {"_id": 0}).sort("data", -1).to_list(1000)
+    return stats_engine.compute_stats(walks, circuits, now)
+
+
+BACKENDS = {"scan": scan_stats, "rollup": rollups.load_stats, "aggregate": stats_aggregation.load_stats}
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="veterano")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    await client.drop_database(DB_NAME)
+    db = client[DB_NAME]
+    await ensure_indexes(db)
+    now = datetime.now(timezone.utc)
+    users = [f"user_bench_{i}" for i in range(args.users)]
+    for uid in users:
+        walks, circuits = history(args.profile, uid, now, with_routes=True)
+        if walks:
+            await db.walks.insert_many(walks)
+        if circuits:
+            await db.circuits.insert_many(circuits)
+        await rollups.backfill_user(db, uid)
+        print(f"{uid}: {len(walks)} camminate, {len(circuits)} circuiti")
+
+    results = {}
+    for uid in users:
+        results[uid] = {name: await fn(db, uid, now) for name, fn in BACKENDS.items()}
+        if results[uid]["rollup"] != results[uid]["aggregate"]:
+            print(f"ATTENZIONE {uid}: rollup e aggregate divergono")
+        if results[uid]["scan"] != results[uid]["aggregate"]:
+            print(f"nota {uid}: scan differisce (limite di 1000 documenti)")
+
+    for name, fn in BACKENDS.items():
+        samples = []
+        for _ in range(args.repeat):
+            for uid in users:
+                t0 = time.perf_counter()
+                await fn(db, uid, now)
+                samples.append((time.perf_counter() - t0) * 1000)
+        samples.sort()
+        print(f"{name:>10}: p50={statistics.median(samples):.2f}ms "
+              f"p95={samples[int(0.95 * (len(samples) - 1))]:.2f}ms max={samples[-1]:.2f}ms")
+
+    await client.drop_database(DB_NAME)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
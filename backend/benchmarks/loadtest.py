@@ -0,0 +1,337 @@
+"""
+Load test of the API with synthetic user histories.
+
+``seed`` writes a deterministic population to the database:
+- users and 7-day sessions;
+- walks, circuits and daily rollups, from benchmarks/synthetic.py;
+- one active plan per user.
+Profiles range from new accounts to 5-year heavy users with thousands of
+walks and circuits. User i always gets the session token ``load_tok_{i}``,
+so ``run`` can drive a server seeded earlier without reading the database.
+
+``run`` drives weighted scenarios from --concurrency virtual users, for
+--duration seconds or --requests requests:
+- app open: me, stats, active plan, sfide;
+- walk upload, with a GPS route;
+- circuit log;
+- plan generate;
+- challenge check.
+It prints throughput, errors and p50/p95/p99 per endpoint as JSON, with
+the git commit, so runs can be compared across commits. The target is one
+of:
+- --url: a server that is already running;
+- --spawn: ``uvicorn server:app`` on a local mongod (MONGO_URL), seeded first;
+- --memory: the app in-process over httpx's ASGI transport, on a
+  mongomock-motor database. mongomock-motor is optional and not in
+  requirements.txt. mongomock has no $convert, which session resolution
+  uses, so this mode fills the app's session cache from the seeded
+  sessions instead. It measures the app's CPU path, not MongoDB.
+
+Run from backend/:
+  python -m benchmarks.loadtest run --spawn --users 200 --concurrency 50 --duration 60 --out report.json
+  python -m benchmarks.loadtest run --memory --users 30 --concurrency 10 --duration 20
+  python -m benchmarks.loadtest seed --users 200   (then: run --url http://127.0.0.1:8001 --users 200)
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+import httpx
+
+import plan_generator
+import repositories
+import rollups
+from benchmarks import synthetic
+
+DB_NAME = "walt_loadtest"
+LIVELLI = ["Principiante", "Intermedio", "Avanzato"]
+SETTIMANA = ["Lunedì", "Martedì", "Mercoledì", "Giovedì", "Venerdì", "Sabato", "Domenica"]
+# Share of the population per synthetic.PROFILES entry
+POPULATION = {"nuovo": 0.3, "occasionale": 0.3, "regolare": 0.3, "veterano": 0.1}
+DEFAULT_MIX = {"app_open": 55, "walk_upload": 15, "circuit_log": 12, "plan_generate": 8, "challenge_check": 10}
+
+
+# ===== SEED =====
+
+def token(i: int) -> str:
+    return f"load_tok_{i}"
+
+
+def profile_of(i: int, n: int) -> str:
+    """Profiles in POPULATION proportions, spread evenly over the user indexes."""
+    edge = 0.0
+    position = (i + 0.5) / n
+    for profile, share in POPULATION.items():
+        edge += share
+        if position < edge:
+            return profile
+    return "veterano"
+
+
+def user_doc(i: int, n: int, now: datetime) -> dict:
+    rnd = random.Random(f"user:{i}")
+    return {
+        "user_id": f"user_load_{i}", "email": f"load{i}@example.com", "name": f"Load {i}",
+        "nome": f"Load {i}", "eta": rnd.randint(65, 90), "peso": rnd.randint(55, 95), "altezza": rnd.randint(150, 185),
+        "livello": rnd.choice(LIVELLI), "obiettivo": "Mantenersi in forma",
+        "giorni_disponibili": sorted(rnd.sample(SETTIMANA, rnd.randint(2, 5)), key=SETTIMANA.index),
+        "profile_complete": True, "profilo_sintetico": profile_of(i, n), "created_at": now,
+    }
+
+
+async def seed(db, n: int, now: datetime) -> Dict[str, int]:
+    """Replace the database contents with ``n`` synthetic users; returns document counts."""
+    for name in ("users", "user_sessions", "walks", "circuits", "plans", "sfide", rollups.ROLLUP_COLLECTION):
+        await db[name].delete_many({})
+    counts = defaultdict(int)
+    expires = now + timedelta(days=7)
+    for i in range(n):
+        user = user_doc(i, n, now)
+        walks, circuits = synthetic.history(user["profilo_sintetico"], user["user_id"], now)
+        for w in walks:
+            w.pop("percorso", None)
+            w["punti_percorso"] = 0
+        await db.users.insert_one(user)
+        await db.user_sessions.insert_one({"user_id": user["user_id"], "session_token": token(i),
+                                           "expires_at": expires, "created_at": now})
+        if walks:
+            await db.walks.insert_many(walks)
+        if circuits:
+            await db.circuits.insert_many(circuits)
+        await db.plans.insert_one(plan_generator.plan_document(user, plan_generator.user_inputs(user), now))
+        counts["walks"] += len(walks)
+        counts["circuits"] += len(circuits)
+        counts["rollup_days"] += await rollups.backfill_user(db, user["user_id"])
+    counts["users"] = n
+    return dict(counts)
+
+
+# ===== SCENARIOS =====
+
+def walk_body(rnd: random.Random) -> dict:
+    minutes = rnd.randint(15, 45)
+    doc = synthetic.walk(rnd, "u", datetime.now(timezone.utc), 0, with_route=True, minutes=minutes)
+    return {k: doc[k] for k in ("distanza_km", "tempo_secondi", "passi", "velocita_media_kmh", "percorso")}
+
+
+def circuit_body(rnd: random.Random) -> dict:
+    doc = synthetic.circuit(rnd, "u", datetime.now(timezone.utc), 0)
+    esercizi = [{k: e[k] for k in ("exercise_id", "nome", "sets", "piano_serie", "piano_ripetizioni", "piano_peso_kg")}
+                for e in doc["esercizi"]]
+    return {"durata_minuti": doc["durata_minuti"], "esercizi": esercizi}
+
+
+def scenario_requests(name: str, rnd: random.Random) -> List[Tuple[str, str, str, dict]]:
+    """(endpoint name, method, path, json body) of one scenario, in order."""
+    if name == "app_open":
+        return [("GET /api/auth/me", "GET", "/api/auth/me", None),
+                ("GET /api/stats", "GET", "/api/stats", None),
+                ("GET /api/plans", "GET", "/api/plans?limit=1", None),
+                ("GET /api/sfide", "GET", "/api/sfide", None)]
+    if name == "walk_upload":
+        return [("POST /api/walks", "POST", "/api/walks", walk_body(rnd))]
+    if name == "circuit_log":
+        return [("POST /api/circuits", "POST", "/api/circuits", circuit_body(rnd))]
+    if name == "plan_generate":
+        return [("POST /api/plans/generate", "POST", "/api/plans/generate", {"energia": rnd.randint(1, 10)})]
+    if name == "challenge_check":
+        return [("POST /api/sfide/check-progress", "POST", "/api/sfide/check-progress", None),
+                ("GET /api/sfide", "GET", "/api/sfide", None)]
+    raise ValueError(name)
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"scenario sconosciuto: {name.strip()}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+# ===== DRIVER =====
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+async def drive(http: httpx.AsyncClient, users: int, mix: Dict[str, float], concurrency: int,
+                duration: float, max_requests: int, seed_value: int) -> Tuple[Dict[str, list], Dict[str, int], float]:
+    """Run the virtual users; returns (latencies in ms by endpoint, errors by endpoint, elapsed seconds)."""
+    latencies: Dict[str, list] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    names, weights = list(mix), list(mix.values())
+    sent = 0
+    deadline = time.perf_counter() + duration
+
+    async def virtual_user(n: int):
+        nonlocal sent
+        rnd = random.Random(seed_value * 1000 + n)
+        while time.perf_counter() < deadline and (not max_requests or sent < max_requests):
+            i = rnd.randrange(users)
+            headers = {"Authorization": f"Bearer {token(i)}", "Accept-Encoding": "gzip"}
+            for endpoint, method, path, body in scenario_requests(rnd.choices(names, weights)[0], rnd):
+                sent += 1
+                t0 = time.perf_counter()
+                try:
+                    resp = await http.request(method, path, json=body, headers=headers)
+                    failed = resp.status_code >= 400
+                except httpx.HTTPError:
+                    failed = True
+                latencies[endpoint].append((time.perf_counter() - t0) * 1000)
+                if failed:
+                    errors[endpoint] += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(virtual_user(n) for n in range(concurrency)))
+    return latencies, errors, time.perf_counter() - t0
+
+
+def report(latencies: Dict[str, list], errors: Dict[str, int], elapsed: float, args) -> dict:
+    def summary(samples, failed):
+        return {
+            "requests": len(samples), "errors": failed, "rps": round(len(samples) / elapsed, 1),
+            "p50_ms": round(percentile(samples, 50), 2), "p95_ms": round(percentile(samples, 95), 2),
+            "p99_ms": round(percentile(samples, 99), 2), "mean_ms": round(statistics.fmean(samples), 2),
+            "max_ms": round(max(samples), 2),
+        }
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    every = [ms for samples in latencies.values() for ms in samples]
+    return {
+        "meta": {
+            "commit": commit, "started_at": datetime.now(timezone.utc).isoformat(), "python": platform.python_version(),
+            "target": args.url or ("memory" if args.memory else "spawn"), "users": args.users,
+            "concurrency": args.concurrency, "duration_s": round(elapsed, 2), "mix": args.mix or DEFAULT_MIX, "seed": args.seed,
+        },
+        "total": summary(every, sum(errors.values())) if every else {},
+        "endpoints": {name: summary(samples, errors.get(name, 0)) for name, samples in sorted(latencies.items())},
+    }
+
+
+# ===== TARGETS =====
+
+def mongo_db():
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    return client[os.environ.get("DB_NAME", DB_NAME)]
+
+
+async def spawn_server(port: int, workers: int) -> subprocess.Popen:
+    env = {**os.environ, "DB_NAME": os.environ.get("DB_NAME", DB_NAME), "SCHEDULER_ENABLED": "0",
+           "MONGO_URL": os.environ.get("MONGO_URL", "mongodb://localhost:27017")}
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "server:app", "--port", str(port),
+                             "--workers", str(workers), "--log-level", "warning"], env=env)
+    async with httpx.AsyncClient() as http:
+        for _ in range(100):
+            try:
+                if (await http.get(f"http://127.0.0.1:{port}/api/health")).status_code == 200:
+                    return proc
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("il server non risponde su /api/health")
+
+
+async def run_memory(args, mix, now):
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", DB_NAME)
+    os.environ["SESSION_CACHE_TTL"] = str(7 * 24 * 3600)
+    from mongomock_motor import AsyncMongoMockClient
+
+    import server
+
+    db = AsyncMongoMockClient()[DB_NAME]
+    server.db = db
+    server.repos = repositories.mongo_repositories(db)
+    counts = await seed(db, args.users, now)
+    print(f"seed: {counts}", file=sys.stderr)
+    async for user in db.users.find({}, {"_id": 0}):
+        i = int(user["user_id"].rsplit("_", 1)[1])
+        server.session_cache.put(token(i), user, 7 * 24 * 3600)
+    await server.progress_engine.start(db)
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as http:
+            await prepare(http, args.users)
+            return await drive(http, args.users, mix, args.concurrency, args.duration, args.requests, args.seed)
+    finally:
+        await server.progress_engine.stop()
+
+
+async def prepare(http: httpx.AsyncClient, users: int) -> None:
+    """Give every user its challenges, through the API; not measured."""
+    for i in range(users):
+        await http.post("/api/sfide/generate", headers={"Authorization": f"Bearer {token(i)}"})
+
+
+async def _main(args) -> None:
+    now = datetime.now(timezone.utc)
+    if args.command == "seed":
+        print(json.dumps(await seed(mongo_db(), args.users, now)))
+        return
+    mix = args.mix or DEFAULT_MIX
+    if args.memory:
+        latencies, errors, elapsed = await run_memory(args, mix, now)
+    else:
+        proc = None
+        base_url = args.url
+        if args.spawn:
+            print(f"seed: {await seed(mongo_db(), args.users, now)}", file=sys.stderr)
+            proc = await spawn_server(args.port, args.workers)
+            base_url = f"http://127.0.0.1:{args.port}"
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        try:
+            async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as http:
+                await prepare(http, args.users)
+                latencies, errors, elapsed = await drive(http, args.users, mix, args.concurrency,
+                                                         args.duration, args.requests, args.seed)
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait()
+    result = report(latencies, errors, elapsed, args)
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test di carico dell'API con utenti sintetici")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sd = sub.add_parser("seed", help="popola il database (MONGO_URL, DB_NAME) con utenti sintetici")
+    sd.add_argument("--users", type=int, default=200)
+    rn = sub.add_parser("run", help="esegui il test di carico e stampa il report JSON")
+    target = rn.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="server già avviato e già popolato con seed")
+    target.add_argument("--spawn", action="store_true", help="popola mongod e avvia uvicorn server:app")
+    target.add_argument("--memory", action="store_true", help="app in-process su mongomock-motor")
+    rn.add_argument("--users", type=int, default=200)
+    rn.add_argument("--concurrency", type=int, default=20)
+    rn.add_argument("--duration", type=float, default=30.0, help="secondi")
+    rn.add_argument("--requests", type=int, default=0, help="ferma dopo N richieste (0: solo la durata)")
+    rn.add_argument("--mix", type=parse_mix, help="pesi degli scenari, es. app_open=60,walk_upload=20")
+    rn.add_argument("--seed", type=int, default=1, help="seme degli utenti virtuali")
+    rn.add_argument("--port", type=int, default=8001)
+    rn.add_argument("--workers", type=int, default=1, help="worker uvicorn con --spawn")
+    rn.add_argument("--out", help="scrivi il report JSON anche in questo file")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,48 @@
+"""
+Local stand-in for the OAuth session-data service, for load tests of /api/auth/session.
+
+Answers GET /session-data like the real service: session_id "invalid*"
+gets a 404, anything else gets a deterministic user derived from the
+session_id. --latency-ms adds a fixed delay and --fail-rate makes that
+share of the answers 503s, to exercise the retries and the breaker.
+Run from backend/:  python -m benchmarks.session_stub --port 8099
+then start the server with AUTH_SESSION_DATA_URL=http://127.0.0.1:8099/session-data
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def create_app(latency_ms: float = 0.0, fail_rate: float = 0.0, seed: int = 1) -> FastAPI:
+    app = FastAPI()
+    rnd = random.Random(seed)
+
+    @app.get("/session-data")
+    async def session_data(request: Request):
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        if fail_rate and rnd.random() < fail_rate:
+            return JSONResponse({"detail": "unavailable"}, status_code=503)
+        session_id = request.headers.get("X-Session-ID", "")
+        if not session_id or session_id.startswith("invalid"):
+            return JSONResponse({"detail": "session not found"}, status_code=404)
+        n = int(hashlib.sha1(session_id.encode()).hexdigest()[:8], 16) % 100000
+        return {"email": f"stub{n}@example.com", "name": f"Stub {n}", "picture": "",
+                "session_token": f"stub_{session_id}"}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency_ms, args.fail_rate), host="127.0.0.1", port=args.port, log_level="warning")
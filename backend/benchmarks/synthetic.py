@@ -0,0 +1,85 @@
+"""
+Deterministic synthetic user histories for benchmarks and load tests.
+
+Every document is derived from a seeded RNG, so two runs with the same
+profile, user id and reference time produce identical data.
+"""
+import math
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+EXERCISE_IDS = [
+    "ex_squat_sedia", "ex_affondi_supporto", "ex_calf_raises", "ex_crunch_sedia", "ex_plank_ginocchia",
+    "ex_curl_manubri", "ex_shoulder_press", "ex_push_up_muro", "ex_rematore_manubri", "ex_marcia_posto",
+]
+
+# name -> (days of history, walks per week, circuits per week)
+PROFILES: Dict[str, Tuple[int, float, float]] = {
+    "nuovo": (7, 2, 1),
+    "occasionale": (120, 2, 1),
+    "regolare": (365, 4, 2),
+    "veterano": (5 * 365, 6, 3),
+}
+
+
+def route(rnd: random.Random, minutes: int, start_lat: float = 45.4642, start_lng: float = 9.19) -> List[dict]:
+    """One GPS fix every 5 seconds along a gently wandering path at walking pace."""
+    points = []
+    lat, lng = start_lat, start_lng
+    heading = rnd.uniform(0, 2 * math.pi)
+    for _ in range(minutes * 12):
+        heading += rnd.gauss(0, 0.15)
+        step_m = rnd.uniform(4.5, 7.5)
+        lat += step_m * math.cos(heading) / 111_320
+        lng += step_m * math.sin(heading) / (111_320 * math.cos(math.radians(lat)))
+        points.append({"lat": round(lat + rnd.gauss(0, 2e-6), 7), "lng": round(lng + rnd.gauss(0, 2e-6), 7)})
+    return points
+
+
+def walk(rnd: random.Random, user_id: str, when: datetime, n: int, with_route: bool = False, minutes: int = None) -> dict:
+    minutes = minutes or rnd.randint(15, 70)
+    km = round(minutes * rnd.uniform(0.055, 0.085), 2)
+    doc = {
+        "walk_id": f"walk_{user_id}_{n}", "user_id": user_id,
+        "distanza_km": km, "tempo_secondi": minutes * 60, "passi": int(km * 1000 / 0.65),
+        "velocita_media_kmh": round(km / (minutes / 60), 1),
+        "percorso": route(rnd, minutes) if with_route else [],
+        "note": None, "data": when.isoformat(),
+    }
+    return doc
+
+
+def circuit(rnd: random.Random, user_id: str, when: datetime, n: int) -> dict:
+    esercizi = []
+    for eid in rnd.sample(EXERCISE_IDS, rnd.randint(3, 6)):
+        peso = rnd.choice([0, 1, 1.5, 2, 3, 4])
+        reps = rnd.randint(8, 15)
+        sets = [{"set_number": i + 1, "ripetizioni": reps, "peso_kg": peso, "completato": rnd.random() < 0.9}
+                for i in range(rnd.randint(2, 3))]
+        esercizi.append({
+            "exercise_id": eid, "nome": eid, "sets": sets, "piano_serie": 3, "piano_ripetizioni": reps,
+            "piano_peso_kg": peso, "deviazioni": {"reps": 0, "peso_kg": 0, "serie": 0},
+        })
+    return {
+        "circuit_id": f"circuit_{user_id}_{n}", "user_id": user_id,
+        "durata_minuti": rnd.randint(15, 40), "esercizi": esercizi, "note": None, "data": when.isoformat(),
+    }
+
+
+def history(profile: str, user_id: str, now: datetime, with_routes: bool = False) -> Tuple[List[dict], List[dict]]:
+    """Walks and circuits of one user, newest first."""
+    days, walks_per_week, circuits_per_week = PROFILES[profile]
+    rnd = random.Random(f"{profile}:{user_id}")
+    walks, circuits = [], []
+    for d in range(days):
+        day = now - timedelta(days=d)
+        if rnd.random() < walks_per_week / 7:
+            when = day.replace(hour=rnd.randint(7, 11), minute=rnd.randint(0, 59))
+            if when <= now:
+                walks.append(walk(rnd, user_id, when, len(walks), with_routes))
+        if rnd.random() < circuits_per_week / 7:
+            when = day.replace(hour=rnd.randint(15, 18), minute=rnd.randint(0, 59))
+            if when <= now:
+                circuits.append(circuit(rnd, user_id, when, len(circuits)))
+    return walks, circuits
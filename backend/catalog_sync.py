@@ -0,0 +1,97 @@
+"""Versioned, diff-based sync of ESERCIZI_DATABASE into db.exercises.
+
+The catalog is content-hashed and the hash is stored as a version marker
+in ``catalog_meta``. When the marker matches (and no duplicates crept in)
+the sync is a single lookup; otherwise the catalog is diffed against Mongo
+and the difference is applied with one unordered ``bulk_write``.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import List
+
+from pymongo import DeleteMany, DeleteOne, ReplaceOne
+from pymongo.errors import BulkWriteError
+
+from exercises_database import ESERCIZI_DATABASE
+
+logger = logging.getLogger(__name__)
+
+META_COLLECTION = "catalog_meta"
+MARKER_ID = "exercises_catalog"
+DUPLICATE_KEY = 11000
+
+
+def doc_hash(doc: dict) -> str:
+    body = {k: v for k, v in doc.items() if k != "_id"}
+    return hashlib.sha256(json.dumps(body, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+def catalog_version(exercises: List[dict]) -> str:
+    digest = hashlib.sha256()
+    for ex in exercises:
+        digest.update(doc_hash(ex).encode("ascii"))
+    return digest.hexdigest()
+
+
+def diff_operations(exercises: List[dict], existing: List[dict]) -> list:
+    """Bulk operations that turn ``existing`` (raw docs with _id) into ``exercises``."""
+    by_id = {}
+    for doc in existing:
+        by_id.setdefault(doc.get("exercise_id"), []).append(doc)
+    ops = []
+    for ex in exercises:
+        docs = by_id.pop(ex["exercise_id"], [])
+        # Concurrent first requests used to seed the catalog twice
+        for duplicate in docs[1:]:
+            ops.append(DeleteOne({"_id": duplicate["_id"]}))
+        if not docs:
+            ops.append(ReplaceOne({"exercise_id": ex["exercise_id"]}, dict(ex), upsert=True))
+        elif doc_hash(docs[0]) != doc_hash(ex):
+            ops.append(ReplaceOne({"_id": docs[0]["_id"]}, dict(ex)))
+    stale = [doc["_id"] for docs in by_id.values() for doc in docs]
+    if stale:
+        ops.append(DeleteMany({"_id": {"$in": stale}}))
+    return ops
+
+
+async def sync_catalog(db, exercises: List[dict] = ESERCIZI_DATABASE) -> dict:
+    started = time.perf_counter()
+    version = catalog_version(exercises)
+    marker = await db[META_COLLECTION].find_one({"_id": MARKER_ID})
+    if marker and marker.get("version") == version:
+        if await db.exercises.estimated_document_count() == len(exercises):
+            return {"version": version, "operazioni": 0, "aggiornato": False,
+                    "ms": round((time.perf_counter() - started) * 1000, 2)}
+    existing = await db.exercises.find({}).to_list(None)
+    ops = diff_operations(exercises, existing)
+    if ops:
+        try:
+            await db.exercises.bulk_write(ops, ordered=False)
+        except BulkWriteError as exc:
+            # Another worker upserted the same exercises first; its content is identical
+            if any(err.get("code") != DUPLICATE_KEY for err in exc.details.get("writeErrors", [])):
+                raise
+    await db[META_COLLECTION].update_one(
+        {"_id": MARKER_ID},
+        {"$set": {"version": version, "count": len(exercises), "synced_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+    summary = {"version": version, "operazioni": len(ops), "aggiornato": True,
+               "ms": round((time.perf_counter() - started) * 1000, 2)}
+    logger.info("Catalogo esercizi sincronizzato: %s", summary)
+    return summary
+
+
+if __name__ == "__main__":
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def _main():
+        client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+        print(await sync_catalog(client[os.environ.get("DB_NAME", "walt")]))
+
+    asyncio.run(_main())
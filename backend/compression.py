@@ -0,0 +1,168 @@
+"""Negotiated gzip/brotli compression of the JSON responses.
+
+CompressionMiddleware wraps the app next to CORSMiddleware. It picks the
+encoding from Accept-Encoding: br when the brotli module is installed and
+the client accepts it, otherwise gzip. A response is compressed only when
+all of these hold:
+- its body is at least ``min_size`` bytes;
+- its type is JSON or text;
+- it does not already have a Content-Encoding;
+- it arrives in a single message.
+Streamed responses pass through untouched.
+
+Bodies of ``offload_size`` bytes or more are compressed in a worker
+thread, so a large route or stats payload does not stall the event loop.
+A compressed response gets ``Vary: Accept-Encoding``. Its strong ETag
+becomes weak (``W/``), because the bytes on the wire are a different
+representation. If-None-Match uses the weak comparison, so the 304s of
+http_cache keep working. Bytes in and out and the compression time are
+counted in ``stats`` for /api/metrics.
+"""
+import asyncio
+import gzip
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is offered
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Accepted codings with their q-values; missing q is 1."""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+class Compressor:
+    def __init__(self, min_size: int = 1024, offload_size: int = 32 * 1024,
+                 gzip_level: int = 6, brotli_quality: int = 4):
+        self.min_size = min_size
+        self.offload_size = offload_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = ("br", "gzip") if brotli is not None else ("gzip",)
+        self._stats = {coding: {"responses": 0, "bytes_in": 0, "bytes_out": 0, "total_ms": 0.0, "offloaded": 0}
+                       for coding in self.encodings}
+        self.skipped = 0
+
+    def choose(self, accept_encoding: str) -> Optional[str]:
+        """The preferred supported encoding the client accepts, None for identity."""
+        accepted = parse_accept_encoding(accept_encoding)
+        wildcard = accepted.get("*", 0.0)
+        best, best_q = None, 0.0
+        for coding in self.encodings:
+            q = accepted.get(coding, wildcard)
+            if q > best_q:
+                best, best_q = coding, q
+        return best
+
+    def compress(self, body: bytes, coding: str) -> bytes:
+        if coding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    async def encode(self, body: bytes, coding: str) -> bytes:
+        t0 = time.perf_counter()
+        offload = len(body) >= self.offload_size
+        if offload:
+            out = await asyncio.to_thread(self.compress, body, coding)
+        else:
+            out = self.compress(body, coding)
+        stats = self._stats[coding]
+        stats["responses"] += 1
+        stats["bytes_in"] += len(body)
+        stats["bytes_out"] += len(out)
+        stats["total_ms"] += (time.perf_counter() - t0) * 1000
+        stats["offloaded"] += offload
+        return out
+
+    def stats(self) -> dict:
+        return {"min_size": self.min_size, "offload_size": self.offload_size, "skipped": self.skipped, "encodings": {
+            coding: {**{k: v for k, v in s.items() if k != "total_ms"},
+                     "ratio": round(s["bytes_out"] / s["bytes_in"], 3) if s["bytes_in"] else 0.0,
+                     "avg_ms": round(s["total_ms"] / s["responses"], 3) if s["responses"] else 0.0}
+            for coding, s in self._stats.items()
+        }}
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+class CompressionMiddleware:
+    def __init__(self, app, compressor: Compressor):
+        self.app = app
+        self.compressor = compressor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = _header(scope.get("headers", []), b"accept-encoding")
+        coding = self.compressor.choose(accept.decode("latin-1")) if accept else None
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                # Held back until the body shows whether it gets compressed
+                start = message
+                return
+            if start is None:
+                await send(message)
+                return
+            held, start = start, None
+            body = message.get("body", b"")
+            headers = list(held.get("headers", []))
+            content_type = (_header(headers, b"content-type") or b"").decode("latin-1")
+            if (message.get("more_body") or len(body) < self.compressor.min_size
+                    or _header(headers, b"content-encoding") is not None
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)):
+                if len(body) >= self.compressor.min_size:
+                    self.compressor.skipped += 1
+                await send(held)
+                await send(message)
+                return
+            compressed = await self.compressor.encode(body, coding)
+            kept = []
+            for key, value in headers:
+                name = key.lower()
+                if name == b"content-length":
+                    continue
+                if name == b"etag" and value.startswith(b'"'):
+                    value = b"W/" + value
+                if name == b"vary":
+                    continue
+                kept.append((key, value))
+            vary = _header(headers, b"vary")
+            kept.append((b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"))
+            kept.append((b"content-encoding", coding.encode()))
+            kept.append((b"content-length", str(len(compressed)).encode()))
+            await send({**held, "headers": kept})
+            await send({**message, "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,97 @@
+"""Immutable in-memory index over ESERCIZI_DATABASE.
+
+The catalog is static, so it is loaded once at import time into frozen
+lookup tables (by id, categoria, gruppo_muscolare and attrezzi) and the
+JSON bodies of the catalog endpoints are serialized up front together
+with their ETags.
+"""
+import copy
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from exercises_database import ESERCIZI_DATABASE, ELASTICI_KG_MAPPING, CATEGORIE
+from http_cache import CachedBody, cached_body
+
+MAX_ALTERNATIVE = 5
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, Mapping):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+def _group(exercises: Iterable[Mapping], field: str) -> Mapping[str, Tuple[Mapping, ...]]:
+    groups: Dict[str, list] = {}
+    for ex in exercises:
+        value = ex.get(field)
+        keys = value if isinstance(value, tuple) else (value,)
+        for key in keys:
+            if key is not None:
+                groups.setdefault(key, []).append(ex)
+    return MappingProxyType({k: tuple(v) for k, v in groups.items()})
+
+
+class ExerciseCatalog:
+    def __init__(self, exercises: List[dict]):
+        self.exercises: Tuple[Mapping, ...] = tuple(_freeze(copy.deepcopy(ex)) for ex in exercises)
+        self.by_id = MappingProxyType({ex["exercise_id"]: ex for ex in self.exercises})
+        self.by_categoria = _group(self.exercises, "categoria")
+        self.by_gruppo_muscolare = _group(self.exercises, "gruppo_muscolare")
+        self.by_attrezzo = _group(self.exercises, "attrezzi")
+
+        self.all_body = cached_body(self.as_list())
+        self.empty_body = cached_body([])
+        self.categories_body = cached_body({"categorie": CATEGORIE})
+        self.elastici_body = cached_body(ELASTICI_KG_MAPPING)
+        self._category_bodies = {cat: cached_body(_thaw(exs)) for cat, exs in self.by_categoria.items()}
+        self._detail_bodies = {eid: cached_body(_thaw(ex)) for eid, ex in self.by_id.items()}
+        self._alternatives_bodies = {
+            eid: cached_body({"esercizio_originale": _thaw(ex), "alternative": _thaw(self._alternatives(ex))})
+            for eid, ex in self.by_id.items()
+        }
+
+    def _alternatives(self, ex: Mapping) -> Tuple[Mapping, ...]:
+        same_category = self.by_categoria.get(ex.get("categoria"), ())
+        return tuple(a for a in same_category if a["exercise_id"] != ex["exercise_id"])[:MAX_ALTERNATIVE]
+
+    def as_list(self) -> List[dict]:
+        """Mutable deep copy of the whole catalog, in database order."""
+        return _thaw(self.exercises)
+
+    def get(self, exercise_id: str) -> Optional[dict]:
+        ex = self.by_id.get(exercise_id)
+        return _thaw(ex) if ex is not None else None
+
+    def by_category(self, categoria: str) -> List[dict]:
+        return _thaw(self.by_categoria.get(categoria, ()))
+
+    def by_muscle_group(self, gruppo: str) -> List[dict]:
+        return _thaw(self.by_gruppo_muscolare.get(gruppo, ()))
+
+    def by_equipment(self, attrezzo: str) -> List[dict]:
+        return _thaw(self.by_attrezzo.get(attrezzo, ()))
+
+    def list_body(self, categoria: Optional[str] = None) -> CachedBody:
+        if not categoria:
+            return self.all_body
+        return self._category_bodies.get(categoria, self.empty_body)
+
+    def detail_body(self, exercise_id: str) -> Optional[CachedBody]:
+        return self._detail_bodies.get(exercise_id)
+
+    def alternatives_body(self, exercise_id: str) -> Optional[CachedBody]:
+        return self._alternatives_bodies.get(exercise_id)
+
+
+CATALOG = ExerciseCatalog(ESERCIZI_DATABASE)
@@ -503,12 +503,13 @@ ELASTICI_KG_MAPPING = {
 
 # Funzione helper per ottenere esercizi per categoria
 def get_exercises_by_category(categoria: str) -> list:
-    return [ex for ex in ESERCIZI_DATABASE if ex.get("categoria") == categoria]
+    from exercise_catalog import CATALOG
+    return CATALOG.by_category(categoria)
 
 # Funzione helper per ottenere esercizi per gruppo muscolare
 def get_exercises_by_muscle_group(gruppo: str) -> list:
-    return [ex for ex in ESERCIZI_DATABASE 
-            if gruppo in ex.get("gruppo_muscolare", [])]
+    from exercise_catalog import CATALOG
+    return CATALOG.by_muscle_group(gruppo)
 
 # Categorie disponibili
 CATEGORIE = ["Gambe", "Core", "Braccia", "Spalle", "Petto", "Schiena", "Cardio"]
@@ -0,0 +1,43 @@
+"""Helpers for serving pre-serialized JSON bodies with strong ETags."""
+import hashlib
+from typing import NamedTuple, Optional, Tuple
+
+import orjson
+from fastapi import Request, Response
+
+
+class CachedBody(NamedTuple):
+    content: bytes
+    etag: str
+    headers: Tuple[Tuple[str, str], ...] = ()  # extra response headers served with the body
+
+
+def dump_json(content) -> bytes:
+    # Same encoder as the app's default ORJSONResponse, so cached bodies are byte-identical
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def make_etag(content: bytes) -> str:
+    return '"' + hashlib.sha256(content).hexdigest()[:32] + '"'
+
+
+def cached_body(content, headers: Tuple[Tuple[str, str], ...] = ()) -> CachedBody:
+    body = dump_json(content)
+    return CachedBody(body, make_etag(body), headers)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so W/"x" matches "x"
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return any(c == etag or c == "W/" + etag for c in candidates)
+
+
+def cached_json_response(request: Request, body: CachedBody) -> Response:
+    headers = {**dict(body.headers), "ETag": body.etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), body.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body.content, media_type="application/json", headers=headers)
@@ -0,0 +1,183 @@
+"""Index bootstrap and query-plan verification for the Walt collections.
+
+``ensure_indexes`` runs at app startup and creates every index the API's
+hot queries rely on. ``verify_query_plans`` explains each endpoint query
+and reports the ones that fall back to a collection scan or an in-memory
+sort; run it against a local mongod with ``python indexes.py --verify``.
+"""
+import argparse
+import asyncio
+import logging
+import os
+from typing import List
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    "users": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "user_sessions": [
+        IndexModel([("session_token", ASCENDING)], name="session_token_unique", unique=True),
+        # Mongo's TTL monitor removes a session as soon as expires_at is in the past
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "walks": [
+        IndexModel([("walk_id", ASCENDING)], name="walk_id_unique", unique=True),
+        # The id breaks ties between equal timestamps for keyset pagination
+        IndexModel([("user_id", ASCENDING), ("data", DESCENDING), ("walk_id", DESCENDING)], name="user_id_data_id"),
+    ],
+    "circuits": [
+        IndexModel([("circuit_id", ASCENDING)], name="circuit_id_unique", unique=True),
+        # The id breaks ties between equal timestamps for keyset pagination
+        IndexModel([("user_id", ASCENDING), ("data", DESCENDING), ("circuit_id", DESCENDING)], name="user_id_data_id"),
+    ],
+    "plans": [
+        IndexModel([("plan_id", ASCENDING)], name="plan_id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("plan_id", DESCENDING)], name="user_id_created_at_id"),
+    ],
+    "sfide": [
+        IndexModel([("sfida_id", ASCENDING)], name="sfida_id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("sfida_id", DESCENDING)], name="user_id_created_at_id"),
+        IndexModel([("user_id", ASCENDING), ("completata", ASCENDING)], name="user_id_completata"),
+        IndexModel([("completata", ASCENDING), ("scadenza", ASCENDING)], name="completata_scadenza"),
+    ],
+    "walk_routes": [
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+    ],
+    "walk_points": [
+        # Deduplicates retried batches and serves the seq-ordered read at finish
+        IndexModel([("walk_id", ASCENDING), ("seq", ASCENDING)], name="walk_id_seq_unique", unique=True),
+    ],
+    "active_walks": [
+        IndexModel([("aggiornata_at", ASCENDING)], name="aggiornata_at"),
+    ],
+    "daily_rollups": [
+        IndexModel([("user_id", ASCENDING), ("giorno", ASCENDING)], name="user_id_giorno"),
+    ],
+    "exercises": [
+        IndexModel([("exercise_id", ASCENDING)], name="exercise_id_unique", unique=True),
+    ],
+}
+
+# Names of indexes an earlier INDEXES created and a wider one replaced; left in place they
+# would only slow down writes
+SUPERSEDED = {
+    "walks": ["user_id_data"],
+    "circuits": ["user_id_data"],
+    "plans": ["user_id_created_at"],
+    "sfide": ["user_id_created_at"],
+}
+
+# (name, collection, filter, sort) for every query an endpoint issues
+ENDPOINT_QUERIES = [
+    ("auth session", "user_sessions", {"session_token": "tok"}, None),
+    ("auth user", "users", {"user_id": "user_x"}, None),
+    ("login by email", "users", {"email": "walt@example.com"}, None),
+    ("GET /api/walks", "walks", {"user_id": "user_x"}, [("data", DESCENDING), ("walk_id", DESCENDING)]),
+    ("POST /api/walks/{id}/points", "active_walks", {"_id": "walk_x", "user_id": "user_x"}, None),
+    ("POST /api/walks/{id}/finish", "walk_points", {"walk_id": "walk_x"}, [("seq", ASCENDING)]),
+    ("route_analytics recompute", "walk_routes", {"user_id": "user_x"}, None),
+    ("GET /api/circuits", "circuits", {"user_id": "user_x"}, [("data", DESCENDING), ("circuit_id", DESCENDING)]),
+    ("GET /api/plans", "plans", {"user_id": "user_x"}, [("created_at", DESCENDING), ("plan_id", DESCENDING)]),
+    ("PUT /api/plans/{id}/exercise", "plans", {"plan_id": "plan_x", "user_id": "user_x"}, None),
+    ("PUT /api/plans/{id}/exercises", "plans", {"plan_id": "plan_x", "user_id": "user_x", "giorni.0.attivita.0": {"$exists": True}}, None),
+    ("plan batch users", "users", {"user_id": {"$in": ["user_x", "user_y"]}}, None),
+    ("plan batch deactivate", "plans", {"user_id": {"$in": ["user_x", "user_y"]}, "attivo": True}, None),
+    ("GET /api/stats walks", "walks", {"user_id": "user_x"}, [("data", DESCENDING)]),
+    ("GET /api/stats circuits", "circuits", {"user_id": "user_x"}, [("data", DESCENDING)]),
+    ("GET /api/stats rollups", "daily_rollups", {"user_id": "user_x"}, [("giorno", DESCENDING)]),
+    ("GET /api/sfide", "sfide", {"user_id": "user_x"}, [("created_at", DESCENDING), ("sfida_id", DESCENDING)]),
+    ("check-progress sfide", "sfide", {"user_id": "user_x", "completata": False}, None),
+    ("check-progress walks", "walks", {"user_id": "user_x", "data": {"$gte": "2026-01-01"}}, [("data", DESCENDING)]),
+    ("check-progress circuits", "circuits", {"user_id": "user_x", "data": {"$gte": "2026-01-01"}}, [("data", DESCENDING)]),
+    ("sfida update", "sfide", {"sfida_id": "sfida_x"}, None),
+    ("progress engine sfide", "sfide", {"user_id": "user_x", "completata": False, "target_field": "km"}, None),
+    ("progress engine calendar", "daily_rollups", {"user_id": "user_x", "giorno": {"$gte": "2026-01-01"}}, None),
+    ("scheduler sessioni_scadute", "user_sessions", {"expires_at": {"$type": "string", "$lt": "2026-01-01"}}, None),
+    ("scheduler sfide_scadute", "sfide", {"completata": False, "scadenza": {"$lt": "2026-01-01"}}, None),
+    ("scheduler camminate_abbandonate", "active_walks", {"aggiornata_at": {"$lt": "2026-01-01"}}, None),
+    ("scheduler rollup_recenti walks", "walks", {"_id": {"$gt": ObjectId("000000000000000000000000")}}, [("_id", ASCENDING)]),
+    ("scheduler rollup_recenti circuits", "circuits", {"_id": {"$gt": ObjectId("000000000000000000000000")}}, [("_id", ASCENDING)]),
+    ("rollup rebuild catch-up", "walks", {"user_id": "user_x", "_id": {"$gte": ObjectId("000000000000000000000000")}}, None),
+    ("GET /api/exercises/{id}", "exercises", {"exercise_id": "ex_squat_sedia"}, None),
+]
+
+
+async def ensure_indexes(db) -> None:
+    for collection, models in INDEXES.items():
+        try:
+            await db[collection].create_indexes(models)
+        except OperationFailure as exc:
+            # Duplicate legacy data or a conflicting hand-made index must not stop the API
+            logger.error("Impossibile creare gli indici su %s: %s", collection, exc)
+            continue
+        await drop_superseded(db, collection)
+
+
+async def drop_superseded(db, collection: str) -> None:
+    """Drop the SUPERSEDED indexes of ``collection``, once their replacements exist."""
+    names = SUPERSEDED.get(collection, [])
+    if not names:
+        return
+    existing = await db[collection].index_information()
+    for name in names:
+        if name in existing:
+            try:
+                await db[collection].drop_index(name)
+            except OperationFailure as exc:
+                logger.error("Impossibile eliminare l'indice %s su %s: %s", name, collection, exc)
+
+
+def _plan_stages(node) -> List[str]:
+    stages = []
+    if isinstance(node, dict):
+        if "stage" in node:
+            stages.append(node["stage"])
+        for value in node.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(node, list):
+        for item in node:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+async def verify_query_plans(db) -> List[str]:
+    """Return a description of every endpoint query whose winning plan scans or sorts in memory."""
+    problems = []
+    for name, collection, query, sort in ENDPOINT_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        planner = explain.get("queryPlanner", {})
+        stages = _plan_stages(planner.get("winningPlan", {}))
+        bad = sorted({s for s in stages if s in ("COLLSCAN", "SORT")})
+        if bad:
+            problems.append(f"{name} ({collection}): {', '.join(bad)}")
+    return problems
+
+
+async def _main(verify: bool) -> int:
+    from motor.motor_asyncio import AsyncIOMotorClient
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[os.environ.get("DB_NAME", "walt")]
+    await ensure_indexes(db)
+    if not verify:
+        return 0
+    problems = await verify_query_plans(db)
+    for problem in problems:
+        print(f"FAIL {problem}")
+    print(f"{len(ENDPOINT_QUERIES) - len(problems)}/{len(ENDPOINT_QUERIES)} query usano un indice")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crea gli indici MongoDB e verifica i piani di esecuzione")
+    parser.add_argument("--verify", action="store_true", help="esegui explain() su ogni query degli endpoint")
+    raise SystemExit(asyncio.run(_main(parser.parse_args().verify)))
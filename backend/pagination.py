@@ -0,0 +1,86 @@
+"""Keyset pagination and sparse fieldsets for the per-user list endpoints.
+
+Pages are ordered by (sort field, id) descending and the cursor is an
+opaque token holding the last item's pair, so the next page is an index
+range seek that costs the same at any depth, unlike skip/limit. ``fields=``
+turns the response into an inclusion projection; the sort field and the id
+are always returned so the client can tell items apart.
+"""
+import base64
+import json
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+MAX_LIMIT = 500
+_FIELD = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$")
+
+
+class ListSpec(NamedTuple):
+    collection: str
+    sort_field: str
+    id_field: str
+    default_limit: int
+    exclude: Tuple[str, ...] = ()  # left out unless fields= asks for them
+    stages: Tuple[dict, ...] = ()  # run on the page before the projection
+
+
+def encode_cursor(sort_value, id_value) -> str:
+    raw = json.dumps([sort_value, id_value], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Inverse of encode_cursor; raises ValueError on anything it did not produce."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, id_value = json.loads(raw)
+    except Exception as exc:
+        raise ValueError(cursor) from exc
+    if not isinstance(sort_value, str) or not isinstance(id_value, str):
+        raise ValueError(cursor)
+    return sort_value, id_value
+
+
+def parse_fields(value: Optional[str], spec: ListSpec) -> Optional[List[str]]:
+    """Field paths of ``fields=``, or None for full documents; raises ValueError on invalid paths."""
+    if not value:
+        return None
+    fields = {f.strip() for f in value.split(",") if f.strip()}
+    invalid = sorted(f for f in fields if not _FIELD.match(f) or f.split(".")[0] == "_id")
+    if invalid:
+        raise ValueError(", ".join(invalid))
+    fields |= {spec.sort_field, spec.id_field}
+    # Mongo rejects a path next to one of its parents ("path collision")
+    return sorted(f for f in fields if not any(f.startswith(other + ".") for other in fields))
+
+
+def page_pipeline(spec: ListSpec, user_id: str, cursor: Optional[str], limit: int,
+                  fields: Optional[List[str]]) -> list:
+    """Aggregation for one page; it fetches ``limit + 1`` items to know whether another page exists."""
+    match = {"user_id": user_id}
+    if cursor:
+        sort_value, id_value = decode_cursor(cursor)
+        match["$or"] = [
+            {spec.sort_field: {"$lt": sort_value}},
+            {spec.sort_field: sort_value, spec.id_field: {"$lt": id_value}},
+        ]
+    if fields is None:
+        projection = {"_id": 0, **{f: 0 for f in spec.exclude}}
+    else:
+        projection = {"_id": 0, **{f: 1 for f in fields}}
+    return [
+        {"$match": match},
+        {"$sort": {spec.sort_field: -1, spec.id_field: -1}},
+        {"$limit": limit + 1},
+        *spec.stages,
+        {"$project": projection},
+    ]
+
+
+def split_page(spec: ListSpec, docs: List[dict], limit: int) -> Tuple[List[dict], Optional[str]]:
+    """(items, next cursor) of the ``limit + 1`` documents page_pipeline returned."""
+    if len(docs) <= limit:
+        return docs, None
+    items = docs[:limit]
+    last = items[-1]
+    return items, encode_cursor(last.get(spec.sort_field, ""), last.get(spec.id_field, ""))
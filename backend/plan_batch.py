@@ -0,0 +1,147 @@
+"""Batch generation of automatic plans for many users at once.
+
+Onboarding a whole care home or a coach's group goes through
+POST /api/admin/plans/generate-batch or ``python plan_batch.py generate``
+instead of one authenticated /api/plans/generate call per user. Users are
+read in chunks of CHUNK_SIZE with ``$in``. Every chunk's plans are built
+by plan_generator in a process pool, so the chunks run in parallel and the
+event loop stays responsive. The API shares one bounded WorkerPool, started
+on first use and shut down by the FastAPI lifespan; the CLI opens its own
+ProcessPoolExecutor of ``--workers`` processes. Every chunk is written with
+one ordered bulk_write, which deactivates the old plans of the chunk's
+users and inserts the new ones. The report includes the throughput in
+plans per second.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import InsertOne, UpdateMany
+
+import plan_generator
+
+CHUNK_SIZE = 1000
+MAX_MISSING_REPORTED = 100
+USER_PROJECTION = {"_id": 0, "user_id": 1, "livello": 1, "giorni_disponibili": 1, "eta": 1}
+
+
+def _chunks(items: list, size: int) -> List[list]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class WorkerPool:
+    """Process pool of the API, created on first use and shut down by the lifespan."""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that runs Motor's threads can copy their locks held
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def stop(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def build_plans(users: List[dict], inputs: Dict[str, dict], now: datetime) -> List[dict]:
+    """Plan documents for ``users``; ``inputs`` maps user_id to energia/focus_muscolare/dolori_articolari."""
+    plans = []
+    for user in users:
+        options = inputs.get(user["user_id"]) or {}
+        plan_inputs = plan_generator.user_inputs(
+            user, options.get("energia", 5), options.get("focus_muscolare"), options.get("dolori_articolari"))
+        plans.append(plan_generator.plan_document(user, plan_inputs, now))
+    return plans
+
+
+def plan_writes(plans: List[dict]) -> list:
+    """Deactivate the current plans of the users of ``plans``, then insert ``plans``; for an ordered bulk_write."""
+    ops = [UpdateMany({"user_id": {"$in": [p["user_id"] for p in plans]}, "attivo": True}, {"$set": {"attivo": False}})]
+    ops.extend(InsertOne(p) for p in plans)
+    return ops
+
+
+async def generate_batch(db, user_ids: List[str], inputs: Optional[Dict[str, dict]] = None,
+                         executor: Optional[Executor] = None, chunk_size: int = CHUNK_SIZE,
+                         now: Optional[datetime] = None,
+                         on_generated: Optional[Callable[..., Awaitable[None]]] = None) -> dict:
+    """Generate and store a new active plan for every user in ``user_ids``; returns the run report.
+
+    The chunks are built on ``executor``, a process pool. ``on_generated`` is awaited with the user_ids of every chunk once their new plans are stored.
+    """
+    t0 = time.perf_counter()
+    now = now or datetime.now(timezone.utc)
+    inputs = inputs or {}
+    ids = list(dict.fromkeys(user_ids))
+    users = {}
+    for chunk in _chunks(ids, chunk_size):
+        async for user in db.users.find({"user_id": {"$in": chunk}}, USER_PROJECTION):
+            users[user["user_id"]] = user
+    found = [users[uid] for uid in ids if uid in users]
+    missing = [uid for uid in ids if uid not in users]
+
+    loop = asyncio.get_running_loop()
+    jobs = [
+        loop.run_in_executor(executor, build_plans, chunk, {u["user_id"]: inputs.get(u["user_id"]) for u in chunk}, now)
+        for chunk in _chunks(found, chunk_size)
+    ]
+    generated = 0
+    for job in asyncio.as_completed(jobs):
+        plans = await job
+        await db.plans.bulk_write(plan_writes(plans), ordered=True)
+        generated += len(plans)
+        if on_generated is not None:
+            await on_generated(*[plan["user_id"] for plan in plans])
+
+    elapsed = time.perf_counter() - t0
+    return {
+        "richiesti": len(ids), "generati": generated, "non_trovati": len(missing),
+        "utenti_non_trovati": missing[:MAX_MISSING_REPORTED],
+        "secondi": round(elapsed, 3), "piani_al_secondo": round(generated / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def read_user_ids(path: str) -> List[str]:
+    """One user_id per line; ``-`` reads stdin."""
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    with stream:
+        return [line.strip() for line in stream if line.strip()]
+
+
+async def _main(args) -> None:
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[os.environ.get("DB_NAME", "walt")]
+    user_ids = read_user_ids(args.file) if args.file else await db.users.distinct("user_id")
+    inputs = {}
+    if args.inputs:
+        with open(args.inputs, encoding="utf-8") as f:
+            inputs = json.load(f)
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        report = await generate_batch(db, user_ids, inputs, pool, args.chunk_size)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generazione dei piani per gruppi di utenti")
+    sub = parser.add_subparsers(dest="command", required=True)
+    gen = sub.add_parser("generate", help="genera un nuovo piano attivo per ogni utente")
+    gen.add_argument("--file", help="file con un user_id per riga (- per stdin); senza, tutti gli utenti")
+    gen.add_argument("--inputs", help="JSON {user_id: {energia, focus_muscolare, dolori_articolari}}")
+    gen.add_argument("--workers", type=int, default=os.cpu_count(), help="processi di generazione")
+    gen.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,52 @@
+"""Positional edits of the exercises of a plan.
+
+An edit names an exercise by (giorno_index, exercise_index) and sets some
+of its fields. Edits become ``$set`` operations on
+``giorni.{i}.attivita.{j}.{field}`` paths. The filter requires every
+edited exercise to exist, so one find_one_and_update applies a whole batch
+atomically and returns the updated plan. Concurrent edits of different
+fields or exercises no longer overwrite each other, as they did when the
+whole ``giorni`` array was rewritten.
+"""
+from typing import Iterable, Optional, Tuple
+
+EDITABLE_FIELDS = ("serie", "ripetizioni", "peso_kg", "nome", "note")
+MAX_EDITS = 200  # edits in one batch
+
+
+def exercise_path(giorno_index: int, exercise_index: int) -> str:
+    return f"giorni.{giorno_index}.attivita.{exercise_index}"
+
+
+def edit_operations(edits: Iterable[dict]) -> Tuple[dict, dict]:
+    """(filter conditions, ``$set`` fields) for ``edits``; a later edit of the same field wins."""
+    conditions = {}
+    fields = {}
+    for edit in edits:
+        path = exercise_path(edit["giorno_index"], edit["exercise_index"])
+        conditions[path] = {"$exists": True}
+        for field in EDITABLE_FIELDS:
+            if edit.get(field) is not None:
+                fields[f"{path}.{field}"] = edit[field]
+    return conditions, fields
+
+
+def negative_index(edits: Iterable[dict]) -> Optional[str]:
+    """Which index of ``edits`` is negative, so no path can name it: "giorno", "esercizio" or None."""
+    for edit in edits:
+        if edit["giorno_index"] < 0:
+            return "giorno"
+        if edit["exercise_index"] < 0:
+            return "esercizio"
+    return None
+
+
+def invalid_index(plan: dict, edits: Iterable[dict]) -> Optional[str]:
+    """Which index of ``edits`` does not exist in ``plan``: "giorno", "esercizio" or None."""
+    giorni = plan.get("giorni", [])
+    for edit in edits:
+        if not 0 <= edit["giorno_index"] < len(giorni):
+            return "giorno"
+        if not 0 <= edit["exercise_index"] < len(giorni[edit["giorno_index"]].get("attivita", [])):
+            return "esercizio"
+    return None
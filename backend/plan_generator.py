@@ -0,0 +1,152 @@
+"""Pure, memoized generation of the automatic workout plans.
+
+The plan depends only on the catalog and on (livello, giorni, energia,
+focus, dolori). Those inputs are first normalized to what actually changes
+the outcome:
+- energia becomes its adjustment, -1, 0 or +1;
+- focus and dolori become frozensets, so their order does not matter;
+- unknown pains are dropped.
+The giorni are then built once per normalized input and kept in a bounded
+LRU cache. The exercises to avoid are precomputed for every combination of
+pains, and the candidates of a training day are taken from the catalog's
+category index instead of filtering the whole catalog for every day.
+"""
+import uuid
+from datetime import datetime
+from functools import lru_cache
+from itertools import combinations
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Sequence, Tuple
+
+from exercise_catalog import CATALOG, ExerciseCatalog
+
+PLAN_CACHE_SIZE = 4096
+DEFAULT_GIORNI = ("Lunedì", "Mercoledì", "Venerdì")
+DEFAULT_ETA = 72
+CATEGORIE_ROTAZIONE = ("Gambe", "Core", "Braccia", "Spalle", "Petto", "Schiena")
+
+# Exercises to avoid for each joint pain
+AVOID_BY_DOLORE: Dict[str, FrozenSet[str]] = {
+    "ginocchia": frozenset({"ex_squat_sedia", "ex_affondi_supporto", "ex_step_up"}),
+    "spalle": frozenset({"ex_shoulder_press", "ex_alzate_laterali", "ex_alzate_frontali"}),
+    "schiena": frozenset({"ex_rematore_manubri", "ex_superman"}),
+}
+AVOID_BY_DOLORI: Dict[FrozenSet[str], FrozenSet[str]] = {
+    frozenset(combo): frozenset().union(*(AVOID_BY_DOLORE[d] for d in combo))
+    for n in range(len(AVOID_BY_DOLORE) + 1)
+    for combo in combinations(AVOID_BY_DOLORE, n)
+}
+
+
+class PlanInputs(NamedTuple):
+    livello: str
+    giorni: Tuple[str, ...]
+    serie_mod: int  # -1 low energy, +1 high energy
+    focus: Optional[FrozenSet[str]]
+    dolori: FrozenSet[str]
+
+
+def normalize(livello: str = "Principiante", giorni: Sequence[str] = DEFAULT_GIORNI, energia: int = 5,
+              focus: Optional[Sequence[str]] = None, dolori: Optional[Sequence[str]] = None) -> PlanInputs:
+    return PlanInputs(
+        livello=livello,
+        giorni=tuple(giorni or ()),
+        serie_mod=-1 if energia < 4 else (1 if energia > 7 else 0),
+        focus=frozenset(focus) if focus else None,
+        dolori=frozenset(d for d in dolori or () if d in AVOID_BY_DOLORE),
+    )
+
+
+def _categories_for_day(i: int, focus: Optional[FrozenSet[str]]) -> FrozenSet[str]:
+    if focus:
+        return focus
+    # Default rotation through categories
+    cat_oggi = CATEGORIE_ROTAZIONE[(i // 2) % len(CATEGORIE_ROTAZIONE)]
+    cat_secondaria = CATEGORIE_ROTAZIONE[((i // 2) + 1) % len(CATEGORIE_ROTAZIONE)]
+    return frozenset({cat_oggi, cat_secondaria, "Cardio"})
+
+
+@lru_cache(maxsize=256)
+def _candidates(catalog: ExerciseCatalog, categorie: FrozenSet[str], avoid: FrozenSet[str]) -> Tuple[str, ...]:
+    """Ids of the exercises in ``categorie`` minus ``avoid``, in catalog order."""
+    ids = {ex["exercise_id"] for cat in categorie for ex in catalog.by_categoria.get(cat, ())}
+    return tuple(ex["exercise_id"] for ex in catalog.exercises
+                 if ex["exercise_id"] in ids and ex["exercise_id"] not in avoid)
+
+
+def _circuit_activity(ex: dict, serie_finale: int) -> dict:
+    return {
+        "exercise_id": ex["exercise_id"],
+        "nome": ex["nome"],
+        "categoria": ex.get("categoria", ""),
+        "serie": min(serie_finale, ex.get("serie_default", 3)),
+        "ripetizioni": ex.get("ripetizioni_default", 12),
+        "peso_kg": ex.get("peso_default", 0),
+        "descrizione": ex.get("descrizione_tecnica", ""),
+        "note": ex.get("note_sicurezza", ""),
+        "varianti": ex.get("varianti", {}),
+    }
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _cached_giorni(inputs: PlanInputs, catalog: ExerciseCatalog) -> Tuple[dict, ...]:
+    principiante = inputs.livello == "Principiante"
+    avoid = AVOID_BY_DOLORI[inputs.dolori]
+    giorni = []
+    for i, giorno in enumerate(inputs.giorni):
+        if i % 2 == 0:
+            # Walking day
+            dur = 30 + 5 * inputs.serie_mod + (0 if principiante else 10)
+            dist = round(dur * 0.08, 1)  # ~5 km/h average
+            giorni.append({
+                "giorno": giorno, "tipo": "camminata",
+                "attivita": [{"nome": "Camminata", "durata_minuti": dur, "distanza_km": dist, "note": "Passo moderato"}],
+            })
+        else:
+            # Circuit day: the first exercises of the day's categories, as many as the level allows
+            num_esercizi = 4 if principiante else 6
+            serie_finale = max(1, (2 if principiante else 3) + inputs.serie_mod)
+            selected = _candidates(catalog, _categories_for_day(i, inputs.focus), avoid)[:num_esercizi]
+            giorni.append({
+                "giorno": giorno, "tipo": "circuito",
+                "attivita": [_circuit_activity(catalog.get(eid), serie_finale) for eid in selected],
+            })
+    return tuple(giorni)
+
+
+def _copy(value):
+    # Plans hold only dicts, lists and scalars; several times faster than copy.deepcopy
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_copy(v) for v in value]
+    return value
+
+
+def plan_giorni(inputs: PlanInputs, catalog: ExerciseCatalog = CATALOG) -> List[dict]:
+    """The giorni of the plan for ``inputs``; the caller owns the returned copy."""
+    return _copy(_cached_giorni(inputs, catalog))
+
+
+def user_inputs(user: dict, energia: int = 5, focus: Optional[Sequence[str]] = None,
+                dolori: Optional[Sequence[str]] = None) -> PlanInputs:
+    return normalize(user.get("livello", "Principiante"), user.get("giorni_disponibili", DEFAULT_GIORNI),
+                     energia, focus, dolori)
+
+
+def plan_document(user: dict, inputs: PlanInputs, now: datetime, catalog: ExerciseCatalog = CATALOG) -> dict:
+    """A new active automatic plan for ``user``."""
+    return {
+        "plan_id": f"plan_{uuid.uuid4().hex[:12]}", "user_id": user["user_id"],
+        "nome": f"Piano Auto - Fascia {user.get('eta', DEFAULT_ETA)}", "tipo": "automatico",
+        "giorni": plan_giorni(inputs, catalog), "attivo": True,
+        "created_at": now.isoformat(),
+    }
+
+
+def cache_stats() -> dict:
+    info = _cached_giorni.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "size": info.currsize, "maxsize": info.maxsize, "hits": info.hits, "misses": info.misses,
+        "hit_rate": round(info.hits / lookups, 3) if lookups else 0.0,
+    }
@@ -0,0 +1,89 @@
+"""In-process engine applying activity events to the challenge progress.
+
+Write handlers ``publish`` an ActivityEvent after the walk or circuit is
+stored and return right away; a single worker task, started and stopped by
+the FastAPI lifespan, drains the queue and applies each event with
+sfide_progress.apply_activity, then awaits ``on_change(user_id)`` so the
+user's cached responses are invalidated. Applying an event is idempotent,
+so a challenge counts each activity once even when check-progress counted
+it before the event arrived. The queue is bounded: when it is
+full, or when the process stops with events still pending, events are
+dropped and counted; /api/sfide/check-progress recomputes the progress
+from scratch and repairs them.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+import sfide_progress
+from sfide_progress import ActivityEvent
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressEngine:
+    def __init__(self, maxsize: int = 10000, on_change: Optional[Callable[[str], Awaitable[None]]] = None):
+        self.maxsize = maxsize
+        self.on_change = on_change
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.applied = 0
+        self.dropped = 0
+        self.errors = 0
+        self.apply_ms = 0.0
+
+    def publish(self, event: ActivityEvent) -> None:
+        """Queue ``event``; never blocks the request that produced it."""
+        if self._queue is None:
+            self.dropped += 1
+            return
+        try:
+            self._queue.put_nowait(event)
+            self.published += 1
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def start(self, db) -> None:
+        self._queue = asyncio.Queue(self.maxsize)
+        self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Apply the pending events for up to ``timeout`` seconds, then stop the worker."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("progress engine: %d eventi non applicati", self._queue.qsize())
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self.dropped += self._queue.qsize()
+        self._queue = self._task = None
+
+    async def _run(self, db) -> None:
+        while True:
+            event = await self._queue.get()
+            try:
+                t0 = time.perf_counter()
+                changed = await sfide_progress.apply_activity(db, event)
+                self.apply_ms += (time.perf_counter() - t0) * 1000
+                self.applied += 1
+                if changed and self.on_change is not None:
+                    await self.on_change(event.user_id)
+            except Exception:
+                self.errors += 1
+                logger.exception("progress engine: evento di %s non applicato", event.user_id)
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0, "maxsize": self.maxsize,
+            "published": self.published, "applied": self.applied, "dropped": self.dropped, "errors": self.errors,
+            "avg_apply_ms": round(self.apply_ms / self.applied, 2) if self.applied else 0.0,
+        }
@@ -0,0 +1,467 @@
+"""Data access for the collections the API handlers read and write.
+
+There is one repository per collection: users, sessions, walks, circuits,
+plans, sfide and exercises. Each has two implementations:
+- ``mongo_repositories(db)``: Motor, used in production;
+- ``memory_repositories()``: plain Python dicts and lists, for profiling
+  and micro-benchmarks without a MongoDB.
+server.py picks one with STORAGE_BACKEND.
+
+The in-memory backend keeps the semantics the handlers rely on:
+- keyset pages ordered by (sort field, id) descending;
+- inclusion projections with dotted paths into arrays of documents, and
+  exclusion of top-level fields;
+- ``$gte`` windows on ``data``, newest first, with the same limits;
+- positional ``$set`` on ``giorni.{i}.attivita.{j}``, guarded by the
+  existence of the edited exercises;
+- reads return copies, so callers never alias the stored documents.
+Two things are left out. The ListSpec ``stages`` only patch legacy MongoDB
+documents, so they do not run in memory. Derived collections are not
+kept: day rollups, routes stored apart and streamed walks belong to the
+modules that own them, which work on Motor only.
+"""
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from pymongo import InsertOne, ReturnDocument, UpdateMany
+
+import pagination
+import rollups
+import sfide_progress
+import walk_routes
+from exercises_database import ESERCIZI_DATABASE
+
+
+def _copy(value):
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    return value
+
+
+def expires_in_ms(expires_at, now: datetime) -> Optional[float]:
+    """Milliseconds left before ``expires_at``, like $convert to date; None when it is no date."""
+    if isinstance(expires_at, str):
+        try:
+            expires_at = datetime.fromisoformat(expires_at)
+        except ValueError:
+            return None
+    if not isinstance(expires_at, datetime):
+        return None
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return (expires_at - now).total_seconds() * 1000
+
+
+# ===== MOTOR =====
+
+class MongoUsers:
+    def __init__(self, db):
+        self.collection = db.users
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"user_id": user_id}, {"_id": 0})
+
+    async def by_email(self, email: str) -> Optional[dict]:
+        return await self.collection.find_one({"email": email}, {"_id": 0})
+
+    async def insert(self, doc: dict) -> None:
+        await self.collection.insert_one(doc)
+        doc.pop("_id", None)
+
+    async def update(self, user_id: str, fields: dict) -> None:
+        await self.collection.update_one({"user_id": user_id}, {"$set": fields})
+
+    async def data_version(self, user_id: str) -> int:
+        doc = await self.collection.find_one({"user_id": user_id}, {"_id": 0, "data_version": 1})
+        return (doc or {}).get("data_version", 0)
+
+    async def bump_version(self, user_ids: List[str]) -> None:
+        """Record a write by ``user_ids``: their cached responses on every worker become stale."""
+        await self.collection.update_many({"user_id": {"$in": user_ids}}, {"$inc": {"data_version": 1}})
+
+
+class MongoSessions:
+    def __init__(self, db):
+        self.collection = db.user_sessions
+
+    async def resolve(self, session_token: str, now: datetime) -> Optional[dict]:
+        """Session and user in one round trip, with the time left before expiry computed server-side."""
+        docs = await self.collection.aggregate([
+            {"$match": {"session_token": session_token}},
+            {"$limit": 1},
+            {"$lookup": {"from": "users", "localField": "user_id", "foreignField": "user_id", "as": "user"}},
+            {"$project": {
+                "_id": 0, "expires_at": 1,
+                "expires_in_ms": {"$subtract": [
+                    {"$convert": {"input": "$expires_at", "to": "date", "onError": None, "onNull": None}}, now,
+                ]},
+                "user": {"$arrayElemAt": ["$user", 0]},
+            }},
+        ]).to_list(1)
+        return docs[0] if docs else None
+
+    async def insert(self, doc: dict) -> None:
+        await self.collection.insert_one(doc)
+        doc.pop("_id", None)
+
+    async def delete(self, session_token: str) -> None:
+        await self.collection.delete_many({"session_token": session_token})
+
+
+class MongoListing:
+    """Keyset pages of a per-user collection."""
+
+    def __init__(self, db, name: str):
+        self.db = db
+        self.collection = db[name]
+
+    async def page(self, spec: pagination.ListSpec, user_id: str, cursor: Optional[str], limit: int,
+                   fields: Optional[List[str]]) -> List[dict]:
+        """Up to ``limit + 1`` documents after ``cursor``; raises ValueError on an invalid cursor."""
+        pipeline = pagination.page_pipeline(spec, user_id, cursor, limit, fields)
+        return await self.collection.aggregate(pipeline).to_list(limit + 1)
+
+
+class MongoActivity(MongoListing):
+    """Walks or circuits, with their day rollups kept current."""
+
+    async def insert(self, doc: dict) -> None:
+        await self.collection.insert_one(doc)
+        doc.pop("_id", None)
+        if self.collection.name == "walks":
+            await rollups.record_walk(self.db, doc)
+        else:
+            await rollups.record_circuit(self.db, doc)
+
+    async def newest(self, user_id: str, since: Optional[str], limit: int, exclude: Tuple[str, ...] = ()) -> List[dict]:
+        """The user's documents with ``data`` >= ``since`` (all when None), newest first."""
+        query = {"user_id": user_id}
+        if since is not None:
+            query["data"] = {"$gte": since}
+        projection = {"_id": 0, **{f: 0 for f in exclude}}
+        return await self.collection.find(query, projection).sort("data", -1).to_list(limit)
+
+
+class MongoWalks(MongoActivity):
+    def __init__(self, db):
+        super().__init__(db, "walks")
+
+    async def save_route(self, walk_id: str, user_id: str, points: List[dict]) -> None:
+        await walk_routes.save_route(self.db, walk_id, user_id, points)
+
+    async def route(self, walk_id: str, user_id: str) -> Optional[List[dict]]:
+        return await walk_routes.load_route(self.db, walk_id, user_id)
+
+
+class MongoCircuits(MongoActivity):
+    def __init__(self, db):
+        super().__init__(db, "circuits")
+
+
+class MongoPlans(MongoListing):
+    def __init__(self, db):
+        super().__init__(db, "plans")
+
+    async def get(self, plan_id: str, user_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"plan_id": plan_id, "user_id": user_id}, {"_id": 0})
+
+    async def insert_active(self, plan: dict) -> None:
+        """Deactivate the user's plans and insert ``plan``, in a single round trip."""
+        await self.collection.bulk_write([
+            UpdateMany({"user_id": plan["user_id"]}, {"$set": {"attivo": False}}),
+            InsertOne(plan),
+        ], ordered=True)
+        plan.pop("_id", None)
+
+    async def edit(self, plan_id: str, user_id: str, conditions: dict, fields: dict) -> Optional[dict]:
+        """Set ``fields`` if the plan matches ``conditions``; the updated plan, or None when it does not match."""
+        query = {"plan_id": plan_id, "user_id": user_id, **conditions}
+        if not fields:
+            return await self.collection.find_one(query, {"_id": 0})
+        return await self.collection.find_one_and_update(query, {"$set": fields}, projection={"_id": 0},
+                                                         return_document=ReturnDocument.AFTER)
+
+
+class MongoSfide(MongoListing):
+    def __init__(self, db):
+        super().__init__(db, "sfide")
+
+    async def insert_many(self, docs: List[dict]) -> None:
+        await self.collection.insert_many([dict(d) for d in docs])
+
+    async def check_progress(self, user_id: str, now: datetime) -> Tuple[List[dict], bool]:
+        return await sfide_progress.check_progress(self.db, user_id, now)
+
+
+class MongoExercises:
+    def __init__(self, db):
+        self.collection = db.exercises
+
+    async def all(self) -> List[dict]:
+        return await self.collection.find({}, {"_id": 0}).to_list(None)
+
+    async def get(self, exercise_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"exercise_id": exercise_id}, {"_id": 0})
+
+
+# ===== MEMORY =====
+
+def _include(src: dict, dst: dict, parts: List[str]) -> None:
+    key = parts[0]
+    if key not in src:
+        return
+    value = src[key]
+    if len(parts) == 1:
+        dst[key] = _copy(value)
+    elif isinstance(value, dict):
+        _include(value, dst.setdefault(key, {}), parts[1:])
+    elif isinstance(value, list):
+        # Like MongoDB, the path is projected inside every element that is a document
+        elements = [v for v in value if isinstance(v, dict)]
+        projected = dst.setdefault(key, [{} for _ in elements])
+        for element, out in zip(elements, projected):
+            _include(element, out, parts[1:])
+
+
+def project(doc: dict, include: Optional[List[str]] = None, exclude: Tuple[str, ...] = ()) -> dict:
+    """Copy of ``doc`` restricted to the ``include`` paths, or without the top-level ``exclude`` fields."""
+    if include is None:
+        return {k: _copy(v) for k, v in doc.items() if k != "_id" and k not in exclude}
+    out = {}
+    for path in include:
+        _include(doc, out, path.split("."))
+    return {k: out[k] for k in doc if k in out}
+
+
+def _walk_path(doc, parts: List[str]):
+    """(container, key) of the last part of a dotted path with numeric array indexes; None when missing."""
+    for part in parts[:-1]:
+        if isinstance(doc, list):
+            if not part.isdigit() or int(part) >= len(doc):
+                return None
+            doc = doc[int(part)]
+        elif isinstance(doc, dict) and part in doc:
+            doc = doc[part]
+        else:
+            return None
+    last = parts[-1]
+    if isinstance(doc, list):
+        return (doc, int(last)) if last.isdigit() and int(last) < len(doc) else None
+    return (doc, last) if isinstance(doc, dict) else None
+
+
+def path_exists(doc: dict, path: str) -> bool:
+    found = _walk_path(doc, path.split("."))
+    return found is not None and (isinstance(found[0], list) or found[1] in found[0])
+
+
+class MemoryStore:
+    """Documents of every collection, by collection name, in insertion order."""
+
+    def __init__(self):
+        self.collections: Dict[str, List[dict]] = {}
+
+    def __getitem__(self, name: str) -> List[dict]:
+        return self.collections.setdefault(name, [])
+
+
+class MemoryUsers:
+    def __init__(self, store: MemoryStore):
+        self.docs = store["users"]
+
+    def _find(self, key: str, value) -> Optional[dict]:
+        return next((d for d in self.docs if d.get(key) == value), None)
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        doc = self._find("user_id", user_id)
+        return project(doc) if doc else None
+
+    async def by_email(self, email: str) -> Optional[dict]:
+        doc = self._find("email", email)
+        return project(doc) if doc else None
+
+    async def insert(self, doc: dict) -> None:
+        self.docs.append(_copy(doc))
+
+    async def update(self, user_id: str, fields: dict) -> None:
+        doc = self._find("user_id", user_id)
+        if doc is not None:
+            doc.update(_copy(fields))
+
+    async def data_version(self, user_id: str) -> int:
+        return (self._find("user_id", user_id) or {}).get("data_version", 0)
+
+    async def bump_version(self, user_ids: List[str]) -> None:
+        for doc in self.docs:
+            if doc.get("user_id") in user_ids:
+                doc["data_version"] = doc.get("data_version", 0) + 1
+
+
+class MemorySessions:
+    def __init__(self, store: MemoryStore):
+        self.docs = store["user_sessions"]
+        self.users = store["users"]
+
+    async def resolve(self, session_token: str, now: datetime) -> Optional[dict]:
+        session = next((d for d in self.docs if d.get("session_token") == session_token), None)
+        if session is None:
+            return None
+        user = next((u for u in self.users if u.get("user_id") == session.get("user_id")), None)
+        resolved = {"expires_at": session.get("expires_at"), "expires_in_ms": expires_in_ms(session.get("expires_at"), now)}
+        if user is not None:
+            resolved["user"] = project(user)
+        return resolved
+
+    async def insert(self, doc: dict) -> None:
+        self.docs.append(_copy(doc))
+
+    async def delete(self, session_token: str) -> None:
+        self.docs[:] = [d for d in self.docs if d.get("session_token") != session_token]
+
+
+class MemoryListing:
+    def __init__(self, store: MemoryStore, name: str):
+        self.store = store
+        self.docs = store[name]
+
+    @staticmethod
+    def key(spec: pagination.ListSpec, doc: dict) -> Tuple[str, str]:
+        return doc.get(spec.sort_field) or "", doc.get(spec.id_field) or ""
+
+    def of(self, user_id: str) -> List[dict]:
+        return [d for d in self.docs if d.get("user_id") == user_id]
+
+    async def page(self, spec: pagination.ListSpec, user_id: str, cursor: Optional[str], limit: int,
+                   fields: Optional[List[str]]) -> List[dict]:
+        docs = self.of(user_id)
+        if cursor:
+            sort_value, id_value = pagination.decode_cursor(cursor)
+            docs = [d for d in docs if self.key(spec, d) < (sort_value, id_value)]
+        docs.sort(key=lambda d: self.key(spec, d), reverse=True)
+        return [project(d, fields, () if fields else spec.exclude) for d in docs[:limit + 1]]
+
+
+class MemoryActivity(MemoryListing):
+    async def insert(self, doc: dict) -> None:
+        self.docs.append(_copy(doc))
+
+    async def newest(self, user_id: str, since: Optional[str], limit: int, exclude: Tuple[str, ...] = ()) -> List[dict]:
+        docs = [d for d in self.of(user_id) if since is None or d.get("data", "") >= since]
+        docs.sort(key=lambda d: d.get("data", ""), reverse=True)
+        return [project(d, exclude=exclude) for d in docs[:limit]]
+
+
+class MemoryWalks(MemoryActivity):
+    def __init__(self, store: MemoryStore):
+        super().__init__(store, "walks")
+        self.routes: Dict[str, Tuple[str, List[dict]]] = {}  # walk_id -> (user_id, points)
+
+    async def save_route(self, walk_id: str, user_id: str, points: List[dict]) -> None:
+        self.routes[walk_id] = (user_id, _copy(points))
+
+    async def route(self, walk_id: str, user_id: str) -> Optional[List[dict]]:
+        owner, points = self.routes.get(walk_id, (None, None))
+        if owner == user_id:
+            return _copy(points)
+        walk = next((d for d in self.of(user_id) if d.get("walk_id") == walk_id), None)
+        return _copy(walk.get("percorso") or []) if walk is not None else None
+
+
+class MemoryCircuits(MemoryActivity):
+    def __init__(self, store: MemoryStore):
+        super().__init__(store, "circuits")
+
+
+class MemoryPlans(MemoryListing):
+    def __init__(self, store: MemoryStore):
+        super().__init__(store, "plans")
+
+    def _find(self, plan_id: str, user_id: str) -> Optional[dict]:
+        return next((d for d in self.of(user_id) if d.get("plan_id") == plan_id), None)
+
+    async def get(self, plan_id: str, user_id: str) -> Optional[dict]:
+        doc = self._find(plan_id, user_id)
+        return project(doc) if doc else None
+
+    async def insert_active(self, plan: dict) -> None:
+        for doc in self.of(plan["user_id"]):
+            doc["attivo"] = False
+        self.docs.append(_copy(plan))
+
+    async def edit(self, plan_id: str, user_id: str, conditions: dict, fields: dict) -> Optional[dict]:
+        doc = self._find(plan_id, user_id)
+        if doc is None or not all(path_exists(doc, path) for path in conditions):
+            return None
+        for path, value in fields.items():
+            container, key = _walk_path(doc, path.split("."))
+            container[key] = _copy(value)
+        return project(doc)
+
+
+class MemorySfide(MemoryListing):
+    def __init__(self, store: MemoryStore):
+        super().__init__(store, "sfide")
+
+    async def insert_many(self, docs: List[dict]) -> None:
+        self.docs.extend(_copy(d) for d in docs)
+
+    async def check_progress(self, user_id: str, now: datetime) -> Tuple[List[dict], bool]:
+        """Same recomputation as sfide_progress.check_progress, on the stored walks and circuits."""
+        stored = [d for d in self.of(user_id) if d.get("completata") is False][:sfide_progress.OPEN_LIMIT]
+        sfide = [project(d) for d in stored]
+        active = [s for s in sfide if not sfide_progress.is_expired(s, now)]
+        walks = circuits = []
+        if active:
+            since = min(sfide_progress.window_start(s, now) for s in active)
+            walks, circuits = (
+                sorted((d for d in self.store[name] if d.get("user_id") == user_id and d.get("data", "") >= since),
+                       key=lambda d: d.get("data", ""), reverse=True)[:sfide_progress.DOC_LIMIT]
+                for name in ("walks", "circuits"))
+        ops, updated = sfide_progress.evaluate(sfide, sfide_progress.progress_values(active, walks, circuits, now), now)
+        if ops:
+            # evaluate left the new state in the copies: expired ones unchanged, open ones with their progress
+            for doc, s in zip(stored, sfide):
+                if sfide_progress.is_expired(s, now):
+                    doc["scaduta"] = True
+                else:
+                    doc["current_value"], doc["completata"] = s["current_value"], s["completata"]
+        return updated, bool(ops)
+
+
+class MemoryExercises:
+    def __init__(self, store: MemoryStore):
+        self.docs = store["exercises"]
+        if not self.docs:
+            self.docs.extend(_copy(ex) for ex in ESERCIZI_DATABASE)
+
+    async def all(self) -> List[dict]:
+        return [project(d) for d in self.docs]
+
+    async def get(self, exercise_id: str) -> Optional[dict]:
+        doc = next((d for d in self.docs if d.get("exercise_id") == exercise_id), None)
+        return project(doc) if doc else None
+
+
+# ===== FACTORIES =====
+
+class Repositories(NamedTuple):
+    users: object
+    sessions: object
+    walks: object
+    circuits: object
+    plans: object
+    sfide: object
+    exercises: object
+
+
+def mongo_repositories(db) -> Repositories:
+    return Repositories(MongoUsers(db), MongoSessions(db), MongoWalks(db), MongoCircuits(db),
+                        MongoPlans(db), MongoSfide(db), MongoExercises(db))
+
+
+def memory_repositories(store: Optional[MemoryStore] = None) -> Repositories:
+    store = store or MemoryStore()
+    return Repositories(MemoryUsers(store), MemorySessions(store), MemoryWalks(store), MemoryCircuits(store),
+                        MemoryPlans(store), MemorySfide(store), MemoryExercises(store))
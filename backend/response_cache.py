@@ -0,0 +1,109 @@
+"""In-process cache of per-user read responses, keyed by a data version.
+
+The version is the ``data_version`` counter of the user document, which
+every write ``$inc``s, so it is shared by all the server processes. The
+caller reads it before loading the data and passes it to ``get`` and
+``put``. Serialized responses are cached under (user, endpoint, params,
+version). A write on any worker makes all of that user's entries
+unreachable at once, and a response built from data read before a write
+is stored under the old version, which no later read asks for. The
+newest version seen per user drops the older entries as soon as it shows
+up, and ``invalidate`` drops them right away after a local write.
+
+Memory is bounded by ``maxsize`` entries and ``max_bytes`` of bodies,
+evicting the least recently used entry first. Every entry also expires
+after ``ttl`` seconds, for the responses that depend on the clock (the
+stats windows).
+"""
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Set
+
+from http_cache import CachedBody
+
+
+class ResponseCache:
+    def __init__(self, maxsize: int = 5000, max_bytes: int = 64 * 1024 * 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # (user, key, version) -> (body, deadline)
+        self._keys_by_user: Dict[str, Set[tuple]] = {}
+        self._versions: Dict[str, int] = {}  # version of the cached entries, per user that has some
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop every cached response of ``user_id``, after a write by this process."""
+        for entry_key in self._keys_by_user.pop(user_id, set()):
+            self._pop(entry_key)
+        self._versions.pop(user_id, None)
+
+    def _observe(self, user_id: str, version: int) -> bool:
+        """Drop the entries older than ``version``; False when ``version`` is older than the cached ones."""
+        cached = self._versions.get(user_id)
+        if cached is not None and version < cached:
+            return False
+        if cached is not None and version > cached:
+            self.invalidate(user_id)
+        return True
+
+    def get(self, user_id: str, key: Hashable, version: int) -> Optional[CachedBody]:
+        self._observe(user_id, version)
+        entry_key = (user_id, key, version)
+        entry = self._entries.get(entry_key)
+        if entry is None:
+            self.misses += 1
+            return None
+        body, deadline = entry
+        if deadline <= time.monotonic():
+            self._drop(entry_key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(entry_key)
+        self.hits += 1
+        return body
+
+    def put(self, user_id: str, key: Hashable, version: int, body: CachedBody) -> None:
+        """Cache ``body``; ``version`` is the user's version read before the data was loaded."""
+        if self.maxsize <= 0 or not self._observe(user_id, version) or len(body.content) > self.max_bytes:
+            return
+        entry_key = (user_id, key, version)
+        if entry_key in self._entries:
+            self._drop(entry_key)
+        self._entries[entry_key] = (body, time.monotonic() + self.ttl)
+        self._keys_by_user.setdefault(user_id, set()).add(entry_key)
+        self._versions[user_id] = version
+        self.bytes += len(body.content)
+        while len(self._entries) > self.maxsize or self.bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._keys_by_user.clear()
+        self._versions.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries), "maxsize": self.maxsize, "bytes": self.bytes, "max_bytes": self.max_bytes,
+            "ttl_secondi": self.ttl, "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+    def _drop(self, entry_key: tuple) -> None:
+        self._pop(entry_key)
+        keys = self._keys_by_user.get(entry_key[0])
+        if keys is not None:
+            keys.discard(entry_key)
+            if not keys:
+                del self._keys_by_user[entry_key[0]]
+                self._versions.pop(entry_key[0], None)
+
+    def _pop(self, entry_key: tuple) -> None:
+        body, _ = self._entries.pop(entry_key)
+        self.bytes -= len(body.content)
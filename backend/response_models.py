@@ -0,0 +1,129 @@
+"""Declared response models of the main endpoints.
+
+With a response_model, FastAPI validates and serializes the returned
+document in pydantic-core instead of walking it with jsonable_encoder, and
+the default ORJSONResponse encodes the result. The models declare only the
+fields every document of the collection carries. ``extra="allow"`` passes
+the rest through unchanged: optional fields, fields added later, and
+legacy fields of old documents. No field is dropped or added with a null.
+Numeric fields are ``Number``: a plain ``float`` would turn a stored 5 into
+5.0 on the wire.
+
+Cached reads (lists, stats, routes) return pre-serialized bodies from
+response_cache. For them the model only documents the response in OpenAPI.
+"""
+from typing import Any, Dict, List, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+Number = Union[int, float]  # ints stay ints, as without a response model
+
+
+class ApiModel(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+
+# ===== USERS =====
+
+class UserOut(ApiModel):
+    user_id: str
+    email: str
+    # Bookkeeping the server keeps on the user document (response_cache, rollups): never sent
+    data_version: Optional[int] = Field(default=None, exclude=True)
+    rollup_version: Optional[int] = Field(default=None, exclude=True)
+
+
+# ===== WALKS =====
+
+class WalkStartOut(ApiModel):
+    walk_id: str
+    data: str
+
+
+class WalkPointsOut(ApiModel):
+    walk_id: str
+    ricevuti: int
+    nuovi: int
+    duplicati: int
+
+
+class WalkOut(ApiModel):
+    walk_id: str
+    user_id: str
+    distanza_km: Number
+    tempo_secondi: int
+    passi: int
+    velocita_media_kmh: Number
+    note: Optional[str]
+    data: str
+
+
+class RouteOut(ApiModel):
+    walk_id: str
+    punti: int
+    percorso: List[Dict[str, Any]]
+
+
+# ===== CIRCUITS =====
+
+class CircuitSetOut(ApiModel):
+    set_number: int
+    ripetizioni: int
+    peso_kg: Number
+    completato: bool
+
+
+class CircuitExerciseOut(ApiModel):
+    exercise_id: str
+    nome: str
+    sets: List[CircuitSetOut]
+
+
+class CircuitOut(ApiModel):
+    circuit_id: str
+    user_id: str
+    durata_minuti: int
+    esercizi: List[CircuitExerciseOut]
+    note: Optional[str]
+    data: str
+
+
+# ===== PLANS =====
+
+class PlanOut(ApiModel):
+    plan_id: str
+    user_id: str
+    nome: str
+    tipo: str
+    giorni: List[Dict[str, Any]]  # free-form in the plans users build themselves
+    attivo: bool
+    created_at: str
+
+
+# ===== SFIDE =====
+
+class SfidaOut(ApiModel):
+    sfida_id: str
+    user_id: str
+    target_field: str
+    target_value: Number
+    current_value: Number
+    completata: bool
+
+
+# ===== STATS =====
+
+class StatsOut(ApiModel):
+    """Only the requested ``sections`` are present."""
+    totale: Optional[Dict[str, Number]] = None
+    settimanale: Optional[Dict[str, Number]] = None
+    mensile: Optional[Dict[str, Number]] = None
+    record: Optional[Dict[str, Number]] = None
+    medie: Optional[Dict[str, Number]] = None
+    streak: Optional[int] = None
+    volume_per_esercizio: Optional[Dict[str, Number]] = None
+    record_esercizi: Optional[Dict[str, Dict[str, Number]]] = None
+    grafici_camminate: Optional[List[Dict[str, Any]]] = None
+    grafici_circuiti: Optional[List[Dict[str, Any]]] = None
+    grafici_giornalieri: Optional[List[Dict[str, Any]]] = None
@@ -0,0 +1,310 @@
+"""Per-user, per-day activity rollups maintained at write time.
+
+``create_walk`` and ``create_circuit`` fold every new document into the
+``daily_rollups`` document of its user and UTC day with a single ``$inc``/
+``$max`` upsert, so /api/stats reads O(days) small documents instead of
+the full walk and circuit history.
+
+The insert and the upsert are two writes. Every day document lists the
+``ids`` of the walks and circuits it counts, and the upsert filters on the
+id being absent, so applying the same activity again changes nothing. The
+scheduler relies on that to re-apply the recent activity and repair an
+upsert lost between the two writes.
+
+A user whose ``rollup_version`` is not ROLLUP_VERSION has their rollups
+rebuilt from the raw documents by ``ensure_user`` on the first stats read,
+so existing users need no manual backfill. ``python rollups.py backfill``
+still rebuilds every user up front.
+"""
+import argparse
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import DeleteMany, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from stats_engine import (CAL_PER_CIRCUIT_MIN, CAL_PER_KM, CHART_POINTS, SECTION_NEEDS, SECTIONS, assemble_stats,
+                          chart_circuit, exercise_volumes)
+
+ROLLUP_COLLECTION = "daily_rollups"
+ROLLUP_VERSION = 2  # 2: day documents list their ids
+CATCH_UP = timedelta(minutes=1)  # a rebuild re-applies what was inserted this long before it started
+
+
+def field_key(name: str) -> str:
+    # Exercise ids fall back to free-text names, which must not break dotted update paths
+    return name.replace(".", "．").replace("$", "＄")
+
+
+def unfield_key(key: str) -> str:
+    return key.replace("．", ".").replace("＄", "$")
+
+
+def rollup_id(user_id: str, giorno: str) -> str:
+    return f"{user_id}|{giorno}"
+
+
+def activity_id(doc: dict) -> Optional[str]:
+    return doc.get("walk_id") or doc.get("circuit_id")
+
+
+def _once(key: dict, update: dict, doc: dict) -> Tuple[dict, dict]:
+    """Make the upsert of ``doc`` a no-op once its id is in the day document."""
+    aid = activity_id(doc)
+    if aid is not None:
+        key["ids"] = {"$ne": aid}
+        update["$addToSet"] = {"ids": aid}
+    return key, update
+
+
+def walk_rollup_update(walk: dict) -> Tuple[dict, dict]:
+    giorno = walk.get("data", "")[:10]
+    km = walk.get("distanza_km", 0)
+    update = {
+        "$setOnInsert": {"user_id": walk["user_id"], "giorno": giorno},
+        "$inc": {
+            "camminate": 1, "km": km, "passi": walk.get("passi", 0),
+            "tempo_camminata_sec": walk.get("tempo_secondi", 0),
+            "somma_velocita": walk.get("velocita_media_kmh", 0),
+            "calorie": km * CAL_PER_KM,
+        },
+        "$max": {
+            "best_km": km, "best_passi": walk.get("passi", 0),
+            "best_velocita": walk.get("velocita_media_kmh", 0),
+            "best_tempo_sec": walk.get("tempo_secondi", 0),
+        },
+    }
+    return _once({"_id": rollup_id(walk["user_id"], giorno)}, update, walk)
+
+
+def circuit_rollup_update(circuit: dict) -> Tuple[dict, dict]:
+    giorno = circuit.get("data", "")[:10]
+    durata = circuit.get("durata_minuti", 0)
+    total, volumes, bests = exercise_volumes(circuit.get("esercizi", []))
+    inc = {"circuiti": 1, "tempo_circuito_min": durata, "volume": total, "calorie": durata * CAL_PER_CIRCUIT_MIN}
+    for eid, vol in volumes.items():
+        inc[f"volume_per_esercizio.{field_key(eid)}"] = vol
+    maxes = {}
+    for eid, best in bests.items():
+        maxes[f"record_esercizi.{field_key(eid)}.max_peso"] = best["max_peso"]
+        maxes[f"record_esercizi.{field_key(eid)}.max_reps"] = best["max_reps"]
+    update = {"$setOnInsert": {"user_id": circuit["user_id"], "giorno": giorno}, "$inc": inc}
+    if maxes:
+        update["$max"] = maxes
+    return _once({"_id": rollup_id(circuit["user_id"], giorno)}, update, circuit)
+
+
+async def _record(db, key: dict, update: dict) -> bool:
+    try:
+        await db[ROLLUP_COLLECTION].update_one(key, update, upsert=True)
+    except DuplicateKeyError:
+        # Either the day document already lists the id, or another activity created it
+        # first; Mongo does not retry that upsert, and the ids filter makes the retry a
+        # no-op in the first case
+        result = await db[ROLLUP_COLLECTION].update_one(key, update)
+        return result.matched_count > 0
+    return True
+
+
+async def record_walk(db, walk: dict) -> bool:
+    """Fold ``walk`` into its day document; False when it was already counted."""
+    return await _record(db, *walk_rollup_update(walk))
+
+
+async def record_circuit(db, circuit: dict) -> bool:
+    return await _record(db, *circuit_rollup_update(circuit))
+
+
+async def apply_updates(db, updates: List[Tuple[dict, dict]]) -> int:
+    """Upsert many rollup updates in one round trip; returns how many had not been applied before."""
+    if not updates:
+        return 0
+    try:
+        await db[ROLLUP_COLLECTION].bulk_write([UpdateOne(k, u, upsert=True) for k, u in updates], ordered=False)
+    except BulkWriteError as exc:
+        errors = exc.details.get("writeErrors", [])
+        if any(e.get("code") != 11000 for e in errors):
+            raise
+        # Retried without upsert, as in _record
+        retry = [UpdateOne(*updates[e["index"]]) for e in errors]
+        result = await db[ROLLUP_COLLECTION].bulk_write(retry, ordered=False)
+        return len(updates) - len(errors) + result.matched_count
+    return len(updates)
+
+
+def apply_update(doc: dict, update: dict) -> dict:
+    """Apply a rollup update in Python, with the same semantics Mongo gives $inc/$max/$setOnInsert."""
+    for op, fields in update.items():
+        for path, value in fields.items():
+            *parents, leaf = path.split(".")
+            target = doc
+            for part in parents:
+                target = target.setdefault(part, {})
+            if op == "$inc":
+                target[leaf] = target.get(leaf, 0) + value
+            elif op == "$max":
+                target[leaf] = max(target[leaf], value) if leaf in target else value
+            elif op == "$setOnInsert":
+                target.setdefault(leaf, value)
+            elif op == "$addToSet":
+                if value not in target.setdefault(leaf, []):
+                    target[leaf].append(value)
+    return doc
+
+
+# ===== READ SIDE =====
+
+def window_edges(now: datetime) -> List[Tuple[str, str]]:
+    """(start, end) ranges of the partially covered first day of the weekly and monthly windows."""
+    edges = []
+    for days in (7, 30):
+        start = now - timedelta(days=days)
+        edges.append((start.isoformat(), (start + timedelta(days=1)).strftime("%Y-%m-%d")))
+    return edges
+
+
+def stats_from_rollups(rollups: List[dict], recent_walks: List[dict], recent_circuits: List[dict],
+                       edge_walks: List[dict], edge_circuits: List[dict], now: datetime,
+                       sections: Iterable[str] = SECTIONS) -> dict:
+    """Build the /api/stats response from daily rollups.
+
+    ``recent_*`` are the last 30 walks and circuits for the charts; ``edge_*`` are the
+    documents of the first, partially covered day of the weekly and monthly windows,
+    which rollups alone cannot split at the exact timestamp.
+    """
+    (week_ago, _), (month_ago, _) = window_edges(now)
+    week_day, month_day = week_ago[:10], month_ago[:10]
+    tot = {"camminate": 0, "km": 0, "passi": 0, "tempo_camminata_sec": 0, "somma_velocita": 0,
+           "circuiti": 0, "tempo_circuito_min": 0, "volume": 0}
+    week = {"km": 0, "passi": 0, "camminate": 0, "circuiti": 0}
+    month = {"km": 0, "camminate": 0, "circuiti": 0}
+    best = {"best_km": 0, "best_passi": 0, "best_velocita": 0, "best_tempo_sec": 0}
+    exercise_volumes_tot: Dict[str, float] = {}
+    ex_bests: Dict[str, dict] = {}
+    by_day = {}
+    for r in rollups:
+        by_day[r["giorno"]] = r
+        for k in tot:
+            tot[k] += r.get(k, 0)
+        for k in best:
+            best[k] = max(best[k], r.get(k, 0))
+        if r["giorno"] > week_day:
+            for k in week:
+                week[k] += r.get(k, 0)
+        if r["giorno"] > month_day:
+            for k in month:
+                month[k] += r.get(k, 0)
+        for key, vol in r.get("volume_per_esercizio", {}).items():
+            eid = unfield_key(key)
+            exercise_volumes_tot[eid] = exercise_volumes_tot.get(eid, 0) + vol
+        for key, rec in r.get("record_esercizi", {}).items():
+            curr = ex_bests.setdefault(unfield_key(key), {"max_peso": 0, "max_reps": 0})
+            curr["max_peso"] = max(curr["max_peso"], rec.get("max_peso", 0))
+            curr["max_reps"] = max(curr["max_reps"], rec.get("max_reps", 0))
+
+    for window, since, day in ((week, week_ago, week_day), (month, month_ago, month_day)):
+        for w in edge_walks:
+            if w.get("data", "")[:10] == day and w.get("data", "") >= since:
+                window["km"] += w.get("distanza_km", 0)
+                window["camminate"] += 1
+                if "passi" in window:
+                    window["passi"] += w.get("passi", 0)
+        window["circuiti"] += sum(1 for c in edge_circuits if c.get("data", "")[:10] == day and c.get("data", "") >= since)
+
+    chart_circuits = [chart_circuit(c.get("data", ""), exercise_volumes(c.get("esercizi", []))[0], c.get("durata_minuti", 0), len(c.get("esercizi", []))) for c in recent_circuits]
+    days = {day: {"km": r.get("km", 0), "passi": r.get("passi", 0), "circuiti": r.get("circuiti", 0), "durata": r.get("tempo_circuito_min", 0)}
+            for day, r in by_day.items()}
+    return assemble_stats(tot, week, month, best, exercise_volumes_tot, ex_bests, days, recent_walks, chart_circuits, now, sections)
+
+
+WALK_CHART_FIELDS = {"_id": 0, "data": 1, "distanza_km": 1, "passi": 1, "velocita_media_kmh": 1, "tempo_secondi": 1}
+CIRCUIT_CHART_FIELDS = {
+    "_id": 0, "data": 1, "durata_minuti": 1, "esercizi.exercise_id": 1, "esercizi.nome": 1,
+    "esercizi.sets.ripetizioni": 1, "esercizi.sets.peso_kg": 1, "esercizi.sets.completato": 1,
+    "esercizi.serie": 1, "esercizi.ripetizioni": 1, "esercizi.peso_kg": 1,
+}
+
+
+EXERCISE_SECTIONS = ("volume_per_esercizio", "record_esercizi")
+
+
+async def load_stats(db, user_id: str, now: datetime, sections: Iterable[str] = SECTIONS) -> dict:
+    wanted = set(sections)
+    # Chart sections read raw documents; every other section reads rollups
+    needs = [SECTION_NEEDS[name] for name in wanted if not SECTION_NEEDS[name].recent]
+    rollups = recent_walks = recent_circuits = edge_walks = edge_circuits = []
+    if needs:
+        query = {"user_id": user_id}
+        if all(n.days for n in needs):
+            query["giorno"] = {"$gte": (now - timedelta(days=max(n.days for n in needs))).strftime("%Y-%m-%d")}
+        projection = {"_id": 0, "ids": 0}
+        if not wanted & set(EXERCISE_SECTIONS):
+            projection.update({name: 0 for name in EXERCISE_SECTIONS})
+        rollups = await db[ROLLUP_COLLECTION].find(query, projection).sort("giorno", -1).to_list(None)
+    if "grafici_camminate" in wanted:
+        recent_walks = await db.walks.find({"user_id": user_id}, WALK_CHART_FIELDS).sort("data", -1).to_list(CHART_POINTS)
+    if "grafici_circuiti" in wanted:
+        recent_circuits = await db.circuits.find({"user_id": user_id}, CIRCUIT_CHART_FIELDS).sort("data", -1).to_list(CHART_POINTS)
+    edges = [edge for name, edge in zip(("settimanale", "mensile"), window_edges(now)) if name in wanted]
+    if edges:
+        edge_query = {"user_id": user_id, "$or": [{"data": {"$gte": start, "$lt": end}} for start, end in edges]}
+        edge_walks = await db.walks.find(edge_query, {"_id": 0, "data": 1, "distanza_km": 1, "passi": 1}).to_list(None)
+        edge_circuits = await db.circuits.find(edge_query, {"_id": 0, "data": 1}).to_list(None)
+    return stats_from_rollups(rollups, recent_walks, recent_circuits, edge_walks, edge_circuits, now, sections)
+
+
+# ===== BACKFILL =====
+
+async def backfill_user(db, user_id: str) -> int:
+    """Rebuild every rollup of ``user_id`` from its walks and circuits; returns the number of days written."""
+    started = ObjectId.from_datetime(datetime.now(timezone.utc) - CATCH_UP)
+    docs: Dict[str, dict] = {}
+    async for walk in db.walks.find({"user_id": user_id}, {"_id": 0, "percorso": 0, "note": 0}):
+        key, update = walk_rollup_update(walk)
+        apply_update(docs.setdefault(key["_id"], {"_id": key["_id"]}), update)
+    async for circuit in db.circuits.find({"user_id": user_id}, {"_id": 0, "note": 0}):
+        key, update = circuit_rollup_update(circuit)
+        apply_update(docs.setdefault(key["_id"], {"_id": key["_id"]}), update)
+    ops = [ReplaceOne({"_id": rid}, doc, upsert=True) for rid, doc in docs.items()]
+    ops.append(DeleteMany({"user_id": user_id, "_id": {"$nin": list(docs)}}))
+    await db[ROLLUP_COLLECTION].bulk_write(ops, ordered=False)
+    # An upsert that ran while the snapshot was read was just replaced away: apply the
+    # recent activity again, the ids skip what the snapshot already counted
+    recent = {"user_id": user_id, "_id": {"$gte": started}}
+    updates = [walk_rollup_update(w) async for w in db.walks.find(recent, {"percorso": 0, "note": 0})]
+    updates += [circuit_rollup_update(c) async for c in db.circuits.find(recent, {"note": 0})]
+    await apply_updates(db, updates)
+    await db.users.update_one({"user_id": user_id}, {"$set": {"rollup_version": ROLLUP_VERSION}})
+    return len(docs)
+
+
+async def ensure_user(db, user: dict) -> bool:
+    """Rebuild the rollups of ``user`` unless they are at ROLLUP_VERSION; True when it rebuilt them."""
+    if user.get("rollup_version") == ROLLUP_VERSION:
+        return False
+    await backfill_user(db, user["user_id"])
+    return True
+
+
+async def backfill(db, user_ids: List[str] = None) -> None:
+    if not user_ids:
+        user_ids = await db.walks.distinct("user_id") + await db.circuits.distinct("user_id")
+    for user_id in sorted(set(user_ids)):
+        days = await backfill_user(db, user_id)
+        print(f"{user_id}: {days} giorni")
+
+
+if __name__ == "__main__":
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Rollup giornalieri delle attività")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bf = sub.add_parser("backfill", help="ricostruisci i rollup dai dati esistenti")
+    bf.add_argument("--user", action="append", dest="users", help="solo questi user_id (ripetibile)")
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    asyncio.run(backfill(client[os.environ.get("DB_NAME", "walt")], args.users))
@@ -0,0 +1,188 @@
+"""Server-side analytics of a walk route, vectorized with NumPy.
+
+``analyze`` works on coordinate and timestamp arrays with no Python loop
+over the points:
+- GPS spikes, fixes that imply an impossible speed both to and from their
+  neighbours, are dropped;
+- a segment counts as moving when the net displacement over the next
+  MOVING_WINDOW_S seconds beats MIN_MOVING_KMH, so stationary jitter,
+  which wanders back and forth, adds neither distance nor moving time;
+- per-km splits are interpolated on the cumulative moving distance, and
+  the max sustained speed is the best SUSTAINED_WINDOW_S average.
+Routes without timestamps (walks saved before streaming) are assumed to be
+evenly sampled over the walk's tempo_secondi; timed routes are put in
+timestamp order first, since a client may send them out of order.
+``python route_analytics.py recompute`` refreshes ``analisi`` on every
+stored walk.
+"""
+import argparse
+import asyncio
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+from pymongo import UpdateOne
+
+import walk_routes
+
+EARTH_RADIUS_M = 6_371_000.0
+MAX_SPEED_KMH = 15.0  # faster than any walker: GPS jump
+MIN_MOVING_KMH = 1.0
+MOVING_WINDOW_S = 30.0
+SUSTAINED_WINDOW_S = 60.0
+
+
+def route_arrays(points: List[dict], durata_sec: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(lat, lng, seconds since start) of ``points``, sorted by time."""
+    n = len(points)
+    lat = np.fromiter((p["lat"] for p in points), dtype=np.float64, count=n)
+    lng = np.fromiter((p["lng"] for p in points), dtype=np.float64, count=n)
+    if n and all(p.get("timestamp") is not None for p in points):
+        t = np.fromiter((p["timestamp"] for p in points), dtype=np.float64, count=n) / 1000
+        if (np.diff(t) < 0).any():
+            order = np.argsort(t, kind="stable")
+            lat, lng, t = lat[order], lng[order], t[order]
+        t -= t[0]
+    else:
+        t = np.linspace(0.0, float(durata_sec or 0), n)
+    return lat, lng, t
+
+
+def haversine_m(lat1: np.ndarray, lng1: np.ndarray, lat2: np.ndarray, lng2: np.ndarray) -> np.ndarray:
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+
+def _speed_kmh(meters: np.ndarray, seconds: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(seconds > 0, meters / seconds * 3.6, np.where(meters > 0, np.inf, 0.0))
+
+
+def drop_spikes(lat: np.ndarray, lng: np.ndarray, t: np.ndarray) -> np.ndarray:
+    """Mask of the fixes to keep: a spike is too fast both from the previous and to the next fix."""
+    keep = np.ones(len(lat), dtype=bool)
+    if len(lat) < 3:
+        return keep
+    v = _speed_kmh(haversine_m(lat[:-1], lng[:-1], lat[1:], lng[1:]), np.diff(t))
+    keep[1:-1] = ~((v[:-1] > MAX_SPEED_KMH) & (v[1:] > MAX_SPEED_KMH))
+    return keep
+
+
+def _empty(durata: float, scartati: int) -> dict:
+    return {
+        "distanza_km": 0.0, "tempo_totale_sec": int(round(durata)), "tempo_movimento_sec": 0,
+        "tempo_fermo_sec": int(round(durata)), "velocita_media_movimento_kmh": 0.0,
+        "velocita_max_sostenuta_kmh": 0.0, "parziali": [], "punti_scartati": scartati,
+    }
+
+
+def analyze(lat: np.ndarray, lng: np.ndarray, t: np.ndarray) -> dict:
+    """Distance, moving/stopped time, per-km splits and max sustained speed of one route.
+
+    ``t`` must be non-decreasing, as ``route_arrays`` returns it.
+    """
+    keep = drop_spikes(lat, lng, t)
+    scartati = int((~keep).sum())
+    lat, lng, t = lat[keep], lng[keep], t[keep]
+    n = len(lat)
+    durata = float(t[-1] - t[0]) if n else 0.0
+    if n < 2:
+        return _empty(durata, scartati)
+
+    seg_m = haversine_m(lat[:-1], lng[:-1], lat[1:], lng[1:])
+    seg_s = np.diff(t)
+    # Net displacement from each fix to the first one at least MOVING_WINDOW_S later
+    ahead = np.minimum(np.searchsorted(t, t[:-1] + MOVING_WINDOW_S), n - 1)
+    window_m = haversine_m(lat[:-1], lng[:-1], lat[ahead], lng[ahead])
+    window_v = _speed_kmh(window_m, t[ahead] - t[:-1])
+    moving = (window_v >= MIN_MOVING_KMH) & (_speed_kmh(seg_m, seg_s) <= MAX_SPEED_KMH)
+
+    moving_m = np.where(moving, seg_m, 0.0)
+    cum_m = np.concatenate(([0.0], np.cumsum(moving_m)))
+    moving_s = float(seg_s[moving].sum())
+    total_m = float(cum_m[-1])
+
+    # Time at which the cumulative distance crosses each whole kilometre
+    marks = np.arange(1000.0, total_m + 1e-9, 1000.0)
+    parziali = []
+    if len(marks):
+        hi = np.searchsorted(cum_m, marks, side="left")
+        lo = hi - 1
+        frac = (marks - cum_m[lo]) / (cum_m[hi] - cum_m[lo])
+        crossing = t[lo] + frac * (t[hi] - t[lo])
+        split_s = np.diff(np.concatenate(([t[0]], crossing)))
+        parziali = [{"km": i + 1, "tempo_sec": int(round(s)), "passo_min_km": round(float(s) / 60, 2)}
+                    for i, s in enumerate(split_s)]
+
+    # Best average over any window of SUSTAINED_WINDOW_S seconds
+    end = np.searchsorted(t, t + SUSTAINED_WINDOW_S)
+    valid = end < n
+    sustained = 0.0
+    if valid.any():
+        start_i = np.nonzero(valid)[0]
+        end_i = end[valid]
+        sustained = float(np.max(_speed_kmh(cum_m[end_i] - cum_m[start_i], t[end_i] - t[start_i])))
+
+    return {
+        "distanza_km": round(total_m / 1000, 2), "tempo_totale_sec": int(round(durata)),
+        "tempo_movimento_sec": int(round(moving_s)), "tempo_fermo_sec": int(round(durata - moving_s)),
+        "velocita_media_movimento_kmh": round(total_m / moving_s * 3.6, 1) if moving_s else 0.0,
+        "velocita_max_sostenuta_kmh": round(sustained, 1), "parziali": parziali, "punti_scartati": scartati,
+    }
+
+
+def analyze_points(points: List[dict], durata_sec: Optional[float] = None) -> dict:
+    """``analyze`` of ``{"lat", "lng", "timestamp"}`` points, as validated by the RoutePoint model."""
+    return analyze(*route_arrays(points, durata_sec))
+
+
+# ===== BATCH =====
+
+async def recompute_user(db, user_id: str, batch_size: int = 200) -> int:
+    """Recompute ``analisi`` for every walk of ``user_id``; returns the number of walks updated."""
+    routes = {}
+    async for doc in db[walk_routes.ROUTE_COLLECTION].find({"user_id": user_id}, {"percorso": 1}):
+        routes[doc["_id"]] = doc["percorso"]
+    ops = []
+    updated = 0
+    async for walk in db.walks.find({"user_id": user_id}, {"_id": 0, "walk_id": 1, "tempo_secondi": 1, "percorso": 1}):
+        blob = routes.get(walk["walk_id"])
+        points = walk_routes.decode_route(blob) if blob is not None else walk.get("percorso") or []
+        if len(points) < 2:
+            continue
+        try:
+            analisi = analyze_points(points, walk.get("tempo_secondi"))
+        except (KeyError, TypeError, ValueError):
+            # Stored before the points were validated
+            continue
+        ops.append(UpdateOne({"walk_id": walk["walk_id"]}, {"$set": {"analisi": analisi}}))
+        if len(ops) >= batch_size:
+            await db.walks.bulk_write(ops, ordered=False)
+            updated += len(ops)
+            ops = []
+    if ops:
+        await db.walks.bulk_write(ops, ordered=False)
+        updated += len(ops)
+    return updated
+
+
+async def recompute(db, user_ids: List[str] = None) -> None:
+    if not user_ids:
+        user_ids = await db.walks.distinct("user_id")
+    for user_id in sorted(set(user_ids)):
+        walks = await recompute_user(db, user_id)
+        print(f"{user_id}: {walks} camminate")
+
+
+if __name__ == "__main__":
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Analisi dei percorsi GPS")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rc = sub.add_parser("recompute", help="ricalcola l'analisi di tutte le camminate")
+    rc.add_argument("--user", action="append", dest="users", help="solo questi user_id (ripetibile)")
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    asyncio.run(recompute(client[os.environ.get("DB_NAME", "walt")], args.users))
@@ -0,0 +1,207 @@
+"""In-process scheduler for the periodic maintenance sweeps.
+
+Started and stopped by the FastAPI lifespan. Every job runs in its own task
+every ``interval_s`` seconds, with +/- JITTER randomization so the workers
+of a deployment do not wake up together. Before running, a worker takes
+the job's lease in the ``scheduler_locks`` collection, so with several
+uvicorn workers only one runs a job per interval. The lease is held for one
+interval: another worker takes over when the owner stops renewing it.
+Every sweep works in bounded batches of BATCH_SIZE documents, at most
+MAX_BATCHES per run, so one run never holds the event loop or the database
+for long. A backlog is finished by the following runs. Per-job run counts
+and timings are exposed by ``stats`` in /api/metrics.
+"""
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+import rollups
+import walk_ingest
+
+logger = logging.getLogger(__name__)
+
+LOCK_COLLECTION = "scheduler_locks"
+JITTER = 0.1
+BATCH_SIZE = 500
+MAX_BATCHES = 20
+ABANDONED_AFTER = timedelta(hours=6)  # an active walk with no points for this long was forgotten
+OnChange = Callable[..., Awaitable[None]]  # awaited with the user_ids whose data a job changed
+REPAIR_WINDOW = timedelta(minutes=30)  # a few runs of rollup_recenti, so a late run still covers everything
+
+
+# ===== JOBS =====
+
+async def purge_sessions(db, now: datetime, **_) -> int:
+    """Delete expired sessions the TTL index cannot see: ISO-string or missing expires_at."""
+    query = {"$or": [
+        {"expires_at": {"$lt": now}},
+        {"expires_at": {"$type": "string", "$lt": now.isoformat()}},
+        {"expires_at": None},
+    ]}
+    purged = 0
+    for _ in range(MAX_BATCHES):
+        ids = [d["_id"] for d in await db.user_sessions.find(query, {"_id": 1}).to_list(BATCH_SIZE)]
+        if not ids:
+            break
+        purged += (await db.user_sessions.delete_many({"_id": {"$in": ids}})).deleted_count
+    return purged
+
+
+async def expire_sfide(db, now: datetime, on_change: Optional[OnChange] = None, **_) -> int:
+    """Flag scaduta on the open challenges past their scadenza."""
+    query = {"completata": False, "scaduta": {"$ne": True}, "scadenza": {"$lt": now.isoformat()}}
+    flagged = 0
+    for _ in range(MAX_BATCHES):
+        docs = await db.sfide.find(query, {"_id": 1, "user_id": 1}).to_list(BATCH_SIZE)
+        if not docs:
+            break
+        result = await db.sfide.update_many({"_id": {"$in": [d["_id"] for d in docs]}}, {"$set": {"scaduta": True}})
+        flagged += result.modified_count
+        if on_change is not None:
+            await on_change(*{d["user_id"] for d in docs})
+    return flagged
+
+
+async def close_abandoned_walks(db, now: datetime, on_change: Optional[OnChange] = None,
+                                on_walk_created: Optional[Callable[[dict], None]] = None, **_) -> int:
+    """Finish the streamed walks nobody finished, as of their last batch; drop the empty ones."""
+    cutoff = (now - ABANDONED_AFTER).isoformat()
+    closed = 0
+    for _ in range(MAX_BATCHES):
+        active = await db[walk_ingest.ACTIVE_COLLECTION].find(
+            {"aggiornata_at": {"$lt": cutoff}}, {"_id": 1, "user_id": 1, "aggiornata_at": 1}).to_list(BATCH_SIZE)
+        if not active:
+            break
+        for walk in active:
+            has_points = await db[walk_ingest.POINTS_COLLECTION].find_one({"walk_id": walk["_id"]}, {"_id": 1})
+            if has_points:
+                await walk_ingest.finish_walk(db, walk["_id"], walk["user_id"],
+                                              datetime.fromisoformat(walk["aggiornata_at"]), on_created=on_walk_created)
+                if on_change is not None:
+                    await on_change(walk["user_id"])
+            else:
+                await db[walk_ingest.ACTIVE_COLLECTION].delete_one({"_id": walk["_id"]})
+            closed += 1
+    return closed
+
+
+async def repair_rollups(db, now: datetime, on_change: Optional[OnChange] = None, **_) -> int:
+    """Re-apply the rollups of the walks and circuits of the last REPAIR_WINDOW; returns the ones that were missing."""
+    repaired = 0
+    for collection, build in (("walks", rollups.walk_rollup_update), ("circuits", rollups.circuit_rollup_update)):
+        last = ObjectId.from_datetime(now - REPAIR_WINDOW)
+        for _ in range(MAX_BATCHES):
+            docs = await db[collection].find({"_id": {"$gt": last}}, {"percorso": 0, "note": 0}) \
+                .sort("_id", 1).to_list(BATCH_SIZE)
+            if not docs:
+                break
+            applied = await rollups.apply_updates(db, [build(d) for d in docs])
+            repaired += applied
+            if applied and on_change is not None:
+                await on_change(*{d["user_id"] for d in docs})
+            if len(docs) < BATCH_SIZE:
+                break
+            last = docs[-1]["_id"]
+    return repaired
+
+
+# ===== SCHEDULER =====
+
+class Job(NamedTuple):
+    name: str
+    interval_s: float
+    run: Callable[..., Awaitable[int]]  # (db, now, **hooks) -> documents handled
+
+
+def next_delay(interval_s: float, jitter: float = JITTER) -> float:
+    return interval_s * (1 + random.uniform(-jitter, jitter))
+
+
+class Scheduler:
+    def __init__(self, jobs: List[Job], **hooks):
+        self.jobs = jobs
+        self.hooks = hooks  # passed to every job: on_change, on_walk_created
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._tasks: List[asyncio.Task] = []
+        self._stats: Dict[str, dict] = {
+            job.name: {"interval_s": job.interval_s, "runs": 0, "skipped": 0, "failures": 0, "handled": 0,
+                       "last_ms": 0.0, "max_ms": 0.0, "total_ms": 0.0, "last_run_at": None}
+            for job in jobs
+        }
+
+    async def start(self, db) -> None:
+        for job in self.jobs:
+            self._tasks.append(asyncio.create_task(self._loop(db, job)))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def acquire(self, db, job: Job, now: datetime) -> bool:
+        """Take or renew the job's lease; False when another worker holds it."""
+        try:
+            await db[LOCK_COLLECTION].find_one_and_update(
+                {"_id": job.name, "$or": [{"scade_at": {"$lte": now}}, {"owner": self.owner}]},
+                {"$set": {"owner": self.owner, "scade_at": now + timedelta(seconds=job.interval_s)}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            # The upsert collided with the lease document of the current owner
+            return False
+
+    async def run_once(self, db, job: Job) -> Optional[int]:
+        """Run ``job`` if this worker gets the lease; returns the documents handled, None when skipped."""
+        stats = self._stats[job.name]
+        now = datetime.now(timezone.utc)
+        if not await self.acquire(db, job, now):
+            stats["skipped"] += 1
+            return None
+        t0 = time.perf_counter()
+        try:
+            handled = await job.run(db, now, **self.hooks)
+        except Exception:
+            stats["failures"] += 1
+            logger.exception("scheduler: job %s fallito", job.name)
+            return None
+        finally:
+            elapsed = (time.perf_counter() - t0) * 1000
+            stats["runs"] += 1
+            stats["last_ms"] = round(elapsed, 2)
+            stats["max_ms"] = round(max(stats["max_ms"], elapsed), 2)
+            stats["total_ms"] += elapsed
+            stats["last_run_at"] = now.isoformat()
+        stats["handled"] += handled
+        return handled
+
+    async def _loop(self, db, job: Job) -> None:
+        await asyncio.sleep(random.uniform(0, job.interval_s * JITTER))
+        while True:
+            await self.run_once(db, job)
+            await asyncio.sleep(next_delay(job.interval_s))
+
+    def stats(self) -> dict:
+        return {"owner": self.owner, "jobs": {
+            name: {**{k: v for k, v in s.items() if k != "total_ms"},
+                   "avg_ms": round(s["total_ms"] / s["runs"], 2) if s["runs"] else 0.0}
+            for name, s in self._stats.items()
+        }}
+
+
+DEFAULT_JOBS = [
+    Job("sessioni_scadute", 3600, purge_sessions),
+    Job("sfide_scadute", 600, expire_sfide),
+    Job("camminate_abbandonate", 1800, close_abandoned_walks),
+    Job("rollup_recenti", 600, repair_rollups),
+]
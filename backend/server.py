@@ -1,14 +1,40 @@
-from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, List
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field
+from typing import Dict, Optional, List
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone, timedelta
+import hmac
 import os
 import uuid
-import httpx
 import random
 from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
+from session_cache import SessionCache
+from response_cache import ResponseCache
+from http_cache import CachedBody, cached_body, cached_json_response
+from indexes import ensure_indexes
+from catalog_sync import sync_catalog
+from compression import CompressionMiddleware, Compressor
+import repositories
+import rollups
+import stats_engine
+import stats_aggregation
+import walk_routes
+import walk_ingest
+import route_analytics
+import pagination
+import sfide_progress
+import plan_generator
+import plan_batch
+import plan_edits
+from progress_engine import ProgressEngine
+from response_models import (CircuitOut, PlanOut, RouteOut, SfidaOut, StatsOut,
+                             UserOut, WalkOut, WalkPointsOut, WalkStartOut)
+from session_exchange import (DEFAULT_URL as AUTH_SESSION_DATA_DEFAULT_URL, CircuitBreaker, InvalidSession,
+                              SessionExchange, UpstreamUnavailable)
+from scheduler import DEFAULT_JOBS, Scheduler
 
 load_dotenv()
 
@@ -17,7 +43,24 @@ def get_allowed_origins():
     origins_str = os.environ.get("CORS_ORIGINS", "http://localhost:3000,http://localhost:3001")
     return [origin.strip() for origin in origins_str.split(",")]
 
-app = FastAPI(title="Walter the Walker API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if STORAGE_BACKEND == "mongo":
+        # Sync first so legacy duplicate exercises are gone before the unique index is built
+        await sync_catalog(db)
+        await ensure_indexes(db)
+        await progress_engine.start(db)
+        if SCHEDULER_ENABLED:
+            await scheduler.start(db)
+    await session_exchange.start()
+    yield
+    await scheduler.stop()
+    await progress_engine.stop()
+    await session_exchange.stop()
+    await plan_pool.stop()
+
+# orjson encodes every response; routes with a response_model also skip jsonable_encoder
+app = FastAPI(title="Walter the Walker API", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,13 +68,74 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Large, repetitive JSON (stats, routes, plans) travels compressed to clients on slow mobile links
+compressor = Compressor(
+    min_size=int(os.environ.get("COMPRESSION_MIN_BYTES", "1024")),
+    offload_size=int(os.environ.get("COMPRESSION_OFFLOAD_BYTES", str(32 * 1024))),
+    gzip_level=int(os.environ.get("COMPRESSION_GZIP_LEVEL", "6")),
+    brotli_quality=int(os.environ.get("COMPRESSION_BROTLI_QUALITY", "4")),
+)
+app.add_middleware(CompressionMiddleware, compressor=compressor)
+
 MONGO_URL = os.environ.get("MONGO_URL")
 DB_NAME = os.environ.get("DB_NAME")
 client = AsyncIOMotorClient(MONGO_URL)
 db = client[DB_NAME]
 
+# "memory" keeps everything in process, for profiling without MongoDB; the endpoints that
+# need derived collections (streamed walks, rollups, batch plans) answer 501 there
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "mongo")
+repos = repositories.memory_repositories() if STORAGE_BACKEND == "memory" else repositories.mongo_repositories(db)
+
+session_cache = SessionCache(
+    maxsize=int(os.environ.get("SESSION_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("SESSION_CACHE_TTL", "60")),
+)
+
+response_cache = ResponseCache(
+    maxsize=int(os.environ.get("RESPONSE_CACHE_SIZE", "5000")),
+    max_bytes=int(os.environ.get("RESPONSE_CACHE_MAX_MB", "64")) * 1024 * 1024,
+    ttl=float(os.environ.get("RESPONSE_CACHE_TTL", "300")),
+)
+
+async def data_changed(*user_ids: str) -> None:
+    """Record a write by ``user_ids``: bump their persisted data_version and drop their cached responses here."""
+    await repos.users.bump_version(list(user_ids))
+    for user_id in user_ids:
+        response_cache.invalidate(user_id)
+
+progress_engine = ProgressEngine(
+    maxsize=int(os.environ.get("PROGRESS_QUEUE_SIZE", "10000")),
+    on_change=data_changed,
+)
+
+# Maintenance sweeps; every worker runs the scheduler, a lease in Mongo keeps each job single-runner
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "1") == "1"
+scheduler = Scheduler(
+    DEFAULT_JOBS,
+    on_change=data_changed,
+    on_walk_created=lambda doc: progress_engine.publish(sfide_progress.walk_event(doc)),
+)
+
+# One pooled client for the OAuth session exchange; point the URL at a stub to load-test logins
+session_exchange = SessionExchange(
+    url=os.environ.get("AUTH_SESSION_DATA_URL", AUTH_SESSION_DATA_DEFAULT_URL),
+    connect_timeout=float(os.environ.get("AUTH_CONNECT_TIMEOUT", "3")),
+    read_timeout=float(os.environ.get("AUTH_READ_TIMEOUT", "5")),
+    retries=int(os.environ.get("AUTH_RETRIES", "2")),
+    max_connections=int(os.environ.get("AUTH_POOL_SIZE", "50")),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.environ.get("AUTH_BREAKER_FAILURES", "5")),
+        reset_after=float(os.environ.get("AUTH_BREAKER_RESET", "30")),
+    ),
+)
+
+# Processes building the plans of /api/admin/plans/generate-batch
+plan_pool = plan_batch.WorkerPool(int(os.environ.get("PLAN_BATCH_WORKERS", str(min(4, os.cpu_count() or 1)))))
+
 # ===== MODELS =====
 
 class ProfileSetup(BaseModel):
@@ -43,12 +147,28 @@ class ProfileSetup(BaseModel):
     obiettivo: str
     giorni_disponibili: List[str]
 
+class RoutePoint(BaseModel):
+    lat: float = Field(ge=-90, le=90)
+    lng: float = Field(ge=-180, le=180)
+    timestamp: Optional[int] = None  # ms since epoch, as reported by the device
+
 class WalkSession(BaseModel):
     distanza_km: float
     tempo_secondi: int
     passi: int
     velocita_media_kmh: float
-    percorso: Optional[List[dict]] = None
+    percorso: Optional[List[RoutePoint]] = None
+    note: Optional[str] = None
+
+class GpsPoint(RoutePoint):
+    seq: int
+    accuracy: Optional[float] = None
+
+class WalkPointsBatch(BaseModel):
+    punti: List[GpsPoint] = Field(max_length=1000)
+
+class WalkFinish(BaseModel):
+    passi: Optional[int] = None
     note: Optional[str] = None
 
 class SetLog(BaseModel):
@@ -84,6 +204,9 @@ class PlanExerciseUpdate(BaseModel):
     nome: Optional[str] = None
     note: Optional[str] = None
 
+class PlanExercisesUpdate(BaseModel):
+    modifiche: List[PlanExerciseUpdate] = Field(min_length=1, max_length=plan_edits.MAX_EDITS)
+
 # ===== AUTH HELPERS =====
 
 async def get_current_user(request: Request):
@@ -94,55 +217,129 @@ async def get_current_user(request: Request):
             session_token = auth_header.split(" ")[1]
     if not session_token:
         raise HTTPException(status_code=401, detail="Non autenticato")
-    session_doc = await db.user_sessions.find_one({"session_token": session_token}, {"_id": 0})
-    if not session_doc:
+    cached_user = session_cache.get(session_token)
+    if cached_user is not None:
+        return cached_user
+    session = await resolve_session(session_token)
+    if not session:
         raise HTTPException(status_code=401, detail="Sessione non valida")
-    expires_at = session_doc["expires_at"]
-    if isinstance(expires_at, str):
-        expires_at = datetime.fromisoformat(expires_at)
-    if expires_at.tzinfo is None:
-        expires_at = expires_at.replace(tzinfo=timezone.utc)
-    if expires_at < datetime.now(timezone.utc):
+    expires_in_ms = session.get("expires_in_ms")
+    if expires_in_ms is None:
+        expires_in_ms = legacy_expires_in_ms(session.get("expires_at"))
+    if expires_in_ms <= 0:
         raise HTTPException(status_code=401, detail="Sessione scaduta")
-    user_doc = await db.users.find_one({"user_id": session_doc["user_id"]}, {"_id": 0})
+    user_doc = session.get("user")
     if not user_doc:
         raise HTTPException(status_code=401, detail="Utente non trovato")
+    user_doc.pop("_id", None)
+    session_cache.put(session_token, user_doc, expires_in_ms / 1000)
+    # Read just now with the session: cached_user_response can skip reading it again
+    request.state.data_version = user_doc.get("data_version", 0)
     return user_doc
 
+async def resolve_session(session_token: str):
+    """Resolve session and user in one round trip, computing the time left before expiry server-side."""
+    return await repos.sessions.resolve(session_token, datetime.now(timezone.utc))
+
+def legacy_expires_in_ms(expires_at) -> float:
+    # Sessions written by hand with ISO strings the server cannot parse
+    if isinstance(expires_at, str):
+        expires_at = datetime.fromisoformat(expires_at)
+    if not isinstance(expires_at, datetime):
+        return 0
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return (expires_at - datetime.now(timezone.utc)).total_seconds() * 1000
+
+def require_mongo() -> None:
+    if STORAGE_BACKEND != "mongo":
+        raise HTTPException(status_code=501, detail="Non disponibile con l'archivio in memoria")
+
+async def cached_user_response(request: Request, user_id: str, key: tuple, load):
+    """Serve a per-user read from response_cache, awaiting ``load()`` only on a miss.
+
+    ``load`` returns the response content, or a CachedBody when it needs extra headers.
+    Entries are keyed on the user's persisted data_version, so a write on any worker
+    makes them stale everywhere.
+    """
+    version = getattr(request.state, "data_version", None)
+    if version is None:
+        # The user came from session_cache, whose copy may predate writes by other workers
+        version = await repos.users.data_version(user_id)
+    body = response_cache.get(user_id, key, version)
+    if body is None:
+        content = await load()
+        body = content if isinstance(content, CachedBody) else cached_body(content)
+        response_cache.put(user_id, key, version, body)
+    return cached_json_response(request, body)
+
+LIST_SPECS = {
+    "walks": pagination.ListSpec("walks", "data", "walk_id", 100, exclude=("percorso",), stages=(
+        # Walks saved before routes moved to walk_routes still carry percorso inline
+        {"$addFields": {"punti_percorso": {"$ifNull": ["$punti_percorso", {"$size": {"$ifNull": ["$percorso", []]}}]}}},
+    )),
+    "circuits": pagination.ListSpec("circuits", "data", "circuit_id", 100),
+    "plans": pagination.ListSpec("plans", "created_at", "plan_id", 50),
+    "sfide": pagination.ListSpec("sfide", "created_at", "sfida_id", 50, exclude=("applied",)),
+}
+
+async def list_page(request: Request, name: str, cursor: Optional[str], limit: Optional[int], fields: Optional[str]):
+    """One keyset page of the user's ``name`` list; the next page's cursor goes in X-Next-Cursor."""
+    user = await get_current_user(request)
+    spec = LIST_SPECS[name]
+    limit = limit or spec.default_limit
+    try:
+        field_list = pagination.parse_fields(fields, spec)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Campi non validi: {e}")
+    if cursor:
+        try:
+            pagination.decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cursore non valido")
+
+    async def load():
+        docs = await getattr(repos, name).page(spec, user["user_id"], cursor, limit, field_list)
+        items, next_cursor = pagination.split_page(spec, docs, limit)
+        return cached_body(items, (("X-Next-Cursor", next_cursor),) if next_cursor else ())
+
+    key = (name, cursor, limit, tuple(field_list) if field_list else None)
+    return await cached_user_response(request, user["user_id"], key, load)
+
 # ===== AUTH ENDPOINTS =====
 
-@app.post("/api/auth/session")
+@app.post("/api/auth/session", response_model=UserOut)
 async def create_session(request: Request, response: Response):
     body = await request.json()
     session_id = body.get("session_id")
     if not session_id:
         raise HTTPException(status_code=400, detail="session_id mancante")
-    async with httpx.AsyncClient() as http_client:
-        resp = await http_client.get(
-            "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-            headers={"X-Session-ID": session_id},
-        )
-        if resp.status_code != 200:
-            raise HTTPException(status_code=401, detail="Sessione Google non valida")
-        data = resp.json()
+    try:
+        data = await session_exchange.fetch(session_id)
+    except InvalidSession:
+        raise HTTPException(status_code=401, detail="Sessione Google non valida")
+    except UpstreamUnavailable:
+        raise HTTPException(status_code=503, detail="Servizio di accesso non disponibile, riprova tra poco")
     email = data["email"]
     name = data.get("name", "")
     picture = data.get("picture", "")
     session_token = data.get("session_token", str(uuid.uuid4()))
-    existing_user = await db.users.find_one({"email": email}, {"_id": 0})
+    existing_user = await repos.users.by_email(email)
     if existing_user:
         user_id = existing_user["user_id"]
-        await db.users.update_one({"email": email}, {"$set": {"name": name, "picture": picture, "updated_at": datetime.now(timezone.utc)}})
+        await repos.users.update(user_id, {"name": name, "picture": picture, "updated_at": datetime.now(timezone.utc)})
+        session_cache.invalidate_user(user_id)
     else:
         user_id = f"user_{uuid.uuid4().hex[:12]}"
-        await db.users.insert_one({"user_id": user_id, "email": email, "name": name, "picture": picture, "profile_complete": False, "created_at": datetime.now(timezone.utc)})
+        # A new user has no activity, so their (empty) rollups are already current
+        await repos.users.insert({"user_id": user_id, "email": email, "name": name, "picture": picture, "profile_complete": False,
+                                  "created_at": datetime.now(timezone.utc), "rollup_version": rollups.ROLLUP_VERSION})
     expires_at = datetime.now(timezone.utc) + timedelta(days=7)
-    await db.user_sessions.insert_one({"user_id": user_id, "session_token": session_token, "expires_at": expires_at, "created_at": datetime.now(timezone.utc)})
+    await repos.sessions.insert({"user_id": user_id, "session_token": session_token, "expires_at": expires_at, "created_at": datetime.now(timezone.utc)})
     response.set_cookie(key="session_token", value=session_token, httponly=True, secure=True, samesite="none", path="/", max_age=7*24*3600)
-    user_doc = await db.users.find_one({"user_id": user_id}, {"_id": 0})
-    return user_doc
+    return await repos.users.get(user_id)
 
-@app.get("/api/auth/me")
+@app.get("/api/auth/me", response_model=UserOut)
 async def auth_me(request: Request):
     return await get_current_user(request)
 
@@ -150,37 +347,40 @@ async def auth_me(request: Request):
 async def logout(request: Request, response: Response):
     session_token = request.cookies.get("session_token")
     if session_token:
-        await db.user_sessions.delete_many({"session_token": session_token})
+        await repos.sessions.delete(session_token)
+        session_cache.invalidate_token(session_token)
     response.delete_cookie(key="session_token", path="/", samesite="none", secure=True)
     return {"message": "Logout effettuato"}
 
 # ===== PROFILE =====
 
-@app.get("/api/profile")
+@app.get("/api/profile", response_model=UserOut)
 async def get_profile(request: Request):
     return await get_current_user(request)
 
-@app.put("/api/profile")
+@app.put("/api/profile", response_model=UserOut)
 async def update_profile(request: Request, profile: ProfileSetup):
     user = await get_current_user(request)
-    await db.users.update_one({"user_id": user["user_id"]}, {"$set": {
+    await repos.users.update(user["user_id"], {
         "nome": profile.nome, "eta": profile.eta, "peso": profile.peso,
         "altezza": profile.altezza, "livello": profile.livello, "obiettivo": profile.obiettivo,
         "giorni_disponibili": profile.giorni_disponibili, "profile_complete": True,
         "updated_at": datetime.now(timezone.utc),
-    }})
-    return await db.users.find_one({"user_id": user["user_id"]}, {"_id": 0})
+    })
+    session_cache.invalidate_user(user["user_id"])
+    return await repos.users.get(user["user_id"])
 
 # ===== WALKS =====
 
-@app.get("/api/walks")
-async def get_walks(request: Request):
-    user = await get_current_user(request)
-    return await db.walks.find({"user_id": user["user_id"]}, {"_id": 0}).sort("data", -1).to_list(100)
+@app.get("/api/walks", response_model=List[WalkOut])
+async def get_walks(request: Request, cursor: Optional[str] = None,
+                    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_LIMIT), fields: Optional[str] = None):
+    return await list_page(request, "walks", cursor, limit, fields)
 
-@app.post("/api/walks")
+@app.post("/api/walks", response_model=WalkOut)
 async def create_walk(request: Request, walk: WalkSession):
     user = await get_current_user(request)
+    percorso = [p.dict(exclude_none=True) for p in walk.percorso or []]
     walk_doc = {
         "walk_id": f"walk_{uuid.uuid4().hex[:12]}",
         "user_id": user["user_id"],
@@ -188,22 +388,70 @@ async def create_walk(request: Request, walk: WalkSession):
         "tempo_secondi": walk.tempo_secondi,
         "passi": walk.passi,
         "velocita_media_kmh": walk.velocita_media_kmh,
-        "percorso": walk.percorso or [],
+        "punti_percorso": len(percorso),
         "note": walk.note,
         "data": datetime.now(timezone.utc).isoformat(),
     }
-    await db.walks.insert_one(walk_doc)
-    walk_doc.pop("_id", None)
+    if len(percorso) > 1:
+        # Stored next to the client-reported totals, which stay as sent
+        walk_doc["analisi"] = route_analytics.analyze_points(percorso, walk.tempo_secondi)
+    if percorso:
+        await repos.walks.save_route(walk_doc["walk_id"], user["user_id"], percorso)
+    await repos.walks.insert(walk_doc)
+    await data_changed(user["user_id"])
+    progress_engine.publish(sfide_progress.walk_event(walk_doc))
     return walk_doc
 
-# ===== CIRCUITS =====
+@app.post("/api/walks/start", response_model=WalkStartOut)
+async def start_walk(request: Request):
+    user = await get_current_user(request)
+    require_mongo()
+    return await walk_ingest.start_walk(db, user["user_id"], datetime.now(timezone.utc))
 
-@app.get("/api/circuits")
-async def get_circuits(request: Request):
+@app.post("/api/walks/{walk_id}/points", response_model=WalkPointsOut)
+async def append_walk_points(request: Request, walk_id: str, batch: WalkPointsBatch):
+    user = await get_current_user(request)
+    require_mongo()
+    points = [p.dict(exclude_none=True) for p in batch.punti]
+    result = await walk_ingest.append_points(db, walk_id, user["user_id"], points, datetime.now(timezone.utc))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Camminata in corso non trovata")
+    return result
+
+@app.post("/api/walks/{walk_id}/finish", response_model=WalkOut)
+async def finish_walk(request: Request, walk_id: str, finish: Optional[WalkFinish] = None):
     user = await get_current_user(request)
-    return await db.circuits.find({"user_id": user["user_id"]}, {"_id": 0}).sort("data", -1).to_list(100)
+    require_mongo()
+    finish = finish or WalkFinish()
+    walk_doc = await walk_ingest.finish_walk(
+        db, walk_id, user["user_id"], datetime.now(timezone.utc), finish.passi, finish.note,
+        on_created=lambda doc: progress_engine.publish(sfide_progress.walk_event(doc)))
+    if walk_doc is None:
+        raise HTTPException(status_code=404, detail="Camminata non trovata")
+    await data_changed(user["user_id"])
+    return walk_doc
+
+@app.get("/api/walks/{walk_id}/route", response_model=RouteOut)
+async def get_walk_route(request: Request, walk_id: str, tolleranza_m: float = 0):
+    """GPS route of one walk; ``tolleranza_m`` > 0 returns a Douglas-Peucker simplified preview."""
+    user = await get_current_user(request)
+
+    async def load():
+        percorso = await repos.walks.route(walk_id, user["user_id"])
+        if percorso is None:
+            raise HTTPException(status_code=404, detail="Camminata non trovata")
+        return {"walk_id": walk_id, "punti": len(percorso), "percorso": walk_routes.simplify_route(percorso, tolleranza_m)}
+
+    return await cached_user_response(request, user["user_id"], ("route", walk_id, tolleranza_m), load)
+
+# ===== CIRCUITS =====
 
-@app.post("/api/circuits")
+@app.get("/api/circuits", response_model=List[CircuitOut])
+async def get_circuits(request: Request, cursor: Optional[str] = None,
+                       limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_LIMIT), fields: Optional[str] = None):
+    return await list_page(request, "circuits", cursor, limit, fields)
+
+@app.post("/api/circuits", response_model=CircuitOut)
 async def create_circuit(request: Request, circuit: CircuitSession):
     user = await get_current_user(request)
     esercizi_data = []
@@ -232,68 +480,55 @@ async def create_circuit(request: Request, circuit: CircuitSession):
         "note": circuit.note,
         "data": datetime.now(timezone.utc).isoformat(),
     }
-    await db.circuits.insert_one(circuit_doc)
-    circuit_doc.pop("_id", None)
+    await repos.circuits.insert(circuit_doc)
+    await data_changed(user["user_id"])
+    progress_engine.publish(sfide_progress.circuit_event(circuit_doc))
     return circuit_doc
 
 # ===== EXERCISES =====
 
-from exercises_database import ESERCIZI_DATABASE, ELASTICI_KG_MAPPING, CATEGORIE
+from exercise_catalog import CATALOG
 
 @app.get("/api/exercises")
 async def get_exercises(request: Request, categoria: Optional[str] = None):
     await get_current_user(request)
-    # Seed database if empty
-    count = await db.exercises.count_documents({})
-    if count == 0:
-        for ex in ESERCIZI_DATABASE:
-            await db.exercises.insert_one(ex.copy())
-    # Query with optional category filter
-    query = {"categoria": categoria} if categoria else {}
-    exercises = await db.exercises.find(query, {"_id": 0}).to_list(100)
-    return exercises
+    return cached_json_response(request, CATALOG.list_body(categoria))
 
 @app.get("/api/exercises/categories")
 async def get_exercise_categories(request: Request):
     await get_current_user(request)
-    return {"categorie": CATEGORIE}
+    return cached_json_response(request, CATALOG.categories_body)
 
 @app.get("/api/exercises/{exercise_id}")
 async def get_exercise_detail(request: Request, exercise_id: str):
     await get_current_user(request)
-    exercise = await db.exercises.find_one({"exercise_id": exercise_id}, {"_id": 0})
-    if not exercise:
+    body = CATALOG.detail_body(exercise_id)
+    if body is None:
         raise HTTPException(status_code=404, detail="Esercizio non trovato")
-    return exercise
+    return cached_json_response(request, body)
 
 @app.get("/api/exercises/{exercise_id}/alternatives")
 async def get_exercise_alternatives(request: Request, exercise_id: str):
     """Get alternative exercises for smart swap"""
     await get_current_user(request)
-    exercise = await db.exercises.find_one({"exercise_id": exercise_id}, {"_id": 0})
-    if not exercise:
+    body = CATALOG.alternatives_body(exercise_id)
+    if body is None:
         raise HTTPException(status_code=404, detail="Esercizio non trovato")
-    # Find alternatives in same category, excluding current exercise
-    categoria = exercise.get("categoria")
-    alternatives = await db.exercises.find(
-        {"categoria": categoria, "exercise_id": {"$ne": exercise_id}},
-        {"_id": 0}
-    ).to_list(5)
-    return {"esercizio_originale": exercise, "alternative": alternatives}
+    return cached_json_response(request, body)
 
 @app.get("/api/elastici")
 async def get_elastici_mapping(request: Request):
     await get_current_user(request)
-    return ELASTICI_KG_MAPPING
+    return cached_json_response(request, CATALOG.elastici_body)
 
 # ===== PLANS =====
 
-@app.get("/api/plans")
-async def get_plans(request: Request):
-    user = await get_current_user(request)
-    return await db.plans.find({"user_id": user["user_id"]}, {"_id": 0}).sort("created_at", -1).to_list(50)
+@app.get("/api/plans", response_model=List[PlanOut])
+async def get_plans(request: Request, cursor: Optional[str] = None,
+                    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_LIMIT), fields: Optional[str] = None):
+    return await list_page(request, "plans", cursor, limit, fields)
 
-@app.post("/api/plans")
+@app.post("/api/plans", response_model=PlanOut)
 async def create_plan(request: Request, plan: PlanCreate):
     user = await get_current_user(request)
     plan_doc = {
@@ -301,9 +536,8 @@ async def create_plan(request: Request, plan: PlanCreate):
         "nome": plan.nome, "tipo": plan.tipo, "giorni": plan.giorni, "attivo": True,
         "created_at": datetime.now(timezone.utc).isoformat(),
     }
-    await db.plans.update_many({"user_id": user["user_id"]}, {"$set": {"attivo": False}})
-    await db.plans.insert_one(plan_doc)
-    plan_doc.pop("_id", None)
+    await repos.plans.insert_active(plan_doc)
+    await data_changed(user["user_id"])
     return plan_doc
 
 class WorkoutGeneratorInput(BaseModel):
@@ -311,262 +545,116 @@ class WorkoutGeneratorInput(BaseModel):
     focus_muscolare: Optional[List[str]] = None  # e.g., ["Gambe", "Core"]
     dolori_articolari: Optional[List[str]] = None  # e.g., ["ginocchia", "spalle"]
 
-@app.post("/api/plans/generate")
+@app.post("/api/plans/generate", response_model=PlanOut)
 async def generate_plan(request: Request, inputs: Optional[WorkoutGeneratorInput] = None):
     user = await get_current_user(request)
-    livello = user.get("livello", "Principiante")
-    giorni = user.get("giorni_disponibili", ["Lunedì", "Mercoledì", "Venerdì"])
-    eta = user.get("eta", 72)
-    
-    # Seed exercises if needed
-    count = await db.exercises.count_documents({})
-    if count == 0:
-        for ex in ESERCIZI_DATABASE:
-            await db.exercises.insert_one(ex.copy())
-    
-    exercises = await db.exercises.find({}, {"_id": 0}).to_list(100)
-    
-    # Apply energy level adjustments
-    energia = inputs.energia if inputs else 5
-    serie_mod = -1 if energia < 4 else (1 if energia > 7 else 0)
-    
-    # Filter by focus if specified
-    focus = inputs.focus_muscolare if inputs else None
-    dolori = inputs.dolori_articolari if inputs and inputs.dolori_articolari else []
-    
-    # Exercises to avoid based on joint pain
-    avoid_exercises = set()
-    if "ginocchia" in dolori:
-        avoid_exercises.update(["ex_squat_sedia", "ex_affondi_supporto", "ex_step_up"])
-    if "spalle" in dolori:
-        avoid_exercises.update(["ex_shoulder_press", "ex_alzate_laterali", "ex_alzate_frontali"])
-    if "schiena" in dolori:
-        avoid_exercises.update(["ex_rematore_manubri", "ex_superman"])
-    
-    plan_giorni = []
-    for i, giorno in enumerate(giorni):
-        if i % 2 == 0:
-            # Walking day
-            dur = 25 if energia < 4 else (35 if energia > 7 else 30)
-            if livello != "Principiante":
-                dur += 10
-            dist = round(dur * 0.08, 1)  # ~5 km/h average
-            plan_giorni.append({
-                "giorno": giorno, "tipo": "camminata",
-                "attivita": [{"nome": "Camminata", "durata_minuti": dur, "distanza_km": dist, "note": "Passo moderato"}],
-            })
-        else:
-            # Circuit day - select exercises by category rotation
-            if focus:
-                available = [e for e in exercises 
-                           if e.get("categoria") in focus 
-                           and e.get("exercise_id") not in avoid_exercises]
-            else:
-                # Default rotation through categories
-                categorie_rotazione = ["Gambe", "Core", "Braccia", "Spalle", "Petto", "Schiena"]
-                cat_oggi = categorie_rotazione[(i // 2) % len(categorie_rotazione)]
-                cat_secondaria = categorie_rotazione[((i // 2) + 1) % len(categorie_rotazione)]
-                available = [e for e in exercises 
-                           if e.get("categoria") in [cat_oggi, cat_secondaria, "Cardio"]
-                           and e.get("exercise_id") not in avoid_exercises]
-            
-            # Select exercises based on level
-            num_esercizi = 4 if livello == "Principiante" else 6
-            selected = available[:num_esercizi] if len(available) >= num_esercizi else available
-            
-            # Adjust series based on level and energy
-            base_serie = 2 if livello == "Principiante" else 3
-            serie_finale = max(1, base_serie + serie_mod)
-            
-            plan_giorni.append({
-                "giorno": giorno, "tipo": "circuito",
-                "attivita": [{
-                    "exercise_id": ex["exercise_id"], 
-                    "nome": ex["nome"],
-                    "categoria": ex.get("categoria", ""),
-                    "serie": min(serie_finale, ex.get("serie_default", 3)),
-                    "ripetizioni": ex.get("ripetizioni_default", 12),
-                    "peso_kg": ex.get("peso_default", 0),
-                    "descrizione": ex.get("descrizione_tecnica", ""),
-                    "note": ex.get("note_sicurezza", ""),
-                    "varianti": ex.get("varianti", {}),
-                } for ex in selected],
-            })
-    plan_doc = {
-        "plan_id": f"plan_{uuid.uuid4().hex[:12]}", "user_id": user["user_id"],
-        "nome": f"Piano Auto - Fascia {eta}", "tipo": "automatico",
-        "giorni": plan_giorni, "attivo": True,
-        "created_at": datetime.now(timezone.utc).isoformat(),
-    }
-    await db.plans.update_many({"user_id": user["user_id"]}, {"$set": {"attivo": False}})
-    await db.plans.insert_one(plan_doc)
-    plan_doc.pop("_id", None)
+    inputs = inputs or WorkoutGeneratorInput()
+    plan_inputs = plan_generator.user_inputs(user, inputs.energia, inputs.focus_muscolare, inputs.dolori_articolari)
+    plan_doc = plan_generator.plan_document(user, plan_inputs, datetime.now(timezone.utc))
+    await repos.plans.insert_active(plan_doc)
+    await data_changed(user["user_id"])
     return plan_doc
 
-@app.put("/api/plans/{plan_id}/exercise")
+# ===== ADMIN =====
+
+# Empty disables the admin endpoints, /api/metrics included
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+PLAN_BATCH_MAX = 10000
+
+class PlanBatchRequest(BaseModel):
+    user_ids: List[str] = Field(max_length=PLAN_BATCH_MAX)
+    inputs: Dict[str, WorkoutGeneratorInput] = {}  # per-user options, by user_id
+
+def require_admin(request: Request) -> None:
+    token = request.headers.get("X-Admin-Token", "")
+    if not ADMIN_TOKEN or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Accesso riservato agli amministratori")
+
+@app.post("/api/admin/plans/generate-batch")
+async def generate_plans_batch(request: Request, batch: PlanBatchRequest):
+    """New active plan for every listed user (care homes, coaches); generation runs in plan_pool's processes."""
+    require_admin(request)
+    require_mongo()
+    inputs = {uid: i.dict() for uid, i in batch.inputs.items()}
+    return await plan_batch.generate_batch(db, batch.user_ids, inputs, plan_pool.executor, on_generated=data_changed)
+
+INVALID_INDEX_DETAIL = {"giorno": "Indice giorno non valido", "esercizio": "Indice esercizio non valido"}
+
+async def edit_plan(user_id: str, plan_id: str, edits: List[dict]) -> dict:
+    """Apply ``edits`` to the plan in one atomic positional write; returns the updated plan."""
+    negative = plan_edits.negative_index(edits)
+    if negative:
+        raise HTTPException(status_code=400, detail=INVALID_INDEX_DETAIL[negative])
+    conditions, fields = plan_edits.edit_operations(edits)
+    plan = await repos.plans.edit(plan_id, user_id, conditions, fields)
+    if plan is None:
+        # Either the plan is missing or an edited exercise is: one more read tells which
+        current = await repos.plans.get(plan_id, user_id)
+        if not current:
+            raise HTTPException(status_code=404, detail="Piano non trovato")
+        raise HTTPException(status_code=400, detail=INVALID_INDEX_DETAIL[plan_edits.invalid_index(current, edits) or "esercizio"])
+    if fields:
+        await data_changed(user_id)
+    return plan
+
+@app.put("/api/plans/{plan_id}/exercise", response_model=PlanOut)
 async def update_plan_exercise(request: Request, plan_id: str, update: PlanExerciseUpdate):
     user = await get_current_user(request)
-    plan = await db.plans.find_one({"plan_id": plan_id, "user_id": user["user_id"]}, {"_id": 0})
-    if not plan:
-        raise HTTPException(status_code=404, detail="Piano non trovato")
-    giorni = plan.get("giorni", [])
-    if update.giorno_index < 0 or update.giorno_index >= len(giorni):
-        raise HTTPException(status_code=400, detail="Indice giorno non valido")
-    attivita = giorni[update.giorno_index].get("attivita", [])
-    if update.exercise_index < 0 or update.exercise_index >= len(attivita):
-        raise HTTPException(status_code=400, detail="Indice esercizio non valido")
-    ex = attivita[update.exercise_index]
-    if update.serie is not None: ex["serie"] = update.serie
-    if update.ripetizioni is not None: ex["ripetizioni"] = update.ripetizioni
-    if update.peso_kg is not None: ex["peso_kg"] = update.peso_kg
-    if update.nome is not None: ex["nome"] = update.nome
-    if update.note is not None: ex["note"] = update.note
-    await db.plans.update_one({"plan_id": plan_id}, {"$set": {"giorni": giorni}})
-    updated_plan = await db.plans.find_one({"plan_id": plan_id}, {"_id": 0})
-    return updated_plan
+    return await edit_plan(user["user_id"], plan_id, [update.dict()])
+
+@app.put("/api/plans/{plan_id}/exercises", response_model=PlanOut)
+async def update_plan_exercises(request: Request, plan_id: str, batch: PlanExercisesUpdate):
+    """Several exercise edits applied together: all of them or, on an invalid index, none."""
+    user = await get_current_user(request)
+    return await edit_plan(user["user_id"], plan_id, [u.dict() for u in batch.modifiche])
 
 # ===== STATS (ENHANCED) =====
 
-@app.get("/api/stats")
-async def get_stats(request: Request):
+# "rollup" reads the daily_rollups collection, "aggregate" runs $facet pipelines in MongoDB,
+# "scan" recomputes everything in Python from the raw documents
+STATS_BACKEND = os.environ.get("STATS_BACKEND", "rollup" if STORAGE_BACKEND == "mongo" else "scan")
+
+async def scan_activity(collection: str, uid: str, plan: stats_engine.CollectionPlan, now: datetime) -> list:
+    """Walks or circuits the scan backend needs for a stats request, newest first."""
+    if not plan.load:
+        return []
+    exclude = ("percorso", "note") if plan.sets else ("percorso", "note", "esercizi")
+    repo = getattr(repos, collection)
+    if plan.full:
+        return await repo.newest(uid, None, 1000, exclude)
+    docs = []
+    if plan.days:
+        docs = await repo.newest(uid, plan.since(now), 1000, exclude)
+    if plan.recent and len(docs) < stats_engine.CHART_POINTS:
+        # The window holds fewer documents than a chart, so the newest ones cover both
+        docs = await repo.newest(uid, None, stats_engine.CHART_POINTS, exclude)
+    return docs
+
+@app.get("/api/stats", response_model=StatsOut)
+async def get_stats(request: Request, sections: Optional[str] = None):
     user = await get_current_user(request)
     uid = user["user_id"]
-    walks = await db.walks.find({"user_id": uid}, {"_id": 0}).sort("data", -1).to_list(1000)
-    circuits = await db.circuits.find({"user_id": uid}, {"_id": 0}).sort("data", -1).to_list(1000)
-
+    try:
+        wanted = stats_engine.parse_sections(sections)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Sezioni sconosciute: {e}")
     now = datetime.now(timezone.utc)
-    week_ago = (now - timedelta(days=7)).isoformat()
-    month_ago = (now - timedelta(days=30)).isoformat()
-
-    # Totals
-    total_km = sum(w.get("distanza_km", 0) for w in walks)
-    total_passi = sum(w.get("passi", 0) for w in walks)
-    total_walk_time = sum(w.get("tempo_secondi", 0) for w in walks)
-    total_circuits = len(circuits)
-    total_circuit_time = sum(c.get("durata_minuti", 0) for c in circuits)
-    total_volume = 0
-    exercise_volumes = {}
-    for c in circuits:
-        for ex in c.get("esercizi", []):
-            for s in ex.get("sets", []):
-                if s.get("completato", False):
-                    vol = s.get("ripetizioni", 0) * s.get("peso_kg", 0)
-                    total_volume += vol
-                    eid = ex.get("exercise_id", ex.get("nome", ""))
-                    exercise_volumes[eid] = exercise_volumes.get(eid, 0) + vol
-            # Legacy support
-            if not ex.get("sets"):
-                legacy_s = ex.get("serie", 0)
-                legacy_r = ex.get("ripetizioni", 0)
-                legacy_p = ex.get("peso_kg", 0)
-                vol = legacy_s * legacy_r * legacy_p
-                total_volume += vol
-                eid = ex.get("exercise_id", ex.get("nome", ""))
-                exercise_volumes[eid] = exercise_volumes.get(eid, 0) + vol
-
-    # Weekly
-    ww = [w for w in walks if w.get("data", "") >= week_ago]
-    wc = [c for c in circuits if c.get("data", "") >= week_ago]
-    weekly_km = sum(w.get("distanza_km", 0) for w in ww)
-    weekly_passi = sum(w.get("passi", 0) for w in ww)
-
-    # Monthly
-    mw = [w for w in walks if w.get("data", "") >= month_ago]
-    mc = [c for c in circuits if c.get("data", "") >= month_ago]
-    monthly_km = sum(w.get("distanza_km", 0) for w in mw)
-
-    # Records
-    best_km = max((w.get("distanza_km", 0) for w in walks), default=0)
-    best_passi = max((w.get("passi", 0) for w in walks), default=0)
-    best_velocita = max((w.get("velocita_media_kmh", 0) for w in walks), default=0)
-    longest_walk_sec = max((w.get("tempo_secondi", 0) for w in walks), default=0)
-
-    # Derived Stats
-    avg_km_per_walk = round(total_km / max(len(walks), 1), 2)
-    avg_speed = round(sum(w.get("velocita_media_kmh", 0) for w in walks) / max(len(walks), 1), 1)
-    avg_circuit_time = round(total_circuit_time / max(total_circuits, 1), 1)
-    total_calories_walk = round(total_km * 60)  # ~60 cal/km for seniors
-    total_calories_circuit = round(total_circuit_time * 5)  # ~5 cal/min
-    total_calories = total_calories_walk + total_calories_circuit
-    total_active_days = len(set([w.get("data", "")[:10] for w in walks] + [c.get("data", "")[:10] for c in circuits]))
-    streak = 0
-    for i in range(30):
-        day = (now - timedelta(days=i)).strftime("%Y-%m-%d")
-        day_walks = [w for w in walks if w.get("data", "")[:10] == day]
-        day_circuits = [c for c in circuits if c.get("data", "")[:10] == day]
-        if day_walks or day_circuits:
-            streak += 1
-        else:
-            break
-
-    # Per-exercise best
-    ex_bests = {}
-    for c in circuits:
-        for ex in c.get("esercizi", []):
-            eid = ex.get("exercise_id", ex.get("nome", ""))
-            for s in ex.get("sets", []):
-                if s.get("completato"):
-                    curr = ex_bests.get(eid, {"max_peso": 0, "max_reps": 0})
-                    curr["max_peso"] = max(curr["max_peso"], s.get("peso_kg", 0))
-                    curr["max_reps"] = max(curr["max_reps"], s.get("ripetizioni", 0))
-                    ex_bests[eid] = curr
-
-    # Chart data
-    chart_walks = [{"data": w.get("data", "")[:10], "km": w.get("distanza_km", 0), "passi": w.get("passi", 0), "velocita": w.get("velocita_media_kmh", 0), "tempo_min": round(w.get("tempo_secondi", 0) / 60, 1)} for w in walks[:30]]
-    chart_circuits = []
-    for c in circuits[:30]:
-        vol = 0
-        for ex in c.get("esercizi", []):
-            for s in ex.get("sets", []):
-                if s.get("completato"):
-                    vol += s.get("ripetizioni", 0) * s.get("peso_kg", 0)
-            if not ex.get("sets"):
-                vol += ex.get("serie", 0) * ex.get("ripetizioni", 0) * ex.get("peso_kg", 0)
-        chart_circuits.append({"data": c.get("data", "")[:10], "volume": round(vol, 1), "durata": c.get("durata_minuti", 0), "esercizi_completati": len(c.get("esercizi", []))})
-
-    # Daily aggregation for last 14 days
-    daily_data = []
-    for i in range(14):
-        day = (now - timedelta(days=13-i)).strftime("%Y-%m-%d")
-        dw = [w for w in walks if w.get("data", "")[:10] == day]
-        dc = [c for c in circuits if c.get("data", "")[:10] == day]
-        daily_data.append({
-            "data": day,
-            "km": round(sum(w.get("distanza_km", 0) for w in dw), 2),
-            "passi": sum(w.get("passi", 0) for w in dw),
-            "circuiti": len(dc),
-            "calorie": round(sum(w.get("distanza_km", 0) for w in dw) * 60 + sum(c.get("durata_minuti", 0) for c in dc) * 5),
-        })
 
-    return {
-        "totale": {
-            "km": round(total_km, 1), "passi": total_passi,
-            "tempo_camminata_min": round(total_walk_time / 60, 1),
-            "allenamenti_circuito": total_circuits, "tempo_circuito_min": total_circuit_time,
-            "volume_totale_kg": round(total_volume, 1), "calorie_stimate": total_calories,
-            "giorni_attivi": total_active_days, "camminate_totali": len(walks),
-        },
-        "settimanale": {
-            "km": round(weekly_km, 1), "passi": weekly_passi,
-            "camminate": len(ww), "circuiti": len(wc),
-        },
-        "mensile": {"km": round(monthly_km, 1), "camminate": len(mw), "circuiti": len(mc)},
-        "record": {
-            "best_km": round(best_km, 1), "best_passi": best_passi,
-            "best_velocita": round(best_velocita, 1),
-            "camminata_piu_lunga_min": round(longest_walk_sec / 60, 1),
-        },
-        "medie": {
-            "km_per_camminata": avg_km_per_walk, "velocita_media": avg_speed,
-            "durata_circuito_media": avg_circuit_time,
-        },
-        "streak": streak,
-        "volume_per_esercizio": exercise_volumes,
-        "record_esercizi": ex_bests,
-        "grafici_camminate": list(reversed(chart_walks)),
-        "grafici_circuiti": list(reversed(chart_circuits)),
-        "grafici_giornalieri": daily_data,
-    }
+    async def load():
+        if STATS_BACKEND == "rollup":
+            # Users from before the rollups (or an older ROLLUP_VERSION) get them built on first read
+            if await rollups.ensure_user(db, user):
+                session_cache.invalidate_user(uid)
+            return await rollups.load_stats(db, uid, now, wanted)
+        if STATS_BACKEND == "aggregate":
+            return await stats_aggregation.load_stats(db, uid, now, wanted)
+        plans = stats_engine.plan_sections(wanted)
+        walks = await scan_activity("walks", uid, plans["walks"], now)
+        circuits = await scan_activity("circuits", uid, plans["circuits"], now)
+        return stats_engine.compute_stats(walks, circuits, now, wanted)
+
+    # The UTC day is part of the key so the daily chart and the streak roll over at midnight
+    return await cached_user_response(request, uid, ("stats", wanted, now.strftime("%Y-%m-%d")), load)
 
 # ===== SFIDE GOAT =====
 
@@ -580,13 +668,12 @@ SFIDE_TEMPLATES = [
     {"tipo": "calorie", "nome": "Brucia-calorie GOAT", "descrizione": "Brucia {target} calorie in una settimana", "target_field": "calorie", "targets": {"facile": 300, "medio": 600, "difficile": 1000}, "durata_giorni": 7, "icona": "flame"},
 ]
 
-@app.get("/api/sfide")
-async def get_sfide(request: Request):
-    user = await get_current_user(request)
-    sfide = await db.sfide.find({"user_id": user["user_id"]}, {"_id": 0}).sort("created_at", -1).to_list(50)
-    return sfide
+@app.get("/api/sfide", response_model=List[SfidaOut])
+async def get_sfide(request: Request, cursor: Optional[str] = None,
+                    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_LIMIT), fields: Optional[str] = None):
+    return await list_page(request, "sfide", cursor, limit, fields)
 
-@app.post("/api/sfide/generate")
+@app.post("/api/sfide/generate", response_model=List[SfidaOut])
 async def generate_sfide(request: Request):
     user = await get_current_user(request)
     livello = user.get("livello", "Principiante")
@@ -611,53 +698,31 @@ async def generate_sfide(request: Request):
             "created_at": datetime.now(timezone.utc).isoformat(),
             "scadenza": (datetime.now(timezone.utc) + timedelta(days=tmpl["durata_giorni"])).isoformat(),
         }
-        await db.sfide.insert_one(sfida.copy())
-        sfida.pop("_id", None)
         new_sfide.append(sfida)
+    await repos.sfide.insert_many(new_sfide)
+    await data_changed(user["user_id"])
     return new_sfide
 
-@app.post("/api/sfide/check-progress")
+@app.post("/api/sfide/check-progress", response_model=List[SfidaOut])
 async def check_sfide_progress(request: Request):
     user = await get_current_user(request)
     uid = user["user_id"]
     now = datetime.now(timezone.utc)
-    sfide = await db.sfide.find({"user_id": uid, "completata": False}, {"_id": 0}).to_list(50)
-    week_ago = (now - timedelta(days=7)).isoformat()
-    walks = await db.walks.find({"user_id": uid, "data": {"$gte": week_ago}}, {"_id": 0}).to_list(100)
-    circuits = await db.circuits.find({"user_id": uid, "data": {"$gte": week_ago}}, {"_id": 0}).to_list(100)
-    weekly_km = sum(w.get("distanza_km", 0) for w in walks)
-    weekly_passi = sum(w.get("passi", 0) for w in walks)
-    weekly_circuits = len(circuits)
-    weekly_volume = 0
-    for c in circuits:
-        for ex in c.get("esercizi", []):
-            for s in ex.get("sets", []):
-                if s.get("completato"): weekly_volume += s.get("ripetizioni", 0) * s.get("peso_kg", 0)
-            if not ex.get("sets"):
-                weekly_volume += ex.get("serie", 0) * ex.get("ripetizioni", 0) * ex.get("peso_kg", 0)
-    best_speed = max((w.get("velocita_media_kmh", 0) for w in walks), default=0)
-    weekly_cal = round(weekly_km * 60 + sum(c.get("durata_minuti", 0) for c in circuits) * 5)
-    # Streak
-    streak = 0
-    for i in range(30):
-        day = (now - timedelta(days=i)).strftime("%Y-%m-%d")
-        if any(w.get("data", "")[:10] == day for w in walks) or any(c.get("data", "")[:10] == day for c in circuits):
-            streak += 1
-        else: break
-    field_map = {"km": weekly_km, "passi": weekly_passi, "circuiti": weekly_circuits, "volume": weekly_volume, "streak": streak, "velocita": best_speed, "calorie": weekly_cal}
-    updated = []
-    for s in sfide:
-        if s.get("scadenza", "") < now.isoformat():
-            await db.sfide.update_one({"sfida_id": s["sfida_id"]}, {"$set": {"scaduta": True}})
-            continue
-        cv = field_map.get(s.get("target_field", ""), 0)
-        completata = cv >= s.get("target_value", 0)
-        await db.sfide.update_one({"sfida_id": s["sfida_id"]}, {"$set": {"current_value": round(cv, 1), "completata": completata}})
-        s["current_value"] = round(cv, 1)
-        s["completata"] = completata
-        updated.append(s)
+    updated, changed = await repos.sfide.check_progress(uid, now)
+    # Only a real change invalidates, so the poll before every /api/sfide keeps that response cached
+    if changed:
+        await data_changed(uid)
     return updated
 
 @app.get("/api/health")
 async def health():
     return {"status": "ok", "app": "Walt the GOAT"}
+
+@app.get("/api/metrics")
+async def metrics(request: Request):
+    """Cache, job and upstream counters; admin only, as they expose internal state."""
+    require_admin(request)
+    return {"session_cache": session_cache.stats(), "response_cache": response_cache.stats(),
+            "progress_engine": progress_engine.stats(), "scheduler": scheduler.stats(),
+            "plan_generator": plan_generator.cache_stats(), "session_exchange": session_exchange.stats(),
+            "compression": compressor.stats()}
@@ -0,0 +1,80 @@
+"""In-process cache of resolved sessions for get_current_user.
+
+Entries are keyed by session token and hold the user document the token
+resolved to. An entry lives for at most ``ttl`` seconds and never past the
+session's own expiry; the least recently used entry is evicted once
+``maxsize`` is reached. Handlers that change a user document or drop a
+session must invalidate the affected entries.
+"""
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+
+class SessionCache:
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # token -> (user_doc, deadline)
+        self._tokens_by_user: Dict[str, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, session_token: str) -> Optional[dict]:
+        entry = self._entries.get(session_token)
+        if entry is None:
+            self.misses += 1
+            return None
+        user_doc, deadline = entry
+        if deadline <= time.monotonic():
+            self._drop(session_token)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(session_token)
+        self.hits += 1
+        return dict(user_doc)
+
+    def put(self, session_token: str, user_doc: dict, expires_in: float) -> None:
+        """Cache ``user_doc`` for ``session_token``; ``expires_in`` is the session's remaining lifetime in seconds."""
+        if self.maxsize <= 0:
+            return
+        lifetime = min(self.ttl, expires_in)
+        if lifetime <= 0:
+            return
+        if session_token in self._entries:
+            self._drop(session_token)
+        self._entries[session_token] = (dict(user_doc), time.monotonic() + lifetime)
+        self._tokens_by_user.setdefault(user_doc["user_id"], set()).add(session_token)
+        while len(self._entries) > self.maxsize:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def invalidate_token(self, session_token: str) -> None:
+        if session_token in self._entries:
+            self._drop(session_token)
+
+    def invalidate_user(self, user_id: str) -> None:
+        for token in self._tokens_by_user.pop(user_id, set()):
+            self._entries.pop(token, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._tokens_by_user.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries), "maxsize": self.maxsize, "ttl_secondi": self.ttl,
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+    def _drop(self, session_token: str) -> None:
+        user_doc, _ = self._entries.pop(session_token)
+        tokens = self._tokens_by_user.get(user_doc["user_id"])
+        if tokens is not None:
+            tokens.discard(session_token)
+            if not tokens:
+                del self._tokens_by_user[user_doc["user_id"]]
@@ -0,0 +1,179 @@
+"""Exchange of the OAuth session_id for the user's session data.
+
+/api/auth/session goes through one SessionExchange for the life of the
+app, opened and closed by the FastAPI lifespan. It owns a single
+httpx.AsyncClient, so logins reuse keep-alive connections from a bounded
+pool instead of paying a TCP+TLS handshake each.
+
+Every call has explicit connect/read timeouts. Transport errors, timeouts,
+429 and 5xx answers are retried up to ``retries`` times, with exponential
+backoff and jitter. Any other 4xx means the session_id is invalid and is
+not retried. A CircuitBreaker counts the calls that failed after their
+retries. After ``failure_threshold`` in a row it opens and fails logins
+fast for ``reset_after`` seconds; then it lets one trial call through.
+Any other exception out of the client counts as a failure too, and a
+cancelled trial gives its slot back, so the breaker never stays stuck in
+half-open with no call in flight.
+
+The URL comes from AUTH_SESSION_DATA_URL, so load tests can point it at
+benchmarks/session_stub.py.
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Callable, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_URL = "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data"
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class InvalidSession(Exception):
+    """The upstream rejected the session_id."""
+
+
+class UpstreamUnavailable(Exception):
+    """The upstream did not answer, even after the retries, or the breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_after: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial = False  # a half-open trial call is in flight
+        self.opens = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if self.clock() - self.opened_at >= self.reset_after else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial:
+            self.trial = True
+            return True
+        return False
+
+    def release_trial(self) -> None:
+        """Give back the trial slot of a call that ended without an outcome (cancelled)."""
+        self.trial = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.trial or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self.trial:
+                self.opens += 1
+            self.opened_at = self.clock()
+            self.trial = False
+
+
+class SessionExchange:
+    def __init__(self, url: str = DEFAULT_URL, connect_timeout: float = 3.0, read_timeout: float = 5.0,
+                 retries: int = 2, backoff: float = 0.2, max_connections: int = 50, keepalive: float = 30.0,
+                 breaker: Optional[CircuitBreaker] = None, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.url = url
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self._client_options = dict(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                                keepalive_expiry=keepalive),
+            transport=transport,
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self.requests = 0
+        self.attempts = 0
+        self.retried = 0
+        self.invalid = 0
+        self.failures = 0
+        self.rejected = 0
+        self.total_ms = 0.0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created on first use as well, for callers that skip the lifespan
+        if self._client is None:
+            self._client = httpx.AsyncClient(**self._client_options)
+        return self._client
+
+    async def start(self) -> None:
+        self.client
+
+    async def stop(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _delay(self, attempt: int) -> float:
+        return self.backoff * 2 ** attempt * random.uniform(0.5, 1.0)
+
+    async def _get(self, session_id: str) -> httpx.Response:
+        """The upstream answer, retrying transient failures; raises UpstreamUnavailable when they persist."""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+                await asyncio.sleep(self._delay(attempt - 1))
+            self.attempts += 1
+            try:
+                resp = await self.client.get(self.url, headers={"X-Session-ID": session_id})
+            except httpx.TransportError as e:
+                logger.warning("session exchange: tentativo %d fallito: %r", attempt + 1, e)
+                continue
+            if resp.status_code not in RETRY_STATUSES:
+                return resp
+            logger.warning("session exchange: tentativo %d, risposta %d", attempt + 1, resp.status_code)
+        raise UpstreamUnavailable()
+
+    async def fetch(self, session_id: str) -> dict:
+        """Session data for ``session_id``; raises InvalidSession or UpstreamUnavailable."""
+        self.requests += 1
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise UpstreamUnavailable()
+        trial = self.breaker.trial  # allow() just gave this call the half-open trial
+        t0 = time.perf_counter()
+        try:
+            resp = await self._get(session_id)
+        except Exception as e:
+            if not isinstance(e, UpstreamUnavailable):
+                logger.exception("session exchange: errore inatteso")
+            self.failures += 1
+            self.breaker.record_failure()
+            raise
+        finally:
+            self.total_ms += (time.perf_counter() - t0) * 1000
+            if trial:
+                # Already cleared by record_failure; still held when cancelled
+                self.breaker.release_trial()
+        # Any answer, even a rejection, shows the upstream is up
+        self.breaker.record_success()
+        if resp.status_code != 200:
+            self.invalid += 1
+            raise InvalidSession()
+        return resp.json()
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url, "requests": self.requests, "attempts": self.attempts, "retried": self.retried,
+            "invalid": self.invalid, "failures": self.failures, "rejected": self.rejected,
+            "breaker": self.breaker.state, "breaker_opens": self.breaker.opens,
+            "avg_ms": round(self.total_ms / (self.requests - self.rejected), 2) if self.requests > self.rejected else 0.0,
+        }
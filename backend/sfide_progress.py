@@ -0,0 +1,224 @@
+"""Progress of the open challenges (sfide).
+
+A challenge counts the activity from its created_at until its scadenza.
+Progress is kept current incrementally: every new walk or circuit becomes
+an ActivityEvent that progress_engine applies with ``apply_activity``:
+- additive metrics get an ``$inc`` of the activity's contribution, only on
+  the challenges whose ``applied`` ids don't hold the activity yet, and the
+  id is added in the same update, so an event applied twice counts once;
+- velocita gets a ``$max``;
+- streak is recomputed from the day calendar in daily_rollups;
+- in the same ordered bulk_write, open challenges that reached their
+  target are marked completata.
+So reading the challenges is a single indexed query.
+
+/api/sfide/check-progress (``check_progress``) recomputes everything from
+the walks and circuits. It repairs events lost to a restart and flags the
+expired challenges. Only the metrics referenced by the open challenges are
+computed, only the collections and fields they read are loaded, and the
+changes go into a single unordered bulk_write. A challenge whose progress,
+rounded to one decimal as it is written, did not change is not written. The write sets ``applied`` to the ids it
+counted, so a later event for one of them is a no-op, and it is made only
+while current_value is still the one it read: an event applied in the
+meantime keeps its own value rather than being overwritten.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from pymongo import UpdateMany, UpdateOne
+
+import rollups
+import stats_engine
+
+OPEN_LIMIT = 50
+WINDOW_DAYS = 7  # challenges without created_at read the last week
+DOC_LIMIT = 100  # walks and circuits read per collection, newest first
+ADDITIVE = ("km", "passi", "circuiti", "volume", "calorie")
+MAXIMUM = ("velocita",)
+
+
+def is_expired(sfida: dict, now: datetime) -> bool:
+    return sfida.get("scadenza", "") < now.isoformat()
+
+
+def needed_metrics(sfide: Iterable[dict]) -> Set[str]:
+    """Known target_fields of ``sfide``; unknown ones always read 0."""
+    return {s.get("target_field") for s in sfide} & set(stats_engine.CHALLENGE_NEEDS)
+
+
+def window_start(sfida: dict, now: datetime) -> str:
+    """Lower bound on ``data`` of the activity ``sfida`` counts; streak counts whole days."""
+    start = sfida.get("created_at") or (now - timedelta(days=WINDOW_DAYS)).isoformat()
+    return start[:10] if sfida.get("target_field") == "streak" else start
+
+
+# ===== EVENTS =====
+
+class ActivityEvent(NamedTuple):
+    user_id: str
+    data: str
+    values: Dict[str, float]  # contribution to each metric
+    activity_id: Optional[str] = None  # walk_id or circuit_id
+
+
+def activity_ids(walks: List[dict], circuits: List[dict]) -> List[str]:
+    return [w["walk_id"] for w in walks if w.get("walk_id")] + [c["circuit_id"] for c in circuits if c.get("circuit_id")]
+
+
+def walk_event(walk: dict) -> ActivityEvent:
+    km = walk.get("distanza_km", 0)
+    return ActivityEvent(walk["user_id"], walk["data"], {
+        "km": km, "passi": walk.get("passi", 0), "velocita": walk.get("velocita_media_kmh", 0),
+        "calorie": km * stats_engine.CAL_PER_KM,
+    }, walk.get("walk_id"))
+
+
+def circuit_event(circuit: dict) -> ActivityEvent:
+    return ActivityEvent(circuit["user_id"], circuit["data"], {
+        "circuiti": 1, "volume": stats_engine.exercise_volumes(circuit.get("esercizi", []))[0],
+        "calorie": circuit.get("durata_minuti", 0) * stats_engine.CAL_PER_CIRCUIT_MIN,
+    }, circuit.get("circuit_id"))
+
+
+def activity_updates(event: ActivityEvent) -> List[UpdateMany]:
+    """Ordered updates applying ``event`` to the open challenges whose window contains it."""
+    def open_for(field) -> dict:
+        return {"user_id": event.user_id, "completata": False, "scaduta": {"$ne": True}, "target_field": field,
+                "created_at": {"$lte": event.data}, "scadenza": {"$gt": event.data}}
+
+    ops = []
+    for field, value in event.values.items():
+        if field in ADDITIVE and value:
+            # Each challenge has one target_field, so it matches at most one of these
+            query, update = open_for(field), {"$inc": {"current_value": value}}
+            if event.activity_id:
+                query["applied"] = {"$ne": event.activity_id}
+                update["$addToSet"] = {"applied": event.activity_id}
+            ops.append(UpdateMany(query, update))
+        elif field in MAXIMUM:
+            ops.append(UpdateMany(open_for(field), {"$max": {"current_value": value}}))
+    if ops:
+        reached = open_for({"$in": list(event.values)})
+        reached["$expr"] = {"$gte": ["$current_value", "$target_value"]}
+        ops.append(UpdateMany(reached, {"$set": {"completata": True}}))
+    return ops
+
+
+async def apply_streaks(db, event: ActivityEvent) -> int:
+    """Recompute the open streak challenges from the day calendar; returns the number updated."""
+    query = {"user_id": event.user_id, "completata": False, "scaduta": {"$ne": True}, "target_field": "streak",
+             "scadenza": {"$gt": event.data}}
+    projection = {"_id": 0, "sfida_id": 1, "target_field": 1, "created_at": 1, "target_value": 1, "current_value": 1}
+    sfide = await db.sfide.find(query, projection).to_list(OPEN_LIMIT)
+    if not sfide:
+        return 0
+    now = datetime.fromisoformat(event.data)
+    starts = {s["sfida_id"]: window_start(s, now) for s in sfide}
+    days = await db[rollups.ROLLUP_COLLECTION].find(
+        {"user_id": event.user_id, "giorno": {"$gte": min(starts.values())}}, {"_id": 0, "giorno": 1}).to_list(None)
+    ops = []
+    for s in sfide:
+        value = stats_engine.streak({d["giorno"] for d in days if d["giorno"] >= starts[s["sfida_id"]]}, now)
+        completata = value >= s.get("target_value", 0)
+        if value != s.get("current_value") or completata:
+            ops.append(UpdateOne({"sfida_id": s["sfida_id"]}, {"$set": {"current_value": value, "completata": completata}}))
+    if ops:
+        await db.sfide.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+async def apply_activity(db, event: ActivityEvent) -> bool:
+    """Apply one activity to the open challenges of its user; returns whether any changed."""
+    changed = False
+    ops = activity_updates(event)
+    if ops:
+        result = await db.sfide.bulk_write(ops, ordered=True)
+        changed = result.modified_count > 0
+    return await apply_streaks(db, event) > 0 or changed
+
+
+# ===== RECOMPUTE =====
+
+def progress_values(sfide: List[dict], walks: List[dict], circuits: List[dict], now: datetime) -> Dict[str, float]:
+    """Value of each challenge over the activity of its own window, by sfida_id."""
+    values = {}
+    for s in sfide:
+        field = s.get("target_field", "")
+        if field not in stats_engine.CHALLENGE_NEEDS:
+            values[s["sfida_id"]] = 0
+            continue
+        start = window_start(s, now)
+        metrics = stats_engine.challenge_metrics([w for w in walks if w.get("data", "") >= start],
+                                                 [c for c in circuits if c.get("data", "") >= start], now, {field})
+        values[s["sfida_id"]] = metrics[field]
+    return values
+
+
+def applied_ids(sfide: List[dict], walks: List[dict], circuits: List[dict], now: datetime) -> Dict[str, List[str]]:
+    """Ids of the activity in the window of each challenge, by sfida_id."""
+    applied = {}
+    for s in sfide:
+        start = window_start(s, now)
+        applied[s["sfida_id"]] = activity_ids([w for w in walks if w.get("data", "") >= start],
+                                              [c for c in circuits if c.get("data", "") >= start])
+    return applied
+
+
+def evaluate(sfide: List[dict], values: Dict[str, float], now: datetime,
+             applied: Optional[Dict[str, List[str]]] = None) -> Tuple[List[UpdateOne], List[dict]]:
+    """(write ops for the challenges that changed, open challenges with their new progress).
+
+    ``applied`` maps a sfida_id to the activity ids its value counts.
+    """
+    ops = []
+    updated = []
+    for s in sfide:
+        if is_expired(s, now):
+            if not s.get("scaduta"):
+                ops.append(UpdateOne({"sfida_id": s["sfida_id"]}, {"$set": {"scaduta": True}}))
+            continue
+        cv = round(values.get(s["sfida_id"], 0), 1)
+        completata = cv >= s.get("target_value", 0)
+        # Events $inc the unrounded contributions: compare at the precision written here
+        stored = s.get("current_value")
+        if stored is None or round(stored, 1) != cv or s.get("completata") != completata:
+            changes = {"current_value": cv, "completata": completata}
+            if applied is not None:
+                # Kept out of ``s``: the ids are bookkeeping, not part of the response
+                changes["applied"] = applied.get(s["sfida_id"], [])
+            ops.append(UpdateOne({"sfida_id": s["sfida_id"], "current_value": s.get("current_value")}, {"$set": changes}))
+        s["current_value"] = cv
+        s["completata"] = completata
+        updated.append(s)
+    return ops, updated
+
+
+async def load_activity(db, user_id: str, metrics: Set[str], since: str) -> Tuple[List[dict], List[dict]]:
+    """The newest DOC_LIMIT walks and circuits from ``since`` on, restricted to what ``metrics`` read."""
+    needs = [stats_engine.CHALLENGE_NEEDS[m] for m in metrics]
+    query = {"user_id": user_id, "data": {"$gte": since}}
+    walks = circuits = []
+    if any(n.walks for n in needs):
+        projection = {"_id": 0, "walk_id": 1, "data": 1, "distanza_km": 1, "passi": 1, "velocita_media_kmh": 1}
+        walks = await db.walks.find(query, projection).sort("data", -1).limit(DOC_LIMIT).to_list(DOC_LIMIT)
+    if any(n.circuits for n in needs):
+        projection = {"_id": 0, "circuit_id": 1, "data": 1, "durata_minuti": 1}
+        if any(n.sets for n in needs):
+            projection["esercizi"] = 1
+        circuits = await db.circuits.find(query, projection).sort("data", -1).limit(DOC_LIMIT).to_list(DOC_LIMIT)
+    return walks, circuits
+
+
+async def check_progress(db, user_id: str, now: datetime) -> Tuple[List[dict], bool]:
+    """Recompute the open challenges of ``user_id``; returns (open challenges, whether anything was written)."""
+    sfide = await db.sfide.find({"user_id": user_id, "completata": False}, {"_id": 0, "applied": 0}).to_list(OPEN_LIMIT)
+    active = [s for s in sfide if not is_expired(s, now)]
+    walks = circuits = []
+    if active:
+        since = min(window_start(s, now) for s in active)
+        walks, circuits = await load_activity(db, user_id, needed_metrics(active), since)
+    values = progress_values(active, walks, circuits, now)
+    ops, updated = evaluate(sfide, values, now, applied_ids(active, walks, circuits, now))
+    if ops:
+        await db.sfide.bulk_write(ops, ordered=False)
+    return updated, bool(ops)
@@ -0,0 +1,187 @@
+"""/api/stats computed inside MongoDB with $facet aggregation pipelines.
+
+Selected with STATS_BACKEND=aggregate. Each collection is aggregated in a
+single pipeline that returns only the numbers the response needs (totals,
+weekly/monthly windows, records, per-day buckets, per-exercise volume and
+the last 30 chart points); GPS routes, notes and raw sets never leave the
+server, and there is no cap on the number of documents considered. Only the
+facets read by the requested sections are run.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from stats_engine import CHART_POINTS, SECTIONS, assemble_stats, chart_circuit, plan_sections
+
+DAY = {"$substrCP": [{"$ifNull": ["$data", ""]}, 0, 10]}
+
+
+def _num(path: str) -> dict:
+    return {"$ifNull": [path, 0]}
+
+
+def _total(array: str, term: dict) -> dict:
+    # Sequential left fold, so float sums accumulate in the same order as the Python engine
+    return {"$reduce": {"input": array, "initialValue": 0, "in": {"$add": ["$$value", term]}}}
+
+
+# facet -> sections that read it
+WALK_FACETS = {
+    "totale": ("totale", "record", "medie"),
+    "settimanale": ("settimanale",),
+    "mensile": ("mensile",),
+    "giorni": ("totale", "streak", "grafici_giornalieri"),
+    "recenti": ("grafici_camminate",),
+}
+CIRCUIT_FACETS = {
+    "totale": ("totale", "medie"),
+    "settimanale": ("settimanale",),
+    "mensile": ("mensile",),
+    "giorni": ("totale", "streak", "grafici_giornalieri"),
+    "per_esercizio": ("volume_per_esercizio", "record_esercizi"),
+    "recenti": ("grafici_circuiti",),
+}
+
+
+def _match(user_id: str, since: Optional[str]) -> dict:
+    query = {"user_id": user_id}
+    if since:
+        query["data"] = {"$gte": since}
+    return {"$match": query}
+
+
+def _select(facets: dict, names: Optional[Iterable[str]]) -> dict:
+    return facets if names is None else {k: v for k, v in facets.items() if k in names}
+
+
+def walk_pipeline(user_id: str, week_ago: str, month_ago: str, facets: Iterable[str] = None, since: str = None) -> list:
+    return [
+        _match(user_id, since),
+        {"$sort": {"data": -1}},
+        {"$project": {"_id": 0, "data": 1, "distanza_km": 1, "passi": 1, "tempo_secondi": 1, "velocita_media_kmh": 1}},
+        {"$facet": _select({
+            "totale": [{"$group": {
+                "_id": None, "camminate": {"$sum": 1}, "km": {"$sum": "$distanza_km"}, "passi": {"$sum": "$passi"},
+                "tempo_camminata_sec": {"$sum": "$tempo_secondi"}, "somma_velocita": {"$sum": "$velocita_media_kmh"},
+                "best_km": {"$max": "$distanza_km"}, "best_passi": {"$max": "$passi"},
+                "best_velocita": {"$max": "$velocita_media_kmh"}, "best_tempo_sec": {"$max": "$tempo_secondi"},
+            }}],
+            "settimanale": [
+                {"$match": {"data": {"$gte": week_ago}}},
+                {"$group": {"_id": None, "km": {"$sum": "$distanza_km"}, "passi": {"$sum": "$passi"}, "camminate": {"$sum": 1}}},
+            ],
+            "mensile": [
+                {"$match": {"data": {"$gte": month_ago}}},
+                {"$group": {"_id": None, "km": {"$sum": "$distanza_km"}, "camminate": {"$sum": 1}}},
+            ],
+            "giorni": [{"$group": {"_id": DAY, "km": {"$sum": "$distanza_km"}, "passi": {"$sum": "$passi"}}}],
+            "recenti": [{"$limit": CHART_POINTS}],
+        }, facets)},
+    ]
+
+
+# Per-exercise volume and bests of one circuit, mirroring stats_engine.exercise_volumes
+_EXERCISE = {"$let": {
+    "vars": {
+        "done": {"$filter": {"input": {"$ifNull": ["$$e.sets", []]}, "as": "s", "cond": {"$eq": ["$$s.completato", True]}}},
+        "legacy": {"$eq": [{"$size": {"$ifNull": ["$$e.sets", []]}}, 0]},
+    },
+    "in": {
+        "eid": {"$ifNull": ["$$e.exercise_id", {"$ifNull": ["$$e.nome", ""]}]},
+        "vol": {"$cond": [
+            "$$legacy",
+            {"$multiply": [_num("$$e.serie"), _num("$$e.ripetizioni"), _num("$$e.peso_kg")]},
+            _total("$$done", {"$multiply": [_num("$$this.ripetizioni"), _num("$$this.peso_kg")]}),
+        ]},
+        "conta": {"$or": ["$$legacy", {"$gt": [{"$size": "$$done"}, 0]}]},
+        "ha_set": {"$gt": [{"$size": "$$done"}, 0]},
+        "max_peso": {"$max": "$$done.peso_kg"},
+        "max_reps": {"$max": "$$done.ripetizioni"},
+    },
+}}
+
+
+def circuit_pipeline(user_id: str, week_ago: str, month_ago: str, facets: Iterable[str] = None,
+                     since: str = None, with_sets: bool = True) -> list:
+    if with_sets:
+        shape = [
+            {"$project": {
+                "_id": 0, "data": 1, "durata_minuti": 1,
+                "n_esercizi": {"$size": {"$ifNull": ["$esercizi", []]}},
+                "esercizi": {"$map": {"input": {"$ifNull": ["$esercizi", []]}, "as": "e", "in": _EXERCISE}},
+            }},
+            {"$addFields": {"volume": _total("$esercizi", "$$this.vol")}},
+        ]
+    else:
+        shape = [{"$project": {"_id": 0, "data": 1, "durata_minuti": 1}}]
+    return [
+        _match(user_id, since),
+        {"$sort": {"data": -1}},
+        *shape,
+        {"$facet": _select({
+            "totale": [{"$group": {
+                "_id": None, "circuiti": {"$sum": 1}, "tempo_circuito_min": {"$sum": "$durata_minuti"},
+                "volume": {"$sum": "$volume"},
+            }}],
+            "settimanale": [{"$match": {"data": {"$gte": week_ago}}}, {"$count": "circuiti"}],
+            "mensile": [{"$match": {"data": {"$gte": month_ago}}}, {"$count": "circuiti"}],
+            "giorni": [{"$group": {"_id": DAY, "circuiti": {"$sum": 1}, "durata": {"$sum": "$durata_minuti"}}}],
+            "per_esercizio": [
+                {"$unwind": {"path": "$esercizi", "includeArrayIndex": "idx"}},
+                {"$match": {"esercizi.conta": True}},
+                {"$group": {
+                    "_id": "$esercizi.eid", "volume": {"$sum": "$esercizi.vol"},
+                    "ha_set": {"$max": "$esercizi.ha_set"},
+                    "max_peso": {"$max": "$esercizi.max_peso"}, "max_reps": {"$max": "$esercizi.max_reps"},
+                    # Keep the first-seen (newest first) key order of the Python implementation
+                    "primo": {"$first": {"data": "$data", "idx": "$idx"}},
+                }},
+                {"$sort": {"primo.data": -1, "primo.idx": 1}},
+            ],
+            "recenti": [{"$limit": CHART_POINTS}, {"$project": {"esercizi": 0}}],
+        }, facets)},
+    ]
+
+
+def _first(facet: list, defaults: dict) -> dict:
+    row = facet[0] if facet else {}
+    return {k: row.get(k) or v for k, v in defaults.items()}
+
+
+async def load_stats(db, user_id: str, now: datetime, sections: Iterable[str] = SECTIONS) -> dict:
+    wanted = set(sections)
+    plans = plan_sections(wanted)
+    week_ago = (now - timedelta(days=7)).isoformat()
+    month_ago = (now - timedelta(days=30)).isoformat()
+    w = c = {}
+    if plans["walks"].load:
+        facets = [f for f, readers in WALK_FACETS.items() if wanted.intersection(readers)]
+        since = None if plans["walks"].recent else plans["walks"].since(now)
+        w = (await db.walks.aggregate(walk_pipeline(user_id, week_ago, month_ago, facets, since)).to_list(1))[0]
+    if plans["circuits"].load:
+        facets = [f for f, readers in CIRCUIT_FACETS.items() if wanted.intersection(readers)]
+        since = None if plans["circuits"].recent else plans["circuits"].since(now)
+        pipeline = circuit_pipeline(user_id, week_ago, month_ago, facets, since, plans["circuits"].sets)
+        c = (await db.circuits.aggregate(pipeline).to_list(1))[0]
+
+    wt = _first(w.get("totale"), {"camminate": 0, "km": 0, "passi": 0, "tempo_camminata_sec": 0, "somma_velocita": 0,
+                              "best_km": 0, "best_passi": 0, "best_velocita": 0, "best_tempo_sec": 0})
+    ct = _first(c.get("totale"), {"circuiti": 0, "tempo_circuito_min": 0, "volume": 0})
+    tot = {**{k: wt[k] for k in ("camminate", "km", "passi", "tempo_camminata_sec", "somma_velocita")}, **ct}
+    best = {k: wt[k] for k in ("best_km", "best_passi", "best_velocita", "best_tempo_sec")}
+    week = {**_first(w.get("settimanale"), {"km": 0, "passi": 0, "camminate": 0}), **_first(c.get("settimanale"), {"circuiti": 0})}
+    month = {**_first(w.get("mensile"), {"km": 0, "camminate": 0}), **_first(c.get("mensile"), {"circuiti": 0})}
+
+    days: Dict[str, dict] = {}
+    for row in w.get("giorni", []):
+        days[row["_id"]] = {"km": row["km"], "passi": row["passi"], "circuiti": 0, "durata": 0}
+    for row in c.get("giorni", []):
+        bucket = days.setdefault(row["_id"], {"km": 0, "passi": 0, "circuiti": 0, "durata": 0})
+        bucket["circuiti"] = row["circuiti"]
+        bucket["durata"] = row["durata"]
+
+    per_esercizio = c.get("per_esercizio", [])
+    volumes = {row["_id"]: row["volume"] for row in per_esercizio}
+    bests = {row["_id"]: {"max_peso": row["max_peso"] or 0, "max_reps": row["max_reps"] or 0}
+             for row in per_esercizio if row["ha_set"]}
+    chart_circuits = [chart_circuit(r.get("data", ""), r["volume"], r.get("durata_minuti", 0), r["n_esercizi"]) for r in c.get("recenti", [])]
+    return assemble_stats(tot, week, month, best, volumes, bests, days, w.get("recenti", []), chart_circuits, now, sections)
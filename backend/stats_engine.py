@@ -0,0 +1,321 @@
+"""Pure, single-pass computation of the activity statistics.
+
+Walks and circuits are visited once each and bucketed by UTC day; every
+section of /api/stats and every /api/sfide/check-progress metric is then
+derived from the totals and the day buckets, so the cost is O(N) in the
+number of documents instead of O(days x N). Each section declares the data
+it reads in SECTION_NEEDS, so /api/stats?sections= loads and computes only
+what was asked for.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+CAL_PER_KM = 60  # ~60 cal/km for seniors
+CAL_PER_CIRCUIT_MIN = 5  # ~5 cal/min
+STREAK_MAX_DAYS = 30
+CHART_POINTS = 30
+DAILY_CHART_DAYS = 14
+
+
+# ===== SECTIONS =====
+
+class SectionNeeds(NamedTuple):
+    """Data one /api/stats section reads."""
+    walks: bool
+    circuits: bool
+    sets: bool = False  # circuit exercises and their sets
+    days: Optional[int] = None  # only documents of the last ``days`` days; None = whole history
+    recent: bool = False  # only the newest CHART_POINTS documents
+
+
+# In response order
+SECTION_NEEDS: Dict[str, SectionNeeds] = {
+    "totale": SectionNeeds(walks=True, circuits=True, sets=True),
+    "settimanale": SectionNeeds(walks=True, circuits=True, days=7),
+    "mensile": SectionNeeds(walks=True, circuits=True, days=30),
+    "record": SectionNeeds(walks=True, circuits=False),
+    "medie": SectionNeeds(walks=True, circuits=True),
+    "streak": SectionNeeds(walks=True, circuits=True, days=STREAK_MAX_DAYS),
+    "volume_per_esercizio": SectionNeeds(walks=False, circuits=True, sets=True),
+    "record_esercizi": SectionNeeds(walks=False, circuits=True, sets=True),
+    "grafici_camminate": SectionNeeds(walks=True, circuits=False, recent=True),
+    "grafici_circuiti": SectionNeeds(walks=False, circuits=True, sets=True, recent=True),
+    "grafici_giornalieri": SectionNeeds(walks=True, circuits=True, days=DAILY_CHART_DAYS),
+}
+SECTIONS: Tuple[str, ...] = tuple(SECTION_NEEDS)
+
+
+def parse_sections(value: Optional[str]) -> Tuple[str, ...]:
+    """Comma-separated ``sections=`` value -> section names in response order; raises ValueError on unknown names."""
+    if not value:
+        return SECTIONS
+    wanted = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = wanted - set(SECTION_NEEDS)
+    if unknown:
+        raise ValueError(", ".join(sorted(unknown)))
+    return tuple(name for name in SECTIONS if name in wanted) or SECTIONS
+
+
+class CollectionPlan(NamedTuple):
+    """What a set of sections needs from the walks or the circuits collection."""
+    load: bool = False
+    sets: bool = False
+    full: bool = False  # some section reads the whole history
+    days: int = 0  # widest day window among the windowed sections
+    recent: bool = False  # some section reads the newest CHART_POINTS documents
+
+    def since(self, now: datetime) -> Optional[str]:
+        """Lower bound on ``data`` covering every windowed section, or None when the history is unbounded."""
+        if self.full or not self.days:
+            return None
+        return (now - timedelta(days=self.days)).isoformat()
+
+
+def plan_sections(sections: Iterable[str]) -> Dict[str, CollectionPlan]:
+    """Per-collection data plan of the requested sections, keyed ``walks`` and ``circuits``."""
+    needs = [SECTION_NEEDS[name] for name in sections]
+    plans = {}
+    for collection in ("walks", "circuits"):
+        used = [n for n in needs if getattr(n, collection)]
+        plans[collection] = CollectionPlan(
+            load=bool(used),
+            sets=collection == "circuits" and any(n.sets for n in used),
+            full=any(n.days is None and not n.recent for n in used),
+            days=max((n.days or 0 for n in used), default=0),
+            recent=any(n.recent for n in used),
+        )
+    return plans
+
+
+# ===== COMPUTATION =====
+
+
+def day_of(doc: dict) -> str:
+    return doc.get("data", "")[:10]
+
+
+def exercise_volumes(esercizi: Iterable[dict]) -> Tuple[float, Dict[str, float], Dict[str, dict]]:
+    """Total volume, volume per exercise and per-exercise bests of one circuit."""
+    total = 0
+    volumes: Dict[str, float] = {}
+    bests: Dict[str, dict] = {}
+    for ex in esercizi:
+        eid = ex.get("exercise_id", ex.get("nome", ""))
+        sets = ex.get("sets", [])
+        if sets:
+            vol = 0
+            done = False
+            for s in sets:
+                if s.get("completato", False):
+                    done = True
+                    vol += s.get("ripetizioni", 0) * s.get("peso_kg", 0)
+                    best = bests.setdefault(eid, {"max_peso": 0, "max_reps": 0})
+                    best["max_peso"] = max(best["max_peso"], s.get("peso_kg", 0))
+                    best["max_reps"] = max(best["max_reps"], s.get("ripetizioni", 0))
+            total += vol
+            if not done:
+                continue
+        else:
+            # Legacy circuits stored one serie/ripetizioni/peso triple per exercise
+            vol = ex.get("serie", 0) * ex.get("ripetizioni", 0) * ex.get("peso_kg", 0)
+            total += vol
+        volumes[eid] = volumes.get(eid, 0) + vol
+    return total, volumes, bests
+
+
+def streak(active_days: set, now: datetime) -> int:
+    """Consecutive active days ending today, capped at STREAK_MAX_DAYS."""
+    count = 0
+    for i in range(STREAK_MAX_DAYS):
+        if (now - timedelta(days=i)).strftime("%Y-%m-%d") in active_days:
+            count += 1
+        else:
+            break
+    return count
+
+
+def calories(km: float, circuit_minutes: float) -> int:
+    return round(km * CAL_PER_KM + circuit_minutes * CAL_PER_CIRCUIT_MIN)
+
+
+def compute_stats(walks: List[dict], circuits: List[dict], now: datetime, sections: Iterable[str] = SECTIONS) -> dict:
+    """Build the /api/stats response; ``walks`` and ``circuits`` are sorted by data, newest first.
+
+    Only ``sections`` are computed, so the documents need to cover just what
+    ``plan_sections(sections)`` asks for.
+    """
+    with_sets = plan_sections(sections)["circuits"].sets
+    week_ago = (now - timedelta(days=7)).isoformat()
+    month_ago = (now - timedelta(days=30)).isoformat()
+    days: Dict[str, dict] = {}
+
+    def bucket(day):
+        b = days.get(day)
+        if b is None:
+            b = days[day] = {"km": 0, "passi": 0, "circuiti": 0, "durata": 0}
+        return b
+
+    total_km = total_passi = total_walk_time = sum_speed = 0
+    weekly_km = weekly_passi = weekly_walks = monthly_km = monthly_walks = 0
+    best_km = best_passi = best_velocita = longest_walk_sec = 0
+    for w in walks:
+        km, passi = w.get("distanza_km", 0), w.get("passi", 0)
+        data = w.get("data", "")
+        total_km += km
+        total_passi += passi
+        total_walk_time += w.get("tempo_secondi", 0)
+        sum_speed += w.get("velocita_media_kmh", 0)
+        best_km = max(best_km, km)
+        best_passi = max(best_passi, passi)
+        best_velocita = max(best_velocita, w.get("velocita_media_kmh", 0))
+        longest_walk_sec = max(longest_walk_sec, w.get("tempo_secondi", 0))
+        if data >= week_ago:
+            weekly_km += km
+            weekly_passi += passi
+            weekly_walks += 1
+        if data >= month_ago:
+            monthly_km += km
+            monthly_walks += 1
+        b = bucket(data[:10])
+        b["km"] += km
+        b["passi"] += passi
+
+    total_circuit_time = total_volume = weekly_circuits = monthly_circuits = 0
+    exercise_volumes_tot: Dict[str, float] = {}
+    ex_bests: Dict[str, dict] = {}
+    chart_circuits = []
+    for i, c in enumerate(circuits):
+        data = c.get("data", "")
+        durata = c.get("durata_minuti", 0)
+        vol, volumes, bests = exercise_volumes(c.get("esercizi", [])) if with_sets else (0, {}, {})
+        total_circuit_time += durata
+        total_volume += vol
+        for eid, v in volumes.items():
+            exercise_volumes_tot[eid] = exercise_volumes_tot.get(eid, 0) + v
+        for eid, best in bests.items():
+            curr = ex_bests.setdefault(eid, {"max_peso": 0, "max_reps": 0})
+            curr["max_peso"] = max(curr["max_peso"], best["max_peso"])
+            curr["max_reps"] = max(curr["max_reps"], best["max_reps"])
+        if data >= week_ago:
+            weekly_circuits += 1
+        if data >= month_ago:
+            monthly_circuits += 1
+        if i < CHART_POINTS:
+            chart_circuits.append(chart_circuit(data, vol, durata, len(c.get("esercizi", []))))
+        b = bucket(data[:10])
+        b["circuiti"] += 1
+        b["durata"] += durata
+
+    return assemble_stats(
+        tot={"camminate": len(walks), "km": total_km, "passi": total_passi, "tempo_camminata_sec": total_walk_time,
+             "somma_velocita": sum_speed, "circuiti": len(circuits), "tempo_circuito_min": total_circuit_time,
+             "volume": total_volume},
+        week={"km": weekly_km, "passi": weekly_passi, "camminate": weekly_walks, "circuiti": weekly_circuits},
+        month={"km": monthly_km, "camminate": monthly_walks, "circuiti": monthly_circuits},
+        best={"best_km": best_km, "best_passi": best_passi, "best_velocita": best_velocita, "best_tempo_sec": longest_walk_sec},
+        volumes=exercise_volumes_tot, bests=ex_bests, days=days,
+        recent_walks=walks[:CHART_POINTS], chart_circuits=chart_circuits, now=now, sections=sections,
+    )
+
+
+def chart_circuit(data: str, volume: float, durata: int, n_esercizi: int) -> dict:
+    return {"data": data[:10], "volume": round(volume, 1), "durata": durata, "esercizi_completati": n_esercizi}
+
+
+def assemble_stats(tot: dict, week: dict, month: dict, best: dict, volumes: Dict[str, float], bests: Dict[str, dict],
+                   days: Dict[str, dict], recent_walks: List[dict], chart_circuits: List[dict], now: datetime,
+                   sections: Iterable[str] = SECTIONS) -> dict:
+    """Shape the /api/stats response from pre-aggregated numbers.
+
+    ``days`` maps each active UTC day to its ``km``/``passi``/``circuiti``/``durata``
+    bucket; ``recent_walks`` and ``chart_circuits`` are newest first. Only the
+    inputs read by ``sections`` have to be filled in.
+    """
+    def chart_walks():
+        points = [{"data": w.get("data", "")[:10], "km": w.get("distanza_km", 0), "passi": w.get("passi", 0), "velocita": w.get("velocita_media_kmh", 0), "tempo_min": round(w.get("tempo_secondi", 0) / 60, 1)} for w in recent_walks]
+        return list(reversed(points))
+
+    def daily_data():
+        data = []
+        for i in range(DAILY_CHART_DAYS):
+            day = (now - timedelta(days=DAILY_CHART_DAYS - 1 - i)).strftime("%Y-%m-%d")
+            b = days.get(day, {})
+            data.append({
+                "data": day, "km": round(b.get("km", 0), 2), "passi": b.get("passi", 0),
+                "circuiti": b.get("circuiti", 0), "calorie": calories(b.get("km", 0), b.get("durata", 0)),
+            })
+        return data
+
+    n_walks = tot.get("camminate", 0)
+    builders = {
+        "totale": lambda: {
+            "km": round(tot["km"], 1), "passi": tot["passi"],
+            "tempo_camminata_min": round(tot["tempo_camminata_sec"] / 60, 1),
+            "allenamenti_circuito": tot["circuiti"], "tempo_circuito_min": tot["tempo_circuito_min"],
+            "volume_totale_kg": round(tot["volume"], 1),
+            "calorie_stimate": round(tot["km"] * CAL_PER_KM) + round(tot["tempo_circuito_min"] * CAL_PER_CIRCUIT_MIN),
+            "giorni_attivi": len(days), "camminate_totali": n_walks,
+        },
+        "settimanale": lambda: {
+            "km": round(week["km"], 1), "passi": week["passi"],
+            "camminate": week["camminate"], "circuiti": week["circuiti"],
+        },
+        "mensile": lambda: {"km": round(month["km"], 1), "camminate": month["camminate"], "circuiti": month["circuiti"]},
+        "record": lambda: {
+            "best_km": round(best["best_km"], 1), "best_passi": best["best_passi"],
+            "best_velocita": round(best["best_velocita"], 1),
+            "camminata_piu_lunga_min": round(best["best_tempo_sec"] / 60, 1),
+        },
+        "medie": lambda: {
+            "km_per_camminata": round(tot["km"] / max(n_walks, 1), 2),
+            "velocita_media": round(tot["somma_velocita"] / max(n_walks, 1), 1),
+            "durata_circuito_media": round(tot["tempo_circuito_min"] / max(tot["circuiti"], 1), 1),
+        },
+        "streak": lambda: streak(set(days), now),
+        "volume_per_esercizio": lambda: volumes,
+        "record_esercizi": lambda: bests,
+        "grafici_camminate": chart_walks,
+        "grafici_circuiti": lambda: list(reversed(chart_circuits)),
+        "grafici_giornalieri": daily_data,
+    }
+    wanted = set(sections)
+    return {name: builders[name]() for name in SECTIONS if name in wanted}
+
+
+# Data each sfida target_field reads, over the challenge week
+CHALLENGE_NEEDS: Dict[str, SectionNeeds] = {
+    "km": SectionNeeds(walks=True, circuits=False),
+    "passi": SectionNeeds(walks=True, circuits=False),
+    "velocita": SectionNeeds(walks=True, circuits=False),
+    "circuiti": SectionNeeds(walks=False, circuits=True),
+    "volume": SectionNeeds(walks=False, circuits=True, sets=True),
+    "calorie": SectionNeeds(walks=True, circuits=True),
+    "streak": SectionNeeds(walks=True, circuits=True),
+}
+CHALLENGE_METRICS: Tuple[str, ...] = tuple(CHALLENGE_NEEDS)
+
+
+def challenge_metrics(walks: List[dict], circuits: List[dict], now: datetime,
+                      metrics: Iterable[str] = CHALLENGE_METRICS) -> Dict[str, float]:
+    """Values of the ``metrics`` sfida target_fields over the given (already windowed) walks and circuits."""
+    wanted = set(metrics)
+    km = passi = best_speed = 0
+    active_days = set()
+    for w in walks:
+        km += w.get("distanza_km", 0)
+        passi += w.get("passi", 0)
+        best_speed = max(best_speed, w.get("velocita_media_kmh", 0))
+        active_days.add(day_of(w))
+    volume = durata = 0
+    with_sets = "volume" in wanted
+    for c in circuits:
+        if with_sets:
+            volume += exercise_volumes(c.get("esercizi", []))[0]
+        durata += c.get("durata_minuti", 0)
+        active_days.add(day_of(c))
+    values = {
+        "km": lambda: km, "passi": lambda: passi, "circuiti": lambda: len(circuits), "volume": lambda: volume,
+        "streak": lambda: streak(active_days, now), "velocita": lambda: best_speed,
+        "calorie": lambda: calories(km, durata),
+    }
+    return {name: values[name]() for name in CHALLENGE_METRICS if name in wanted}
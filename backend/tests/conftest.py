@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def mock_db():
+    """In-memory stand-in for a Motor database, for tests of code that issues Mongo queries."""
+    from mongomock_motor import AsyncMongoMockClient
+    return AsyncMongoMockClient()["walt_test"]
@@ -0,0 +1,104 @@
+"""
+Unit tests for the negotiated response compression
+"""
+import gzip
+
+from fastapi import FastAPI, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+import compression
+from compression import CompressionMiddleware, Compressor, parse_accept_encoding
+
+BIG = {"giorni": [{"nome": "Squat con Sedia", "descrizione": "Scendi lentamente come per sederti"}] * 100}
+
+
+def client(compressor: Compressor) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, compressor=compressor)
+
+    @app.get("/big")
+    async def big():
+        return BIG
+
+    @app.get("/etag")
+    async def etag():
+        return Response(content=b"x" * 4000, media_type="application/json", headers={"ETag": '"abc"'})
+
+    @app.get("/small")
+    async def small():
+        return {"status": "ok"}
+
+    @app.get("/stream")
+    async def stream():
+        return StreamingResponse(iter([b"a" * 2000, b"b" * 2000]), media_type="text/plain")
+
+    @app.get("/binary")
+    async def binary():
+        return Response(content=b"\0" * 4000, media_type="application/octet-stream")
+
+    @app.get("/text")
+    async def text():
+        return PlainTextResponse("ciao " * 1000)
+
+    return TestClient(app)
+
+
+class TestNegotiation:
+    def test_parse_accept_encoding(self):
+        assert parse_accept_encoding("gzip, br;q=0.5, identity;q=0") == {"gzip": 1.0, "br": 0.5, "identity": 0.0}
+        assert parse_accept_encoding("gzip;q=abc") == {"gzip": 0.0}
+        assert parse_accept_encoding("") == {}
+
+    def test_choose(self, monkeypatch):
+        monkeypatch.setattr(compression, "brotli", None)
+        compressor = Compressor()
+        assert compressor.choose("gzip, deflate") == "gzip"
+        assert compressor.choose("br") is None
+        assert compressor.choose("gzip;q=0") is None
+        assert compressor.choose("*") == "gzip"
+        assert compressor.choose("*, gzip;q=0") is None
+
+    def test_prefers_brotli_when_available(self, monkeypatch):
+        monkeypatch.setattr(compression, "brotli", object())
+        compressor = Compressor()
+        assert compressor.choose("gzip, br") == "br"
+        assert compressor.choose("gzip, br;q=0.1") == "gzip"
+
+
+class TestMiddleware:
+    def test_compresses_large_json(self):
+        compressor = Compressor(min_size=500)
+        resp = client(compressor).get("/big", headers={"Accept-Encoding": "gzip"})
+        assert resp.headers["content-encoding"] == "gzip"
+        assert resp.headers["vary"] == "Accept-Encoding"
+        assert int(resp.headers["content-length"]) < 1000
+        assert resp.json() == BIG
+        assert compressor.stats()["encodings"]["gzip"]["responses"] == 1
+
+    def test_etag_becomes_weak(self):
+        resp = client(Compressor()).get("/etag", headers={"Accept-Encoding": "gzip"})
+        assert resp.headers["etag"] == 'W/"abc"'
+
+    def test_offloads_large_bodies(self):
+        compressor = Compressor(min_size=500, offload_size=1000)
+        resp = client(compressor).get("/big", headers={"Accept-Encoding": "gzip"})
+        assert resp.json() == BIG
+        assert compressor.stats()["encodings"]["gzip"]["offloaded"] == 1
+
+    def test_skips(self):
+        http = client(Compressor(min_size=500))
+        assert "content-encoding" not in http.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+        assert "content-encoding" not in http.get("/big", headers={"Accept-Encoding": "identity"}).headers
+        assert "content-encoding" not in http.get("/binary", headers={"Accept-Encoding": "gzip"}).headers
+        streamed = http.get("/stream", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in streamed.headers and len(streamed.content) == 4000
+
+    def test_compresses_text(self):
+        resp = client(Compressor(min_size=500)).get("/text", headers={"Accept-Encoding": "gzip"})
+        assert resp.headers["content-encoding"] == "gzip" and resp.text == "ciao " * 1000
+
+    def test_gzip_output_is_deterministic(self):
+        compressor = Compressor()
+        assert compressor.compress(b"x" * 2000, "gzip") == compressor.compress(b"x" * 2000, "gzip")
+        assert gzip.decompress(compressor.compress(b"x" * 2000, "gzip")) == b"x" * 2000
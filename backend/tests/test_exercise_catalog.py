@@ -0,0 +1,61 @@
+"""
+Unit tests for the in-memory exercise catalog index
+"""
+import json
+
+import pytest
+
+from catalog_sync import catalog_version, diff_operations
+from exercise_catalog import CATALOG
+from exercises_database import ESERCIZI_DATABASE
+from http_cache import etag_matches
+
+
+class TestExerciseCatalog:
+    def test_list_body_matches_database(self):
+        assert json.loads(CATALOG.list_body().content) == ESERCIZI_DATABASE
+
+    def test_category_index(self):
+        gambe = CATALOG.by_category("Gambe")
+        assert gambe == [ex for ex in ESERCIZI_DATABASE if ex["categoria"] == "Gambe"]
+        assert json.loads(CATALOG.list_body("Gambe").content) == gambe
+        assert json.loads(CATALOG.list_body("Inesistente").content) == []
+
+    def test_muscle_group_and_equipment_index(self):
+        assert all("glutei" in ex["gruppo_muscolare"] for ex in CATALOG.by_muscle_group("glutei"))
+        assert all("sedia" in ex["attrezzi"] for ex in CATALOG.by_equipment("sedia"))
+
+    def test_alternatives_exclude_original(self):
+        body = json.loads(CATALOG.alternatives_body("ex_squat_sedia").content)
+        ids = [ex["exercise_id"] for ex in body["alternative"]]
+        assert "ex_squat_sedia" not in ids
+        assert len(ids) <= 5
+
+    def test_index_is_immutable(self):
+        with pytest.raises(TypeError):
+            CATALOG.by_id["ex_squat_sedia"]["nome"] = "Altro"
+        copy = CATALOG.get("ex_squat_sedia")
+        copy["nome"] = "Altro"
+        assert CATALOG.get("ex_squat_sedia")["nome"] == "Squat con Sedia"
+
+    def test_etag_matching(self):
+        etag = CATALOG.all_body.etag
+        assert etag_matches(etag, etag)
+        assert etag_matches(f'"other", W/{etag}', etag)
+        assert not etag_matches('"other"', etag)
+
+
+class TestCatalogSyncDiff:
+    def test_in_sync_catalog_needs_no_operations(self):
+        existing = [dict(ex, _id=i) for i, ex in enumerate(ESERCIZI_DATABASE)]
+        assert diff_operations(ESERCIZI_DATABASE, existing) == []
+
+    def test_diff_upserts_changes_and_removes_stale_and_duplicates(self):
+        existing = [dict(ex, _id=i) for i, ex in enumerate(ESERCIZI_DATABASE[1:])]
+        existing[0]["nome"] = "Nome vecchio"
+        existing.append(dict(ESERCIZI_DATABASE[2], _id="dup"))
+        existing.append({"_id": "old", "exercise_id": "ex_rimosso"})
+        ops = diff_operations(ESERCIZI_DATABASE, existing)
+        kinds = sorted(type(op).__name__ for op in ops)
+        assert kinds == ["DeleteMany", "DeleteOne", "ReplaceOne", "ReplaceOne"]
+        assert catalog_version(ESERCIZI_DATABASE) != catalog_version(ESERCIZI_DATABASE[1:])
@@ -0,0 +1,54 @@
+"""
+Unit tests for keyset pagination and sparse fieldsets
+"""
+import pytest
+
+from pagination import ListSpec, decode_cursor, encode_cursor, page_pipeline, parse_fields, split_page
+
+WALKS = ListSpec("walks", "data", "walk_id", 100, exclude=("percorso",))
+
+
+class TestCursor:
+    def test_round_trip(self):
+        cursor = encode_cursor("2026-10-01T10:00:00+00:00", "walk_abc")
+        assert "=" not in cursor
+        assert decode_cursor(cursor) == ("2026-10-01T10:00:00+00:00", "walk_abc")
+
+    @pytest.mark.parametrize("cursor", ["zzz", "", encode_cursor(1, "w"), "W10"])
+    def test_invalid(self, cursor):
+        with pytest.raises(ValueError):
+            decode_cursor(cursor)
+
+    def test_pipeline_seeks_past_cursor(self):
+        pipeline = page_pipeline(WALKS, "u1", encode_cursor("2026-10-01", "w5"), 10, None)
+        assert pipeline[0]["$match"] == {"user_id": "u1", "$or": [
+            {"data": {"$lt": "2026-10-01"}}, {"data": "2026-10-01", "walk_id": {"$lt": "w5"}}]}
+        assert pipeline[1] == {"$sort": {"data": -1, "walk_id": -1}}
+        assert pipeline[2] == {"$limit": 11}
+        assert pipeline[-1] == {"$project": {"_id": 0, "percorso": 0}}
+
+
+class TestFields:
+    def test_adds_sort_and_id(self):
+        assert parse_fields("passi, distanza_km", WALKS) == ["data", "distanza_km", "passi", "walk_id"]
+        assert parse_fields(None, WALKS) is None and parse_fields("", WALKS) is None
+
+    def test_parent_wins_over_child(self):
+        assert parse_fields("esercizi.nome,esercizi,esercizi.sets.peso_kg", WALKS) == ["data", "esercizi", "walk_id"]
+
+    @pytest.mark.parametrize("value", ["$where", "a..b", "_id", "_id.x", "a b", "nome,$gt"])
+    def test_invalid(self, value):
+        with pytest.raises(ValueError):
+            parse_fields(value, WALKS)
+
+
+class TestSplitPage:
+    def test_last_page_has_no_cursor(self):
+        docs = [{"data": "2026-10-02", "walk_id": "w2"}, {"data": "2026-10-01", "walk_id": "w1"}]
+        assert split_page(WALKS, docs, 2) == (docs, None)
+
+    def test_cursor_points_at_last_item(self):
+        docs = [{"data": f"2026-10-0{d}", "walk_id": f"w{d}"} for d in (3, 2, 1)]
+        items, cursor = split_page(WALKS, docs, 2)
+        assert items == docs[:2]
+        assert decode_cursor(cursor) == ("2026-10-02", "w2")
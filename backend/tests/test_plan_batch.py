@@ -0,0 +1,58 @@
+"""
+Unit tests for batch plan generation
+"""
+import asyncio
+from datetime import datetime, timezone
+
+from pymongo import InsertOne, UpdateMany
+
+import plan_batch
+
+NOW = datetime(2026, 3, 15, 9, 0, tzinfo=timezone.utc)
+def run(coro):
+    return asyncio.new_event_loop().run_until_complete(coro)
+
+
+USERS = [{"user_id": f"u{i}", "livello": "Intermedio", "giorni_disponibili": ["Lunedì", "Martedì"]} for i in range(3)]
+
+
+class TestPlanBatch:
+    def test_build_plans_applies_per_user_inputs(self):
+        plans = plan_batch.build_plans(USERS, {"u1": {"energia": 9, "dolori_articolari": ["ginocchia"]}}, NOW)
+        assert [p["user_id"] for p in plans] == ["u0", "u1", "u2"]
+        assert len({p["plan_id"] for p in plans}) == 3
+        assert plans[1]["giorni"][0]["attivita"][0]["durata_minuti"] == 45
+        assert plans[0]["giorni"][0]["attivita"][0]["durata_minuti"] == 40
+        ids = {a["exercise_id"] for a in plans[1]["giorni"][1]["attivita"]}
+        assert not ids & {"ex_squat_sedia", "ex_affondi_supporto", "ex_step_up"}
+
+    def test_writes_deactivate_before_inserting(self):
+        plans = plan_batch.build_plans(USERS, {}, NOW)
+        ops = plan_batch.plan_writes(plans)
+        assert ops[0] == UpdateMany({"user_id": {"$in": ["u0", "u1", "u2"]}, "attivo": True}, {"$set": {"attivo": False}})
+        assert ops[1:] == [InsertOne(p) for p in plans]
+
+    def test_chunks(self):
+        assert plan_batch._chunks(list(range(5)), 2) == [[0, 1], [2, 3], [4]]
+
+
+class TestGenerateBatch:
+    def test_chunks_built_in_the_worker_pool(self, mock_db):
+        run(mock_db.users.insert_many([dict(u) for u in USERS]))
+        run(mock_db.plans.insert_one({"plan_id": "vecchio", "user_id": "u0", "attivo": True}))
+        pool = plan_batch.WorkerPool(2)
+        generated = []
+
+        async def on_generated(*user_ids):
+            generated.extend(user_ids)
+
+        try:
+            report = run(plan_batch.generate_batch(mock_db, ["u0", "u1", "u2", "nessuno"], {}, pool.executor,
+                                                   chunk_size=2, now=NOW, on_generated=on_generated))
+        finally:
+            run(pool.stop())
+        assert (report["generati"], report["utenti_non_trovati"]) == (3, ["nessuno"])
+        assert sorted(generated) == ["u0", "u1", "u2"]
+        active = run(mock_db.plans.find({"attivo": True}).to_list(None))
+        assert sorted(p["user_id"] for p in active) == ["u0", "u1", "u2"]
+        assert pool._executor is None
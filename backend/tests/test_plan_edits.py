@@ -0,0 +1,54 @@
+"""
+Unit tests for the positional plan exercise edits
+"""
+from plan_edits import edit_operations, exercise_path, invalid_index, negative_index
+
+PLAN = {"giorni": [
+    {"giorno": "Lunedì", "attivita": [{"nome": "Camminata"}]},
+    {"giorno": "Mercoledì", "attivita": [{"nome": "Squat"}, {"nome": "Plank"}]},
+]}
+
+
+def edit(g, e, **fields):
+    return {"giorno_index": g, "exercise_index": e, "serie": None, "ripetizioni": None,
+            "peso_kg": None, "nome": None, "note": None, **fields}
+
+
+class TestEditOperations:
+    def test_sets_only_given_fields(self):
+        conditions, fields = edit_operations([edit(1, 0, ripetizioni=10, peso_kg=2.5)])
+        assert conditions == {"giorni.1.attivita.0": {"$exists": True}}
+        assert fields == {"giorni.1.attivita.0.ripetizioni": 10, "giorni.1.attivita.0.peso_kg": 2.5}
+
+    def test_zero_is_a_value(self):
+        _, fields = edit_operations([edit(1, 1, peso_kg=0)])
+        assert fields == {"giorni.1.attivita.1.peso_kg": 0}
+
+    def test_batch_merges_and_later_wins(self):
+        conditions, fields = edit_operations([edit(1, 0, serie=2), edit(1, 1, serie=3), edit(1, 0, serie=4)])
+        assert set(conditions) == {exercise_path(1, 0), exercise_path(1, 1)}
+        assert fields == {"giorni.1.attivita.0.serie": 4, "giorni.1.attivita.1.serie": 3}
+
+    def test_empty_edit(self):
+        conditions, fields = edit_operations([edit(0, 0)])
+        assert conditions == {"giorni.0.attivita.0": {"$exists": True}}
+        assert fields == {}
+
+
+class TestInvalidIndex:
+    def test_valid(self):
+        assert invalid_index(PLAN, [edit(0, 0), edit(1, 1)]) is None
+
+    def test_giorno(self):
+        assert invalid_index(PLAN, [edit(0, 0), edit(2, 0)]) == "giorno"
+        assert invalid_index(PLAN, [edit(-1, 0)]) == "giorno"
+
+    def test_esercizio(self):
+        assert invalid_index(PLAN, [edit(0, 1)]) == "esercizio"
+        assert invalid_index(PLAN, [edit(1, -1)]) == "esercizio"
+        assert invalid_index({"giorni": [{}]}, [edit(0, 0)]) == "esercizio"
+
+    def test_negative(self):
+        assert negative_index([edit(0, 0), edit(1, 1)]) is None
+        assert negative_index([edit(-1, 0)]) == "giorno"
+        assert negative_index([edit(0, 0), edit(0, -2)]) == "esercizio"
@@ -0,0 +1,65 @@
+"""
+Unit tests for the pure, memoized plan generator
+"""
+from datetime import datetime, timezone
+
+import plan_generator
+from plan_generator import AVOID_BY_DOLORE, normalize, plan_giorni, user_inputs
+
+SETTIMANA = ["Lunedì", "Martedì", "Mercoledì", "Giovedì", "Venerdì", "Sabato", "Domenica"]
+
+
+def _exercise_ids(giorni):
+    return {a["exercise_id"] for g in giorni if g["tipo"] == "circuito" for a in g["attivita"]}
+
+
+class TestNormalize:
+    def test_equivalent_inputs_share_a_key(self):
+        a = normalize("Intermedio", SETTIMANA, 8, ["Core", "Gambe"], ["spalle", "ginocchia"])
+        b = normalize("Intermedio", SETTIMANA, 10, ["Gambe", "Core"], ["ginocchia", "spalle", "polso"])
+        assert a == b and hash(a) == hash(b)
+
+    def test_energy_buckets(self):
+        assert [normalize(energia=e).serie_mod for e in (1, 3, 4, 7, 8)] == [-1, -1, 0, 0, 1]
+
+    def test_empty_focus_means_rotation(self):
+        assert normalize(focus=[]).focus is None
+
+    def test_every_pain_combination_is_precomputed(self):
+        assert len(plan_generator.AVOID_BY_DOLORI) == 2 ** len(AVOID_BY_DOLORE)
+        assert plan_generator.AVOID_BY_DOLORI[frozenset()] == frozenset()
+
+
+class TestPlanGiorni:
+    def test_alternates_walks_and_circuits(self):
+        giorni = plan_giorni(normalize("Principiante", SETTIMANA))
+        assert [g["tipo"] for g in giorni] == ["camminata", "circuito"] * 3 + ["camminata"]
+        assert giorni[0]["attivita"][0]["durata_minuti"] == 30
+        assert all(len(g["attivita"]) == 4 for g in giorni if g["tipo"] == "circuito")
+
+    def test_level_and_energy(self):
+        giorni = plan_giorni(normalize("Avanzato", SETTIMANA, energia=9))
+        assert giorni[0]["attivita"][0]["durata_minuti"] == 45
+        circuit = giorni[1]["attivita"]
+        assert len(circuit) == 6 and all(a["serie"] <= 4 for a in circuit)
+
+    def test_pains_exclude_exercises(self):
+        dolori = ["ginocchia", "spalle", "schiena"]
+        giorni = plan_giorni(normalize("Avanzato", SETTIMANA, dolori=dolori))
+        assert not _exercise_ids(giorni) & set().union(*AVOID_BY_DOLORE.values())
+
+    def test_focus_restricts_categories(self):
+        giorni = plan_giorni(normalize("Principiante", SETTIMANA, focus=["Core"]))
+        assert {a["categoria"] for g in giorni if g["tipo"] == "circuito" for a in g["attivita"]} == {"Core"}
+
+    def test_callers_get_independent_copies(self):
+        inputs = normalize("Principiante", SETTIMANA)
+        first = plan_giorni(inputs)
+        first[1]["attivita"][0]["serie"] = 99
+        assert plan_giorni(inputs)[1]["attivita"][0]["serie"] != 99
+
+    def test_plan_document(self):
+        user = {"user_id": "u1", "eta": 80}
+        plan = plan_generator.plan_document(user, user_inputs(user), datetime(2026, 3, 15, tzinfo=timezone.utc))
+        assert plan["nome"] == "Piano Auto - Fascia 80" and plan["attivo"] is True
+        assert [g["giorno"] for g in plan["giorni"]] == list(plan_generator.DEFAULT_GIORNI)
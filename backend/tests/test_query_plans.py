@@ -0,0 +1,54 @@
+"""
+Query-plan checks: every endpoint query must be served by an index.
+Needs a local mongod (MONGO_URL); skipped otherwise.
+"""
+import asyncio
+import os
+
+import pytest
+from pymongo import ASCENDING, DESCENDING
+
+from indexes import ENDPOINT_QUERIES, ensure_indexes, verify_query_plans
+
+MONGO_URL = os.environ.get("MONGO_URL", "")
+DB_NAME = "walt_test_query_plans"
+
+
+def run_with_db(check):
+    """Run ``check(db)`` on one event loop, with a client that lives and dies with it."""
+    if not MONGO_URL:
+        pytest.skip("MONGO_URL non impostato: serve un mongod locale")
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def main():
+        client = AsyncIOMotorClient(MONGO_URL, serverSelectionTimeoutMS=2000)
+        try:
+            await client.drop_database(DB_NAME)
+            return await check(client[DB_NAME])
+        finally:
+            await client.drop_database(DB_NAME)
+            client.close()
+
+    return asyncio.run(main())
+
+
+class TestQueryPlans:
+    def test_no_collscan_or_in_memory_sort(self):
+        async def check(db):
+            # Seed one document per collection so the planner has something to choose between
+            seed = {}
+            for _, collection, query, _ in ENDPOINT_QUERIES:
+                seed.setdefault(collection, {}).update({k: v for k, v in query.items() if not isinstance(v, dict)})
+            for collection, doc in seed.items():
+                await db[collection].insert_one(doc)
+            await ensure_indexes(db)
+            return await verify_query_plans(db)
+        assert run_with_db(check) == []
+
+    def test_drops_superseded_indexes(self):
+        async def check(db):
+            await db.walks.create_index([("user_id", ASCENDING), ("data", DESCENDING)], name="user_id_data")
+            await ensure_indexes(db)
+            return await db.walks.index_information()
+        indexes = run_with_db(check)
+        assert "user_id_data" not in indexes and "user_id_data_id" in indexes
@@ -0,0 +1,152 @@
+"""
+Unit tests for the in-memory repositories
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pagination
+import sfide_progress
+from plan_edits import edit_operations
+from repositories import memory_repositories, path_exists, project
+
+NOW = datetime(2026, 3, 16, 12, 0, tzinfo=timezone.utc)
+WALKS = pagination.ListSpec("walks", "data", "walk_id", 100, exclude=("percorso",))
+PLANS = pagination.ListSpec("plans", "created_at", "plan_id", 50)
+
+
+def run(coro):
+    return asyncio.new_event_loop().run_until_complete(coro)
+
+
+def walk(i, user_id="u1", day=1):
+    return {"walk_id": f"w{i}", "user_id": user_id, "distanza_km": 1.0 + i, "passi": 1000,
+            "velocita_media_kmh": 4.0, "data": f"2026-03-{day:02d}T10:00:00+00:00", "percorso": [{"lat": 1, "lng": 2}]}
+
+
+def repos_with(*walks):
+    repos = memory_repositories()
+    for w in walks:
+        run(repos.walks.insert(w))
+    return repos
+
+
+class TestProject:
+    DOC = {"_id": 1, "a": 1, "b": {"c": 2, "d": 3}, "esercizi": [{"nome": "Squat", "sets": [1]}, "x", {"sets": [2]}]}
+
+    def test_full_copy_without_id(self):
+        out = project(self.DOC, exclude=("a",))
+        assert out == {"b": {"c": 2, "d": 3}, "esercizi": self.DOC["esercizi"]}
+        out["b"]["c"] = 9
+        assert self.DOC["b"]["c"] == 2
+
+    def test_dotted_paths(self):
+        assert project(self.DOC, ["b.c", "esercizi.nome"]) == {"b": {"c": 2}, "esercizi": [{"nome": "Squat"}, {}]}
+
+    def test_keeps_document_order(self):
+        assert list(project(self.DOC, ["esercizi.sets", "a"])) == ["a", "esercizi"]
+
+    def test_path_exists(self):
+        plan = {"giorni": [{"attivita": [{"nome": "Squat"}]}]}
+        assert path_exists(plan, "giorni.0.attivita.0")
+        assert not path_exists(plan, "giorni.0.attivita.1")
+        assert not path_exists(plan, "giorni.1.attivita.0")
+
+
+class TestPage:
+    def test_order_and_cursor(self):
+        repos = repos_with(walk(1, day=1), walk(2, day=3), walk(3, day=3), walk(4, day=2), walk(5, "u2"))
+        docs = run(repos.walks.page(WALKS, "u1", None, 2, None))
+        assert [d["walk_id"] for d in docs] == ["w3", "w2", "w4"]
+        items, cursor = pagination.split_page(WALKS, docs, 2)
+        rest = run(repos.walks.page(WALKS, "u1", cursor, 2, None))
+        assert [d["walk_id"] for d in rest] == ["w4", "w1"]
+
+    def test_exclude_unless_asked(self):
+        repos = repos_with(walk(1))
+        assert "percorso" not in run(repos.walks.page(WALKS, "u1", None, 10, None))[0]
+        fields = pagination.parse_fields("percorso.lat", WALKS)
+        assert run(repos.walks.page(WALKS, "u1", None, 10, fields)) == [
+            {"walk_id": "w1", "data": "2026-03-01T10:00:00+00:00", "percorso": [{"lat": 1}]}]
+
+    def test_invalid_cursor(self):
+        repos = repos_with(walk(1))
+        try:
+            run(repos.walks.page(WALKS, "u1", "zz", 10, None))
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("cursore non valido accettato")
+
+    def test_newest(self):
+        repos = repos_with(walk(1, day=1), walk(2, day=5), walk(3, day=3))
+        docs = run(repos.walks.newest("u1", "2026-03-03", 10, ("percorso",)))
+        assert [d["walk_id"] for d in docs] == ["w2", "w3"] and "percorso" not in docs[0]
+        assert [d["walk_id"] for d in run(repos.walks.newest("u1", None, 1))] == ["w2"]
+
+
+class TestSessions:
+    def test_resolve(self):
+        repos = memory_repositories()
+        run(repos.users.insert({"user_id": "u1", "email": "a@x"}))
+        run(repos.sessions.insert({"user_id": "u1", "session_token": "t1", "expires_at": NOW + timedelta(seconds=5)}))
+        run(repos.sessions.insert({"user_id": "u1", "session_token": "t2", "expires_at": "2026-03-16T11:00:00"}))
+        session = run(repos.sessions.resolve("t1", NOW))
+        assert session["expires_in_ms"] == 5000 and session["user"] == {"user_id": "u1", "email": "a@x"}
+        assert run(repos.sessions.resolve("t2", NOW))["expires_in_ms"] == -3600 * 1000
+        run(repos.sessions.delete("t1"))
+        assert run(repos.sessions.resolve("t1", NOW)) is None
+
+
+class TestPlans:
+    def plan(self, plan_id, created_at):
+        return {"plan_id": plan_id, "user_id": "u1", "attivo": True, "created_at": created_at,
+                "giorni": [{"giorno": "Lunedì", "attivita": [{"nome": "Squat", "serie": 2}]}]}
+
+    def test_insert_active(self):
+        repos = memory_repositories()
+        run(repos.plans.insert_active(self.plan("p1", "2026-03-01")))
+        run(repos.plans.insert_active(self.plan("p2", "2026-03-02")))
+        docs = run(repos.plans.page(PLANS, "u1", None, 10, pagination.parse_fields("attivo", PLANS)))
+        assert [(d["plan_id"], d["attivo"]) for d in docs] == [("p2", True), ("p1", False)]
+
+    def test_edit(self):
+        repos = memory_repositories()
+        run(repos.plans.insert_active(self.plan("p1", "2026-03-01")))
+        conditions, fields = edit_operations([{"giorno_index": 0, "exercise_index": 0, "serie": 4}])
+        assert run(repos.plans.edit("p1", "u1", conditions, fields))["giorni"][0]["attivita"][0]["serie"] == 4
+        conditions, fields = edit_operations([{"giorno_index": 0, "exercise_index": 0, "serie": 5},
+                                              {"giorno_index": 0, "exercise_index": 1, "serie": 5}])
+        assert run(repos.plans.edit("p1", "u1", conditions, fields)) is None
+        assert run(repos.plans.get("p1", "u1"))["giorni"][0]["attivita"][0]["serie"] == 4
+        assert run(repos.plans.edit("p1", "u2", conditions, fields)) is None
+
+
+class TestSfide:
+    def test_check_progress(self):
+        repos = repos_with(walk(1, day=15), walk(2, day=1))
+        run(repos.sfide.insert_many([
+            {"sfida_id": "s1", "user_id": "u1", "target_field": "km", "target_value": 5, "current_value": 0,
+             "completata": False, "created_at": "2026-03-10T00:00:00+00:00", "scadenza": "2026-03-17T00:00:00+00:00"},
+            {"sfida_id": "s2", "user_id": "u1", "target_field": "km", "target_value": 1, "current_value": 0,
+             "completata": False, "created_at": "2026-03-01T00:00:00+00:00", "scadenza": "2026-03-08T00:00:00+00:00"},
+        ]))
+        updated, changed = run(repos.sfide.check_progress("u1", NOW))
+        assert changed and [(s["sfida_id"], s["current_value"]) for s in updated] == [("s1", 2.0)]
+        stored = {s["sfida_id"]: s for s in repos.sfide.docs}
+        assert stored["s1"]["current_value"] == 2.0 and stored["s2"].get("scaduta")
+        assert run(repos.sfide.check_progress("u1", NOW)) == (updated, False)
+
+    def test_check_progress_over_doc_limit_matches_mongo(self, mock_db):
+        # Inserted oldest first; the newest, longest walk is the one past DOC_LIMIT
+        walks = [dict(walk(i, day=1), data=f"2026-03-11T{i // 60:02d}:{i % 60:02d}:00+00:00", distanza_km=1.0)
+                 for i in range(sfide_progress.DOC_LIMIT)]
+        walks.append(dict(walk(999), data="2026-03-15T10:00:00+00:00", distanza_km=50.0))
+        sfida = {"sfida_id": "s1", "user_id": "u1", "target_field": "km", "target_value": 500, "current_value": 0,
+                 "completata": False, "created_at": "2026-03-10T00:00:00+00:00", "scadenza": "2026-03-17T00:00:00+00:00"}
+        repos = repos_with(*walks)
+        run(repos.sfide.insert_many([sfida]))
+        run(mock_db.walks.insert_many([dict(w) for w in walks]))
+        run(mock_db.sfide.insert_one(dict(sfida)))
+        memory, _ = run(repos.sfide.check_progress("u1", NOW))
+        mongo, _ = run(sfide_progress.check_progress(mock_db, "u1", NOW))
+        assert memory[0]["current_value"] == mongo[0]["current_value"] == 50.0 + sfide_progress.DOC_LIMIT - 1
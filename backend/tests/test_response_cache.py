@@ -0,0 +1,67 @@
+"""
+Unit tests for the per-user versioned response cache
+"""
+import asyncio
+
+from http_cache import cached_body
+from repositories import MongoUsers
+from response_cache import ResponseCache
+
+
+class TestResponseCache:
+    def test_hit_until_the_version_changes(self):
+        cache = ResponseCache(maxsize=10)
+        body = cached_body([{"walk_id": "w1"}])
+        cache.put("u1", ("walks",), 0, body)
+        assert cache.get("u1", ("walks",), 0) == body
+        # Another worker wrote: the user document now says 1
+        assert cache.get("u1", ("walks",), 1) is None
+        assert cache.hits == 1 and cache.misses == 1
+        assert cache.stats()["size"] == 0
+
+    def test_invalidate_is_per_user(self):
+        cache = ResponseCache(maxsize=10)
+        cache.put("u1", ("walks",), 0, cached_body([1]))
+        cache.put("u2", ("walks",), 0, cached_body([2]))
+        cache.invalidate("u1")
+        assert cache.get("u1", ("walks",), 0) is None
+        assert cache.get("u2", ("walks",), 0) is not None
+
+    def test_stale_version_is_not_stored(self):
+        cache = ResponseCache(maxsize=10)
+        cache.put("u1", ("walks",), 1, cached_body([1]))
+        # Built from data read before the write that made version 1
+        cache.put("u1", ("stats",), 0, cached_body({"km": 1}))
+        assert cache.get("u1", ("stats",), 0) is None and cache.get("u1", ("stats",), 1) is None
+
+    def test_lru_eviction_by_count_and_bytes(self):
+        cache = ResponseCache(maxsize=2)
+        cache.put("u1", ("a",), 0, cached_body("a"))
+        cache.put("u1", ("b",), 0, cached_body("b"))
+        cache.get("u1", ("a",), 0)
+        cache.put("u1", ("c",), 0, cached_body("c"))
+        assert cache.get("u1", ("b",), 0) is None and cache.get("u1", ("a",), 0) is not None
+        small = ResponseCache(maxsize=10, max_bytes=20)
+        small.put("u1", ("a",), 0, cached_body("x" * 10))
+        small.put("u1", ("b",), 0, cached_body("y" * 10))
+        assert small.get("u1", ("a",), 0) is None
+        assert small.bytes <= 20
+
+    def test_expired_entry(self):
+        cache = ResponseCache(maxsize=10, ttl=0)
+        cache.put("u1", ("walks",), 0, cached_body([]))
+        assert cache.get("u1", ("walks",), 0) is None
+        assert cache.bytes == 0
+
+    def test_write_on_another_worker(self, mock_db):
+        users = MongoUsers(mock_db)
+        worker_a, worker_b = ResponseCache(maxsize=10), ResponseCache(maxsize=10)
+
+        async def scenario():
+            await users.insert({"user_id": "u1"})
+            worker_b.put("u1", ("walks",), await users.data_version("u1"), cached_body([]))
+            await users.bump_version(["u1"])  # worker A stores a walk
+            worker_a.invalidate("u1")
+            return worker_b.get("u1", ("walks",), await users.data_version("u1"))
+
+        assert asyncio.new_event_loop().run_until_complete(scenario()) is None
@@ -0,0 +1,93 @@
+"""
+Unit tests for the response models and the orjson encoding of cached bodies
+"""
+from datetime import datetime, timezone
+from typing import List
+
+import orjson
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter
+
+import stats_engine
+from http_cache import dump_json
+from response_models import CircuitOut, PlanOut, SfidaOut, StatsOut, UserOut, WalkOut
+
+WALK = {"walk_id": "w1", "user_id": "u1", "distanza_km": 2.5, "tempo_secondi": 1800, "passi": 3800,
+        "velocita_media_kmh": 5.0, "note": None, "data": "2026-10-01T10:00:00+00:00", "punti_percorso": 0,
+        "analisi": {"parziali": [{"km": 1, "secondi": 700}]}}
+
+
+def serialize(annotation, content):
+    adapter = TypeAdapter(annotation)
+    return adapter.dump_python(adapter.validate_python(content), mode="json")
+
+
+def shape(value):
+    """``value`` with every leaf replaced by its type, so 5 and 5.0 differ."""
+    if isinstance(value, dict):
+        return {k: shape(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [shape(v) for v in value]
+    return type(value)
+
+
+def baseline(content):
+    """What the endpoint returned before it had a response model: the document as JSON."""
+    return orjson.loads(orjson.dumps(content))
+
+
+class TestResponseModels:
+    def test_extra_fields_pass_through(self):
+        assert serialize(WalkOut, WALK) == WALK
+
+    def test_missing_optional_fields_are_not_added(self):
+        plan = {"plan_id": "p1", "user_id": "u1", "nome": "Mio", "tipo": "manuale", "attivo": True,
+                "created_at": "2026-10-01", "giorni": [{"giorno": "Lunedì"}]}
+        assert serialize(PlanOut, plan) == plan
+
+    def test_user_bookkeeping_is_not_sent(self):
+        user = {"user_id": "u1", "email": "a@b.it", "nome": "Ada", "data_version": 7, "rollup_version": 2}
+        assert serialize(UserOut, user) == {"user_id": "u1", "email": "a@b.it", "nome": "Ada"}
+
+    def test_legacy_sfida_without_dates(self):
+        sfida = {"sfida_id": "s1", "user_id": "u1", "target_field": "km", "target_value": 5,
+                 "current_value": 1.5, "completata": False}
+        assert serialize(List[SfidaOut], [sfida])[0]["current_value"] == 1.5
+
+
+class TestDumpJson:
+    def test_matches_default_response_class(self):
+        content = {"città": "Milano", "km": [1.5, 2], 3: None}
+        assert dump_json(content) == ORJSONResponse(content).body
+        assert dump_json(content) == '{"città":"Milano","km":[1.5,2],"3":null}'.encode()
+
+
+class TestNumberTypes:
+    NOW = datetime(2026, 10, 1, 18, 0, tzinfo=timezone.utc)
+
+    def test_sfida_ints_stay_ints(self):
+        sfida = {"sfida_id": "s1", "user_id": "u1", "target_field": "passi", "target_value": 10000,
+                 "current_value": 0, "completata": False}
+        out = serialize(List[SfidaOut], [sfida, dict(sfida, target_value=5.5, current_value=1.5)])
+        assert shape(out) == shape(baseline([sfida, dict(sfida, target_value=5.5, current_value=1.5)]))
+
+    def test_walk_and_circuit_numbers(self):
+        walk = dict(WALK, distanza_km=3, velocita_media_kmh=0)
+        assert shape(serialize(WalkOut, walk)) == shape(baseline(walk))
+        circuit = {"circuit_id": "c1", "user_id": "u1", "durata_minuti": 20, "note": None, "data": "2026-10-01",
+                   "esercizi": [{"exercise_id": "ex_squat_sedia", "nome": "Squat", "sets": [
+                       {"set_number": 1, "ripetizioni": 10, "peso_kg": 2, "completato": True},
+                       {"set_number": 2, "ripetizioni": 10, "peso_kg": 2.5, "completato": True}]}]}
+        assert shape(serialize(CircuitOut, circuit)) == shape(baseline(circuit))
+
+    def test_stats_match_the_unmodelled_response(self):
+        walks = [{"distanza_km": 2.5, "passi": 3000, "tempo_secondi": 1800, "velocita_media_kmh": 5.0,
+                  "data": "2026-10-01T09:00:00+00:00"},
+                 {"distanza_km": 1, "passi": 1200, "tempo_secondi": 900, "velocita_media_kmh": 4,
+                  "data": "2026-09-30T09:00:00+00:00"}]
+        circuits = [{"durata_minuti": 20, "data": "2026-10-01T10:00:00+00:00", "esercizi": [
+            {"exercise_id": "ex_squat_sedia", "nome": "Squat",
+             "sets": [{"set_number": 1, "ripetizioni": 10, "peso_kg": 2, "completato": True}]}]}]
+        stats = stats_engine.compute_stats(walks, circuits, self.NOW)
+        assert serialize(StatsOut, stats) == baseline(stats)
+        assert shape(serialize(StatsOut, stats)) == shape(baseline(stats))
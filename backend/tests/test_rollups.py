@@ -0,0 +1,165 @@
+"""
+Unit tests for the daily activity rollups
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+import rollups
+import stats_engine
+
+NOW = datetime(2026, 3, 15, 18, 0, tzinfo=timezone.utc)
+
+
+def run(coro):
+    return asyncio.new_event_loop().run_until_complete(coro)
+
+
+def _at(days_ago, hour=9):
+    return (NOW - timedelta(days=days_ago)).replace(hour=hour).isoformat()
+
+
+def _walk(days_ago, km, passi=1000, hour=9, walk_id=None):
+    walk = {"user_id": "u1", "distanza_km": km, "passi": passi, "tempo_secondi": 1800,
+            "velocita_media_kmh": 4.0, "percorso": [], "data": _at(days_ago, hour)}
+    if walk_id:
+        walk["walk_id"] = walk_id
+    return walk
+
+
+def _circuit(days_ago, reps=10, peso=2, durata=20):
+    return {"user_id": "u1", "durata_minuti": durata, "data": _at(days_ago),
+            "esercizi": [
+                {"exercise_id": "ex_squat_sedia", "nome": "Squat",
+                 "sets": [{"set_number": 1, "ripetizioni": reps, "peso_kg": peso, "completato": True},
+                          {"set_number": 2, "ripetizioni": reps, "peso_kg": peso + 1, "completato": False}]},
+                {"exercise_id": "ex_legacy", "nome": "Legacy", "serie": 2, "ripetizioni": 5, "peso_kg": 1},
+            ]}
+
+
+WALKS = sorted([_walk(0, 2.0), _walk(1, 3.5), _walk(2, 1.0), _walk(10, 5.0, 8000), _walk(40, 4.0)],
+               key=lambda w: w["data"], reverse=True)
+CIRCUITS = sorted([_circuit(0), _circuit(3, reps=12), _circuit(20, peso=4)], key=lambda c: c["data"], reverse=True)
+
+
+class TestRollups:
+    def test_rollups_match_full_scan(self):
+        docs = {}
+        for w in WALKS:
+            key, update = rollups.walk_rollup_update(w)
+            rollups.apply_update(docs.setdefault(key["_id"], {}), update)
+        for c in CIRCUITS:
+            key, update = rollups.circuit_rollup_update(c)
+            rollups.apply_update(docs.setdefault(key["_id"], {}), update)
+        days = sorted(docs.values(), key=lambda d: d["giorno"], reverse=True)
+        edges = [d for d in WALKS + CIRCUITS if d["data"][:10] in {s[:10] for s, _ in rollups.window_edges(NOW)}]
+        from_rollups = rollups.stats_from_rollups(
+            days, WALKS[:30], CIRCUITS[:30],
+            [d for d in edges if "distanza_km" in d], [d for d in edges if "esercizi" in d], NOW)
+        assert from_rollups == stats_engine.compute_stats(WALKS, CIRCUITS, NOW)
+
+    def test_exercise_keys_are_escaped(self):
+        circuit = _circuit(0)
+        circuit["esercizi"][0]["exercise_id"] = "curl.bicipiti"
+        _, update = rollups.circuit_rollup_update(circuit)
+        assert all(path.count(".") == 1 for path in update["$inc"] if path.startswith("volume_per_esercizio"))
+
+    def test_update_skips_counted_ids(self):
+        key, update = rollups.walk_rollup_update(_walk(0, 2.0, walk_id="w1"))
+        assert key["ids"] == {"$ne": "w1"} and update["$addToSet"] == {"ids": "w1"}
+
+
+class TestRecord:
+    def test_record_is_idempotent(self, mock_db):
+        walk = _walk(0, 2.0, walk_id="w1")
+        assert run(rollups.record_walk(mock_db, walk)) is True
+        assert run(rollups.record_walk(mock_db, walk)) is False
+        assert run(rollups.record_walk(mock_db, _walk(0, 1.0, walk_id="w2"))) is True
+        day = run(mock_db[rollups.ROLLUP_COLLECTION].find_one({}))
+        assert day["camminate"] == 2 and day["km"] == 3.0 and day["ids"] == ["w1", "w2"]
+
+    def test_apply_updates_counts_only_new(self, mock_db):
+        run(rollups.record_walk(mock_db, _walk(0, 2.0, walk_id="w1")))
+        updates = [rollups.walk_rollup_update(_walk(0, 2.0, walk_id=w)) for w in ("w1", "w2")]
+        assert run(rollups.apply_updates(mock_db, updates)) == 1
+        assert run(mock_db[rollups.ROLLUP_COLLECTION].find_one({}))["camminate"] == 2
+
+
+class RacingDb:
+    """Database whose next rollup upsert loses the race to create the day document to ``other``.
+
+    Both upserts found no document; ``other`` inserted it first and this one gets the
+    duplicate key error Mongo raises instead of retrying.
+    """
+    def __init__(self, db, other):
+        self.db, self.other = db, other
+
+    def __getitem__(self, name):
+        collection = self.db[name]
+        racing = self
+
+        class Rollups:
+            def __getattr__(self, attr):
+                return getattr(collection, attr)
+
+            async def update_one(self, key, update, upsert=False):
+                if upsert and racing.other:
+                    await collection.update_one(*racing.other.pop(), upsert=True)
+                    raise DuplicateKeyError("E11000")
+                return await collection.update_one(key, update, upsert=upsert)
+
+            async def bulk_write(self, ops, ordered=True):
+                if racing.other:
+                    await collection.update_one(*racing.other.pop(), upsert=True)
+                    await collection.bulk_write(ops[1:], ordered=ordered)
+                    raise BulkWriteError({"writeErrors": [{"index": 0, "code": 11000}], "nInserted": 0})
+                return await collection.bulk_write(ops, ordered=ordered)
+
+        return Rollups() if name == rollups.ROLLUP_COLLECTION else collection
+
+
+class TestConcurrentDay:
+    def test_record_losing_the_insert_race_is_applied(self, mock_db):
+        other = [rollups.walk_rollup_update(_walk(0, 1.0, walk_id="w1"))]
+        assert run(rollups.record_walk(RacingDb(mock_db, other), _walk(0, 2.0, walk_id="w2"))) is True
+        day = run(mock_db[rollups.ROLLUP_COLLECTION].find_one({}))
+        assert day["camminate"] == 2 and day["km"] == 3.0 and sorted(day["ids"]) == ["w1", "w2"]
+
+    def test_apply_updates_losing_the_insert_race_is_applied(self, mock_db):
+        other = [rollups.walk_rollup_update(_walk(0, 1.0, walk_id="w1"))]
+        updates = [rollups.walk_rollup_update(_walk(0, 2.0, walk_id="w2")),
+                   rollups.walk_rollup_update(_walk(1, 4.0, walk_id="w3"))]
+        assert run(rollups.apply_updates(RacingDb(mock_db, other), updates)) == 2
+        days = run(mock_db[rollups.ROLLUP_COLLECTION].find({}).sort("giorno", -1).to_list(None))
+        assert [(d["camminate"], d["km"]) for d in days] == [(2, 3.0), (1, 4.0)]
+
+    def test_replay_stays_a_no_op(self, mock_db):
+        run(rollups.record_walk(mock_db, _walk(0, 2.0, walk_id="w1")))
+        assert run(rollups.record_walk(mock_db, _walk(0, 2.0, walk_id="w1"))) is False
+        assert run(rollups.apply_updates(mock_db, [rollups.walk_rollup_update(_walk(0, 2.0, walk_id="w1"))])) == 0
+        assert run(mock_db[rollups.ROLLUP_COLLECTION].find_one({}))["camminate"] == 1
+
+
+class TestEnsureUser:
+    def test_rebuilds_users_without_current_rollups(self, mock_db):
+        run(mock_db.users.insert_one({"user_id": "u1"}))
+        run(mock_db.walks.insert_many([_walk(0, 2.0, walk_id="w1"), _walk(1, 3.0, walk_id="w2")]))
+        # Left by the code before the ids: counts w1 twice
+        run(mock_db[rollups.ROLLUP_COLLECTION].insert_one(
+            {"_id": rollups.rollup_id("u1", _at(0)[:10]), "user_id": "u1", "giorno": _at(0)[:10], "camminate": 2, "km": 4.0}))
+        user = run(mock_db.users.find_one({"user_id": "u1"}))
+        assert run(rollups.ensure_user(mock_db, user)) is True
+        days = run(mock_db[rollups.ROLLUP_COLLECTION].find({}).to_list(None))
+        assert sorted((d["camminate"], d["km"]) for d in days) == [(1, 2.0), (1, 3.0)]
+        user = run(mock_db.users.find_one({"user_id": "u1"}))
+        assert user["rollup_version"] == rollups.ROLLUP_VERSION
+        assert run(rollups.ensure_user(mock_db, user)) is False
+
+    def test_rebuild_then_live_upsert_counts_once(self, mock_db):
+        walk = _walk(0, 2.0, walk_id="w1")
+        run(mock_db.walks.insert_one(dict(walk)))
+        run(rollups.backfill_user(mock_db, "u1"))
+        # The upsert of an insert the rebuild already read lands afterwards
+        assert run(rollups.record_walk(mock_db, walk)) is False
+        assert run(mock_db[rollups.ROLLUP_COLLECTION].find_one({}))["camminate"] == 1
@@ -0,0 +1,78 @@
+"""
+Unit tests for the vectorized route analytics
+"""
+import asyncio
+import random
+
+import numpy as np
+
+import route_analytics
+
+M_PER_DEG_LAT = 111_195.0  # haversine metres per degree of latitude
+
+
+def run(coro):
+    return asyncio.new_event_loop().run_until_complete(coro)
+
+
+def _track(speeds_kmh, step_s=5.0, jitter_m=0.0, seed=0):
+    """Due-north track with one fix every ``step_s`` seconds at the given speeds."""
+    rnd = random.Random(seed)
+    lat, t = [45.0], [0.0]
+    for v in speeds_kmh:
+        lat.append(lat[-1] + v / 3.6 * step_s / M_PER_DEG_LAT)
+        t.append(t[-1] + step_s)
+    lat = np.array(lat) + np.array([rnd.gauss(0, jitter_m) for _ in lat]) / M_PER_DEG_LAT
+    return lat, np.full(len(lat), 9.0), np.array(t)
+
+
+class TestRouteAnalytics:
+    def test_steady_walk(self):
+        # 1.5 km at 4 km/h
+        result = route_analytics.analyze(*_track([4.0] * 270))
+        assert abs(result["distanza_km"] - 1.5) < 0.01
+        assert result["tempo_fermo_sec"] == 0
+        assert result["velocita_media_movimento_kmh"] == 4.0
+        assert [s["km"] for s in result["parziali"]] == [1]
+        assert abs(result["parziali"][0]["passo_min_km"] - 15.0) < 0.05
+
+    def test_stationary_jitter_is_not_distance(self):
+        result = route_analytics.analyze(*_track([0.0] * 120, jitter_m=3.0))
+        assert result["distanza_km"] < 0.05
+        assert result["tempo_fermo_sec"] > 0.8 * result["tempo_totale_sec"]
+
+    def test_spike_is_dropped(self):
+        lat, lng, t = _track([4.0] * 60)
+        lat[30] += 0.01  # ~1 km off the track for one fix
+        result = route_analytics.analyze(lat, lng, t)
+        assert result["punti_scartati"] == 1
+        assert abs(result["distanza_km"] - 0.33) < 0.01
+
+    def test_sustained_speed_picks_the_fast_stretch(self):
+        result = route_analytics.analyze(*_track([3.0] * 60 + [5.5] * 24 + [3.0] * 60))
+        assert 5.0 <= result["velocita_max_sostenuta_kmh"] <= 5.6
+
+    def test_untimed_points_use_the_walk_duration(self):
+        points = [{"lat": 45.0 + i * 0.0001, "lng": 9.0} for i in range(101)]
+        result = route_analytics.analyze_points(points, durata_sec=600)
+        assert result["tempo_totale_sec"] == 600
+        assert result["distanza_km"] == 1.11
+
+    def test_unordered_timestamps_are_sorted(self):
+        lat, lng, t = _track([4.0] * 60 + [0.0] * 30 + [4.0] * 60)
+        points = [{"lat": a, "lng": b, "timestamp": int(s * 1000) + 1_700_000_000_000} for a, b, s in zip(lat, lng, t)]
+        shuffled = points[:]
+        random.Random(1).shuffle(shuffled)
+        assert route_analytics.analyze_points(shuffled) == route_analytics.analyze_points(points)
+
+
+class TestRecompute:
+    def test_skips_malformed_routes(self, mock_db):
+        good = [{"lat": 45.0 + i * 0.0001, "lng": 9.0} for i in range(11)]
+        run(mock_db.walks.insert_many([
+            {"walk_id": "w1", "user_id": "u1", "tempo_secondi": 60, "percorso": good},
+            {"walk_id": "w2", "user_id": "u1", "tempo_secondi": 60, "percorso": [{"latitude": 45}, {"lat": "x"}]},
+        ]))
+        assert run(route_analytics.recompute_user(mock_db, "u1")) == 1
+        assert "analisi" in run(mock_db.walks.find_one({"walk_id": "w1"}))
+        assert "analisi" not in run(mock_db.walks.find_one({"walk_id": "w2"}))
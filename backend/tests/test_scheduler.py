@@ -0,0 +1,138 @@
+"""
+Unit tests for the maintenance scheduler
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import rollups
+import scheduler
+import walk_ingest
+from scheduler import Job, Scheduler
+
+NOW = datetime(2026, 3, 15, 18, 0, tzinfo=timezone.utc)
+
+
+def run(coro):
+    return asyncio.new_event_loop().run_until_complete(coro)
+
+
+async def _noop(db, now, **_):
+    return 0
+
+
+class _Changes(list):
+    """on_change hook recording the user_ids it is awaited with."""
+    async def __call__(self, *user_ids):
+        self.extend(user_ids)
+
+
+class TestScheduler:
+    def test_next_delay_stays_within_jitter(self):
+        delays = [scheduler.next_delay(600, jitter=0.1) for _ in range(200)]
+        assert all(540 <= d <= 660 for d in delays)
+        assert len(set(delays)) > 1
+
+    def test_owners_are_unique_per_instance(self):
+        assert Scheduler([]).owner != Scheduler([]).owner
+
+    def test_stats_before_any_run(self):
+        stats = Scheduler([Job("pulizia", 60, _noop)]).stats()["jobs"]["pulizia"]
+        assert stats["runs"] == 0 and stats["avg_ms"] == 0.0 and stats["last_run_at"] is None
+        assert "total_ms" not in stats
+
+    def test_default_jobs_are_named_uniquely(self):
+        names = [job.name for job in scheduler.DEFAULT_JOBS]
+        assert len(names) == len(set(names))
+
+
+class TestRepairRollups:
+    def test_applies_missing_rollups_once(self, mock_db):
+        now = datetime.now(timezone.utc)
+        walk = {"walk_id": "w1", "user_id": "u1", "distanza_km": 2.0, "passi": 100, "data": now.isoformat()}
+        run(mock_db.walks.insert_one(walk))
+        changed = _Changes()
+        assert run(scheduler.repair_rollups(mock_db, now, on_change=changed)) == 1
+        assert run(scheduler.repair_rollups(mock_db, now, on_change=changed)) == 0
+        assert changed == ["u1"]
+        assert run(mock_db[rollups.ROLLUP_COLLECTION].find_one({}))["km"] == 2.0
+
+
+class TestLease:
+    JOB = Job("pulizia", 60, _noop)
+
+    def lease(self, db):
+        return run(db[scheduler.LOCK_COLLECTION].find_one({"_id": self.JOB.name}))
+
+    def test_owner_renews_its_lease(self, mock_db):
+        worker = Scheduler([self.JOB])
+        assert run(worker.acquire(mock_db, self.JOB, NOW)) is True
+        assert run(worker.acquire(mock_db, self.JOB, NOW + timedelta(seconds=30))) is True
+        lease = self.lease(mock_db)
+        assert lease["owner"] == worker.owner
+        assert lease["scade_at"].replace(tzinfo=timezone.utc) == NOW + timedelta(seconds=90)
+
+    def test_held_lease_is_refused(self, mock_db):
+        owner, other = Scheduler([self.JOB]), Scheduler([self.JOB])
+        assert run(owner.acquire(mock_db, self.JOB, NOW)) is True
+        # The upsert collides with the owner's lease document: DuplicateKeyError
+        assert run(other.acquire(mock_db, self.JOB, NOW + timedelta(seconds=59))) is False
+        assert self.lease(mock_db)["owner"] == owner.owner
+
+    def test_expired_lease_is_taken_over(self, mock_db):
+        owner, other = Scheduler([self.JOB]), Scheduler([self.JOB])
+        run(owner.acquire(mock_db, self.JOB, NOW))
+        assert run(other.acquire(mock_db, self.JOB, NOW + timedelta(seconds=60))) is True
+        assert self.lease(mock_db)["owner"] == other.owner
+        assert run(owner.acquire(mock_db, self.JOB, NOW + timedelta(seconds=61))) is False
+
+    def test_run_once_skips_without_the_lease(self, mock_db):
+        owner, other = Scheduler([self.JOB]), Scheduler([self.JOB])
+        assert run(owner.run_once(mock_db, self.JOB)) == 0
+        assert run(other.run_once(mock_db, self.JOB)) is None
+        assert other.stats()["jobs"]["pulizia"]["skipped"] == 1 and other.stats()["jobs"]["pulizia"]["runs"] == 0
+
+
+class TestSweeps:
+    def test_purge_sessions(self, mock_db):
+        run(mock_db.user_sessions.insert_many([
+            {"session_token": "scaduta", "expires_at": NOW - timedelta(hours=1)},
+            {"session_token": "stringa_scaduta", "expires_at": (NOW - timedelta(hours=1)).isoformat()},
+            {"session_token": "senza_scadenza"},
+            {"session_token": "valida", "expires_at": NOW + timedelta(hours=1)},
+            {"session_token": "stringa_valida", "expires_at": (NOW + timedelta(hours=1)).isoformat()},
+        ]))
+        assert run(scheduler.purge_sessions(mock_db, NOW)) == 3
+        left = run(mock_db.user_sessions.find({}).to_list(None))
+        assert sorted(d["session_token"] for d in left) == ["stringa_valida", "valida"]
+
+    def test_expire_sfide(self, mock_db):
+        past, future = (NOW - timedelta(days=1)).isoformat(), (NOW + timedelta(days=1)).isoformat()
+        run(mock_db.sfide.insert_many([
+            {"sfida_id": "s1", "user_id": "u1", "completata": False, "scadenza": past},
+            {"sfida_id": "s2", "user_id": "u2", "completata": False, "scadenza": past},
+            {"sfida_id": "s3", "user_id": "u1", "completata": True, "scadenza": past},
+            {"sfida_id": "s4", "user_id": "u1", "completata": False, "scadenza": future},
+        ]))
+        changed = _Changes()
+        assert run(scheduler.expire_sfide(mock_db, NOW, on_change=changed)) == 2
+        assert sorted(changed) == ["u1", "u2"]
+        flagged = run(mock_db.sfide.find({"scaduta": True}).to_list(None))
+        assert sorted(s["sfida_id"] for s in flagged) == ["s1", "s2"]
+        assert run(scheduler.expire_sfide(mock_db, NOW, on_change=changed)) == 0
+
+    def test_close_abandoned_walks(self, mock_db):
+        old = (NOW - scheduler.ABANDONED_AFTER - timedelta(minutes=1)).isoformat()
+        run(mock_db[walk_ingest.ACTIVE_COLLECTION].insert_many([
+            {"_id": "con_punti", "user_id": "u1", "data": old, "aggiornata_at": old},
+            {"_id": "vuota", "user_id": "u2", "data": old, "aggiornata_at": old},
+            {"_id": "recente", "user_id": "u3", "data": old, "aggiornata_at": NOW.isoformat()},
+        ]))
+        run(mock_db[walk_ingest.POINTS_COLLECTION].insert_many(
+            [{"walk_id": "con_punti", "seq": i, "lat": 45.0 + i * 0.001, "lng": 9.0} for i in range(3)]))
+        changed, created = _Changes(), []
+        closed = run(scheduler.close_abandoned_walks(mock_db, NOW, on_change=changed, on_walk_created=created.append))
+        assert closed == 2 and changed == ["u1"]
+        assert [w["walk_id"] for w in created] == ["con_punti"] and created[0]["punti_percorso"] == 3
+        assert run(mock_db.walks.count_documents({})) == 1
+        active = run(mock_db[walk_ingest.ACTIVE_COLLECTION].find({}).to_list(None))
+        assert [w["_id"] for w in active] == ["recente"]
@@ -0,0 +1,43 @@
+"""
+Unit tests for the in-process session cache used by get_current_user
+"""
+from session_cache import SessionCache
+
+
+class TestSessionCache:
+    def test_hit_and_miss_counters(self):
+        cache = SessionCache(maxsize=10, ttl=60)
+        assert cache.get("tok") is None
+        cache.put("tok", {"user_id": "u1", "nome": "Walt"}, 3600)
+        assert cache.get("tok")["nome"] == "Walt"
+        assert cache.hits == 1 and cache.misses == 1
+
+    def test_expired_session_is_not_cached(self):
+        cache = SessionCache(maxsize=10, ttl=60)
+        cache.put("tok", {"user_id": "u1"}, -5)
+        assert cache.get("tok") is None
+
+    def test_lru_eviction(self):
+        cache = SessionCache(maxsize=2, ttl=60)
+        cache.put("a", {"user_id": "u1"}, 3600)
+        cache.put("b", {"user_id": "u2"}, 3600)
+        cache.get("a")
+        cache.put("c", {"user_id": "u3"}, 3600)
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.evictions == 1
+
+    def test_invalidate_user_drops_all_tokens(self):
+        cache = SessionCache(maxsize=10, ttl=60)
+        cache.put("a", {"user_id": "u1"}, 3600)
+        cache.put("b", {"user_id": "u1"}, 3600)
+        cache.put("c", {"user_id": "u2"}, 3600)
+        cache.invalidate_user("u1")
+        assert cache.get("a") is None and cache.get("b") is None
+        assert cache.get("c") is not None
+
+    def test_returned_doc_is_a_copy(self):
+        cache = SessionCache(maxsize=10, ttl=60)
+        cache.put("tok", {"user_id": "u1", "livello": "Principiante"}, 3600)
+        cache.get("tok")["livello"] = "Avanzato"
+        assert cache.get("tok")["livello"] == "Principiante"
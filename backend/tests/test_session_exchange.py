@@ -0,0 +1,142 @@
+"""
+Unit tests for the OAuth session exchange client and its circuit breaker
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from session_exchange import CircuitBreaker, InvalidSession, SessionExchange, UpstreamUnavailable
+
+
+def run(coro):
+    return asyncio.new_event_loop().run_until_complete(coro)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def exchange(answers, **kwargs):
+    """SessionExchange over a transport replaying ``answers``: status codes or exceptions."""
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers["X-Session-ID"])
+        answer = answers[min(len(seen), len(answers)) - 1]
+        if isinstance(answer, Exception):
+            raise answer
+        return httpx.Response(answer, json={"email": "a@b.it"} if answer == 200 else {})
+
+    kwargs.setdefault("backoff", 0)
+    return SessionExchange("http://stub/session-data", transport=httpx.MockTransport(handler), **kwargs), seen
+
+
+class TestCircuitBreaker:
+    def test_opens_after_threshold_and_half_opens(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=2, reset_after=10, clock=clock)
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open" and not breaker.allow()
+        clock.now = 10
+        assert breaker.state == "half_open"
+        assert breaker.allow()
+        assert not breaker.allow()  # one trial at a time
+
+    def test_failed_trial_reopens(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_after=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 10
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open" and breaker.opens == 2
+
+    def test_success_closes(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_after=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 10
+        breaker.allow()
+        breaker.record_success()
+        assert breaker.state == "closed" and breaker.failures == 0
+
+
+class TestSessionExchange:
+    def test_success(self):
+        client, seen = exchange([200])
+        assert run(client.fetch("s1")) == {"email": "a@b.it"}
+        assert seen == ["s1"]
+
+    def test_rejection_is_not_retried(self):
+        client, seen = exchange([404])
+        with pytest.raises(InvalidSession):
+            run(client.fetch("s1"))
+        assert len(seen) == 1 and client.breaker.failures == 0
+
+    def test_transient_failures_are_retried(self):
+        client, seen = exchange([503, httpx.ConnectTimeout("lento"), 200], retries=2)
+        assert run(client.fetch("s1"))["email"] == "a@b.it"
+        assert len(seen) == 3 and client.stats()["retried"] == 2
+
+    def test_gives_up_after_retries(self):
+        client, seen = exchange([502], retries=1)
+        with pytest.raises(UpstreamUnavailable):
+            run(client.fetch("s1"))
+        assert len(seen) == 2 and client.stats()["failures"] == 1
+
+    def half_open(self, handler):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_after=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 10
+        return SessionExchange("http://stub/session-data", backoff=0, retries=0, breaker=breaker,
+                               transport=httpx.MockTransport(handler))
+
+    def test_cancelled_trial_releases_the_breaker(self):
+        calls = []
+
+        async def handler(request):
+            calls.append(request)
+            if len(calls) == 1:
+                await asyncio.sleep(60)
+            return httpx.Response(200, json={"email": "a@b.it"})
+
+        client = self.half_open(handler)
+
+        async def scenario():
+            trial = asyncio.ensure_future(client.fetch("s1"))
+            await asyncio.sleep(0.01)
+            assert client.breaker.trial
+            trial.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await trial
+            return await client.fetch("s2")
+
+        assert run(scenario()) == {"email": "a@b.it"}
+        assert client.breaker.state == "closed" and len(calls) == 2
+
+    def test_unexpected_error_counts_as_failure(self):
+        def handler(request):
+            raise RuntimeError("boom")
+
+        client = self.half_open(handler)
+        with pytest.raises(RuntimeError):
+            run(client.fetch("s1"))
+        assert client.breaker.state == "open" and not client.breaker.trial
+        assert client.breaker.opens == 2 and client.stats()["failures"] == 1
+
+    def test_open_breaker_fails_fast(self):
+        client, seen = exchange([httpx.ConnectError("giù")], retries=0,
+                                breaker=CircuitBreaker(failure_threshold=2, reset_after=60))
+        for _ in range(3):
+            with pytest.raises(UpstreamUnavailable):
+                run(client.fetch("s1"))
+        assert len(seen) == 2
+        assert client.stats()["rejected"] == 1 and client.stats()["breaker"] == "open"
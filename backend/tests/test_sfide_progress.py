@@ -0,0 +1,144 @@
+"""
+Unit tests for the challenge progress: check-progress recompute and activity events
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from pymongo import UpdateMany, UpdateOne
+
+import sfide_progress
+from progress_engine import ProgressEngine
+
+NOW = datetime(2026, 3, 15, 18, 0, tzinfo=timezone.utc)
+
+
+def _sfida(n, field="km", target=10, current=0, days_left=3, **extra):
+    return {"sfida_id": f"s{n}", "target_field": field, "target_value": target, "current_value": current,
+            "completata": False, "created_at": (NOW - timedelta(days=7 - days_left)).isoformat(),
+            "scadenza": (NOW + timedelta(days=days_left)).isoformat(), **extra}
+
+
+def _walk(days_ago, km, walk_id=None):
+    walk = {"user_id": "u1", "distanza_km": km, "passi": 1000, "velocita_media_kmh": 4.0,
+            "data": (NOW - timedelta(days=days_ago)).isoformat()}
+    if walk_id:
+        walk["walk_id"] = walk_id
+    return walk
+
+
+def run(coro):
+    return asyncio.new_event_loop().run_until_complete(coro)
+
+
+class TestEvaluate:
+    def test_only_changed_challenges_are_written(self):
+        sfide = [_sfida(1, current=4.2), _sfida(2, "passi", target=100, current=0), _sfida(3, "streak", target=3)]
+        ops, updated = sfide_progress.evaluate(sfide, {"s1": 4.2, "s2": 150, "s3": 0}, NOW)
+        assert ops == [UpdateOne({"sfida_id": "s2", "current_value": 0}, {"$set": {"current_value": 150, "completata": True}})]
+        assert [s["sfida_id"] for s in updated] == ["s1", "s2", "s3"]
+
+    def test_expired_flagged_once(self):
+        expired = _sfida(1, days_left=-1)
+        ops, updated = sfide_progress.evaluate([expired], {"s1": 50}, NOW)
+        assert ops == [UpdateOne({"sfida_id": "s1"}, {"$set": {"scaduta": True}})] and updated == []
+        ops, _ = sfide_progress.evaluate([dict(expired, scaduta=True)], {"s1": 50}, NOW)
+        assert ops == []
+
+    def test_unknown_field_reads_zero(self):
+        sfide = [_sfida(1, "meteo", current=3)]
+        ops, updated = sfide_progress.evaluate(sfide, sfide_progress.progress_values(sfide, [], [], NOW), NOW)
+        assert updated[0]["current_value"] == 0 and len(ops) == 1
+
+    def test_each_challenge_counts_its_own_window(self):
+        # s1 started 5 days ago, s2 yesterday
+        sfide = [_sfida(1, days_left=2), _sfida(2, days_left=6)]
+        walks = [_walk(4, 2.0), _walk(0.5, 1.5)]
+        assert sfide_progress.progress_values(sfide, walks, [], NOW) == {"s1": 3.5, "s2": 1.5}
+
+    def test_needed_metrics(self):
+        sfide = [_sfida(1, "km"), _sfida(2, "volume"), _sfida(3, "meteo")]
+        assert sfide_progress.needed_metrics(sfide) == {"km", "volume"}
+
+
+class TestActivityEvents:
+    def test_walk_event_updates(self):
+        event = sfide_progress.walk_event(_walk(0, 2.0, "w1"))
+        ops = sfide_progress.activity_updates(event)
+        window = {"user_id": "u1", "completata": False, "scaduta": {"$ne": True},
+                  "created_at": {"$lte": event.data}, "scadenza": {"$gt": event.data}}
+        assert ops[0] == UpdateMany({**window, "target_field": "km", "applied": {"$ne": "w1"}},
+                                    {"$inc": {"current_value": 2.0}, "$addToSet": {"applied": "w1"}})
+        assert UpdateMany({**window, "target_field": "velocita"}, {"$max": {"current_value": 4.0}}) in ops
+        reached = {**window, "target_field": {"$in": ["km", "passi", "velocita", "calorie"]},
+                   "$expr": {"$gte": ["$current_value", "$target_value"]}}
+        assert ops[-1] == UpdateMany(reached, {"$set": {"completata": True}})
+
+    def test_circuit_event_values(self):
+        circuit = {"user_id": "u1", "data": NOW.isoformat(), "durata_minuti": 20, "esercizi": [
+            {"exercise_id": "ex_squat_sedia", "sets": [{"ripetizioni": 10, "peso_kg": 2, "completato": True}]}]}
+        assert sfide_progress.circuit_event(circuit).values == {"circuiti": 1, "volume": 20, "calorie": 100}
+
+    def test_engine_drops_when_not_running(self):
+        engine = ProgressEngine(maxsize=1)
+        engine.publish(sfide_progress.walk_event(_walk(0, 1.0)))
+        assert engine.stats()["dropped"] == 1 and engine.stats()["published"] == 0
+
+
+class TestInterleaving:
+    def setup(self, db, *walks):
+        run(db.sfide.insert_one(_sfida(1, user_id="u1")))
+        for w in walks:
+            run(db.walks.insert_one(dict(w)))
+
+    def value(self, db):
+        return run(db.sfide.find_one({"sfida_id": "s1"}))["current_value"]
+
+    def test_event_applied_twice_counts_once(self, mock_db):
+        walk = _walk(0, 2.0, "w1")
+        self.setup(mock_db, walk)
+        assert run(sfide_progress.apply_activity(mock_db, sfide_progress.walk_event(walk))) is True
+        assert run(sfide_progress.apply_activity(mock_db, sfide_progress.walk_event(walk))) is False
+        assert self.value(mock_db) == 2.0
+
+    def test_event_after_check_progress_is_not_counted_again(self, mock_db):
+        walk = _walk(0, 2.0, "w1")
+        self.setup(mock_db, _walk(1, 1.0, "w0"), walk)
+        run(sfide_progress.check_progress(mock_db, "u1", NOW))
+        # The event of w1 was still queued when check-progress counted it
+        run(sfide_progress.apply_activity(mock_db, sfide_progress.walk_event(walk)))
+        assert self.value(mock_db) == 3.0
+
+    def test_event_during_check_progress_is_not_lost(self, mock_db, monkeypatch):
+        walk = _walk(0, 2.0, "w1")
+        self.setup(mock_db, _walk(1, 1.0, "w0"))
+        load_activity = sfide_progress.load_activity
+
+        async def racing_load(db, *args):
+            loaded = await load_activity(db, *args)
+            # w1 is stored and its event applied after check-progress read the walks
+            await db.walks.insert_one(dict(walk))
+            await sfide_progress.apply_activity(db, sfide_progress.walk_event(walk))
+            return loaded
+
+        monkeypatch.setattr(sfide_progress, "load_activity", racing_load)
+        run(sfide_progress.check_progress(mock_db, "u1", NOW))
+        assert self.value(mock_db) == 2.0
+        monkeypatch.setattr(sfide_progress, "load_activity", load_activity)
+        run(sfide_progress.check_progress(mock_db, "u1", NOW))
+        assert self.value(mock_db) == 3.0
+        run(sfide_progress.apply_activity(mock_db, sfide_progress.walk_event(walk)))
+        assert self.value(mock_db) == 3.0
+
+    def test_unrounded_event_total_is_not_a_change(self, mock_db):
+        walks = [_walk(0, 2.37, "w1"), _walk(0.5, 1.21, "w2")]
+        self.setup(mock_db, *walks)
+        for walk in walks:
+            run(sfide_progress.apply_activity(mock_db, sfide_progress.walk_event(walk)))
+        updated, changed = run(sfide_progress.check_progress(mock_db, "u1", NOW))
+        assert not changed and updated[0]["current_value"] == 3.6
+
+    def test_response_has_no_applied_ids(self, mock_db):
+        self.setup(mock_db, _walk(0, 2.0, "w1"))
+        updated, changed = run(sfide_progress.check_progress(mock_db, "u1", NOW))
+        assert changed and "applied" not in updated[0]
+        assert run(mock_db.sfide.find_one({"sfida_id": "s1"}))["applied"] == ["w1"]
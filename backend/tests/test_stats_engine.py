@@ -0,0 +1,103 @@
+"""
+Unit tests for the single-pass stats engine
+"""
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+import stats_engine
+
+NOW = datetime(2026, 3, 15, 18, 0, tzinfo=timezone.utc)
+
+
+def _at(days_ago, hour=9):
+    return (NOW - timedelta(days=days_ago)).replace(hour=hour).isoformat()
+
+
+def _walk(days_ago, km, passi=1000, hour=9):
+    return {"user_id": "u1", "distanza_km": km, "passi": passi, "tempo_secondi": 1800,
+            "velocita_media_kmh": 4.0, "percorso": [], "data": _at(days_ago, hour)}
+
+
+def _circuit(days_ago, reps=10, peso=2, durata=20):
+    return {"user_id": "u1", "durata_minuti": durata, "data": _at(days_ago),
+            "esercizi": [
+                {"exercise_id": "ex_squat_sedia", "nome": "Squat",
+                 "sets": [{"set_number": 1, "ripetizioni": reps, "peso_kg": peso, "completato": True},
+                          {"set_number": 2, "ripetizioni": reps, "peso_kg": peso + 1, "completato": False}]},
+                {"exercise_id": "ex_legacy", "nome": "Legacy", "serie": 2, "ripetizioni": 5, "peso_kg": 1},
+            ]}
+
+
+WALKS = sorted([_walk(0, 2.0), _walk(1, 3.5), _walk(2, 1.0), _walk(10, 5.0, 8000), _walk(40, 4.0)],
+               key=lambda w: w["data"], reverse=True)
+CIRCUITS = sorted([_circuit(0), _circuit(3, reps=12), _circuit(20, peso=4)], key=lambda c: c["data"], reverse=True)
+
+
+class TestStatsEngine:
+    def test_totals_windows_and_records(self):
+        stats = stats_engine.compute_stats(WALKS, CIRCUITS, NOW)
+        assert stats["totale"]["km"] == 15.5
+        assert stats["totale"]["camminate_totali"] == 5
+        assert stats["totale"]["volume_totale_kg"] == 20 + 10 + 24 + 10 + 40 + 10
+        assert stats["settimanale"] == {"km": 6.5, "passi": 3000, "camminate": 3, "circuiti": 2}
+        assert stats["mensile"]["camminate"] == 4
+        assert stats["record"]["best_passi"] == 8000
+        assert stats["record_esercizi"]["ex_squat_sedia"] == {"max_peso": 4, "max_reps": 12}
+        assert stats["volume_per_esercizio"]["ex_legacy"] == 30
+
+    def test_streak_and_daily_buckets(self):
+        stats = stats_engine.compute_stats(WALKS, CIRCUITS, NOW)
+        assert stats["streak"] == 4
+        today = stats["grafici_giornalieri"][-1]
+        assert today == {"data": "2026-03-15", "km": 2.0, "passi": 1000, "circuiti": 1,
+                         "calorie": stats_engine.calories(2.0, 20)}
+        assert len(stats["grafici_giornalieri"]) == 14
+
+    def test_empty_history(self):
+        stats = stats_engine.compute_stats([], [], NOW)
+        assert stats["streak"] == 0
+        assert stats["medie"]["km_per_camminata"] == 0
+
+    def test_challenge_metrics(self):
+        week_ago = (NOW - timedelta(days=7)).isoformat()
+        walks = [w for w in WALKS if w["data"] >= week_ago]
+        circuits = [c for c in CIRCUITS if c["data"] >= week_ago]
+        metrics = stats_engine.challenge_metrics(walks, circuits, NOW)
+        assert metrics["km"] == 6.5
+        assert metrics["circuiti"] == 2
+        assert metrics["volume"] == 20 + 10 + 24 + 10
+        assert metrics["streak"] == 4
+
+    def test_challenge_metrics_subset(self):
+        metrics = stats_engine.challenge_metrics(WALKS, CIRCUITS, NOW, {"km", "calorie"})
+        full = stats_engine.challenge_metrics(WALKS, CIRCUITS, NOW)
+        assert metrics == {"km": full["km"], "calorie": full["calorie"]}
+
+
+class TestSections:
+    def test_parse_sections(self):
+        assert stats_engine.parse_sections(None) == stats_engine.SECTIONS
+        assert stats_engine.parse_sections("streak, settimanale") == ("settimanale", "streak")
+        with pytest.raises(ValueError):
+            stats_engine.parse_sections("streak,meteo")
+
+    def test_section_dependencies(self):
+        streak = stats_engine.plan_sections(["streak"])
+        assert not streak["circuits"].sets
+        assert streak["walks"].since(NOW) == (NOW - timedelta(days=30)).isoformat()
+        weekly = stats_engine.plan_sections(["settimanale"])
+        assert weekly["walks"].since(NOW) == weekly["circuits"].since(NOW) == (NOW - timedelta(days=7)).isoformat()
+        records = stats_engine.plan_sections(["record_esercizi"])
+        assert not records["walks"].load and records["circuits"].full and records["circuits"].sets
+
+    def test_subset_matches_full_response(self):
+        full = stats_engine.compute_stats(WALKS, CIRCUITS, NOW)
+        for sections in (["streak"], ["settimanale", "streak"], ["grafici_circuiti", "medie"]):
+            wanted = stats_engine.parse_sections(",".join(sections))
+            plans = stats_engine.plan_sections(wanted)
+            walks = [w for w in WALKS if plans["walks"].load and w["data"] >= (plans["walks"].since(NOW) or "")]
+            circuits = [c if plans["circuits"].sets else {k: v for k, v in c.items() if k != "esercizi"}
+                        for c in CIRCUITS if plans["circuits"].load and c["data"] >= (plans["circuits"].since(NOW) or "")]
+            stats = stats_engine.compute_stats(walks, circuits, NOW, wanted)
+            assert stats == {name: full[name] for name in wanted}
@@ -0,0 +1,124 @@
+"""
+Unit tests for streamed walks: appending points, finishing and the totals computed then
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import indexes
+import walk_ingest
+
+START = datetime(2026, 3, 15, 9, 0, tzinfo=timezone.utc)
+
+
+def run(coro):
+    return asyncio.new_event_loop().run_until_complete(coro)
+
+
+def _points(*seqs):
+    return [{"seq": i, "lat": 45.0 + i * 0.001, "lng": 9.0, "timestamp": 1_000_000 + i * 30_000} for i in seqs]
+
+
+def _started(db):
+    run(indexes.ensure_indexes(db))
+    return run(walk_ingest.start_walk(db, "u1", START))["walk_id"]
+
+
+class TestWalkTotals:
+    def test_distance_time_and_speed_from_points(self):
+        # 0.001 degrees of latitude is ~111 m; one fix every 30 s
+        points = [{"lat": 45.0 + i * 0.001, "lng": 9.0, "timestamp": 1_000_000 + i * 30_000} for i in range(11)]
+        totals = walk_ingest.walk_totals(points, START, START + timedelta(hours=2))
+        assert totals["distanza_km"] == 1.11
+        assert totals["tempo_secondi"] == 300
+        assert totals["velocita_media_kmh"] == 13.3
+
+    def test_without_timestamps_uses_wall_clock(self):
+        points = [{"lat": 45.0, "lng": 9.0}]
+        totals = walk_ingest.walk_totals(points, START, START + timedelta(minutes=20))
+        assert (totals["distanza_km"], totals["tempo_secondi"], totals["velocita_media_kmh"]) == (0, 1200, 0)
+
+
+class TestAppendAndFinish:
+    def test_retried_batch_is_deduplicated(self, mock_db):
+        walk_id = _started(mock_db)
+        first = run(walk_ingest.append_points(mock_db, walk_id, "u1", _points(0, 1), START))
+        retried = run(walk_ingest.append_points(mock_db, walk_id, "u1", _points(1, 2), START))
+        assert (first["nuovi"], first["duplicati"]) == (2, 0)
+        assert (retried["ricevuti"], retried["nuovi"], retried["duplicati"]) == (2, 1, 1)
+        walk = run(walk_ingest.finish_walk(mock_db, walk_id, "u1", START))
+        assert walk["punti_percorso"] == 3
+
+    def test_other_users_walk_is_not_open(self, mock_db):
+        walk_id = _started(mock_db)
+        assert run(walk_ingest.append_points(mock_db, walk_id, "u2", _points(0), START)) is None
+
+    def test_finish_twice_returns_the_first_walk(self, mock_db):
+        walk_id = _started(mock_db)
+        run(walk_ingest.append_points(mock_db, walk_id, "u1", _points(0, 1), START))
+        created = []
+        first = run(walk_ingest.finish_walk(mock_db, walk_id, "u1", START, on_created=created.append))
+        again = run(walk_ingest.finish_walk(mock_db, walk_id, "u1", START, on_created=created.append))
+        assert again == first and len(created) == 1
+        assert run(mock_db.walks.count_documents({})) == 1
+        assert run(mock_db[walk_ingest.POINTS_COLLECTION].count_documents({})) == 0
+
+    def test_concurrent_finish_keeps_the_stored_walk(self, mock_db):
+        walk_id = _started(mock_db)
+        run(walk_ingest.append_points(mock_db, walk_id, "u1", _points(0, 1), START))
+        # The other finish stored its walk but has not removed the active one yet
+        run(mock_db.walks.insert_one({"walk_id": walk_id, "user_id": "u1", "note": "primo"}))
+        created = []
+        walk = run(walk_ingest.finish_walk(mock_db, walk_id, "u1", START, note="secondo", on_created=created.append))
+        assert walk == {"walk_id": walk_id, "user_id": "u1", "note": "primo"} and created == []
+        assert run(mock_db[walk_ingest.ACTIVE_COLLECTION].count_documents({})) == 0
+
+    def test_append_after_finish_is_rejected(self, mock_db):
+        walk_id = _started(mock_db)
+        run(walk_ingest.append_points(mock_db, walk_id, "u1", _points(0, 1), START))
+        run(walk_ingest.finish_walk(mock_db, walk_id, "u1", START))
+        assert run(walk_ingest.append_points(mock_db, walk_id, "u1", _points(2), START)) is None
+        assert run(mock_db[walk_ingest.POINTS_COLLECTION].count_documents({})) == 0
+
+    def test_append_on_a_finishing_walk_is_rejected(self, mock_db):
+        walk_id = _started(mock_db)
+        run(walk_ingest.append_points(mock_db, walk_id, "u1", _points(0, 1), START))
+        # Finish has marked the walk and is reading its points
+        run(mock_db[walk_ingest.ACTIVE_COLLECTION].update_one({"_id": walk_id}, {"$set": {"chiusa_at": START.isoformat()}}))
+        assert run(walk_ingest.append_points(mock_db, walk_id, "u1", _points(2), START)) is None
+        assert run(walk_ingest.finish_walk(mock_db, walk_id, "u1", START))["punti_percorso"] == 2
+
+    def _race(self, db, finish_first):
+        """Append (1, 2) to a walk holding (0, 1) while a whole finish runs around its insert."""
+        walk_id = _started(db)
+        run(walk_ingest.append_points(db, walk_id, "u1", _points(0, 1), START))
+        points = db[walk_ingest.POINTS_COLLECTION]
+
+        class RacingPoints:
+            def __getattr__(self, name):
+                return getattr(points, name)
+
+            async def insert_many(self, docs, **kwargs):
+                if finish_first:
+                    await walk_ingest.finish_walk(db, walk_id, "u1", START)
+                try:
+                    return await points.insert_many(docs, **kwargs)
+                finally:
+                    if not finish_first:
+                        await walk_ingest.finish_walk(db, walk_id, "u1", START)
+
+        class RacingDb:
+            def __getitem__(self, name):
+                return RacingPoints() if name == walk_ingest.POINTS_COLLECTION else db[name]
+
+        result = run(walk_ingest.append_points(RacingDb(), walk_id, "u1", _points(1, 2), START))
+        return result, run(db.walks.find_one({"walk_id": walk_id})), run(points.count_documents({}))
+
+    def test_append_racing_finish_leaves_no_points_behind(self, mock_db):
+        # Finish read the points before the batch landed: the batch is rejected and removed
+        result, walk, left = self._race(mock_db, finish_first=True)
+        assert result is None and walk["punti_percorso"] == 2 and left == 0
+
+    def test_append_racing_finish_after_insert(self, mock_db):
+        # Finish read the batch too; the client is told the walk is closed either way
+        result, walk, left = self._race(mock_db, finish_first=False)
+        assert result is None and walk["punti_percorso"] == 3 and left == 0
@@ -0,0 +1,51 @@
+"""
+Unit tests for the compact walk route codec and its simplification
+"""
+import random
+
+import pytest
+
+import walk_routes
+from benchmarks.synthetic import route
+
+
+class TestRouteCodec:
+    def test_round_trip_within_quantization(self):
+        points = route(random.Random(1), 60)
+        decoded = walk_routes.decode_route(walk_routes.encode_route(points))
+        assert len(decoded) == len(points)
+        assert all(abs(a["lat"] - b["lat"]) < 6e-7 and abs(a["lng"] - b["lng"]) < 6e-7 for a, b in zip(points, decoded))
+
+    def test_negative_coordinates_and_empty_route(self):
+        points = [{"lat": -33.8688, "lng": 151.2093}, {"lat": -33.8689, "lng": -0.0001}, {"lat": 0.0, "lng": 0.0}]
+        assert walk_routes.decode_route(walk_routes.encode_route(points)) == points
+        assert walk_routes.decode_route(walk_routes.encode_route([])) == []
+
+    def test_hour_long_walk_is_compact(self):
+        points = route(random.Random(2), 60)
+        assert len(walk_routes.encode_route(points)) < 4 * len(points)
+
+    def test_timestamps_are_kept_when_every_point_has_one(self):
+        points = [{"lat": 45.0, "lng": 9.0, "timestamp": 1_700_000_000_000 + i * 5000} for i in range(5)]
+        assert walk_routes.decode_route(walk_routes.encode_route(points)) == points
+        points[2].pop("timestamp")
+        assert all("timestamp" not in p for p in walk_routes.decode_route(walk_routes.encode_route(points)))
+
+    def test_unknown_format(self):
+        with pytest.raises(ValueError):
+            walk_routes.decode_route(b"\x09\x00")
+
+
+class TestSimplifyRoute:
+    def test_straight_line_keeps_endpoints_only(self):
+        points = [{"lat": 45.0 + i * 1e-5, "lng": 9.0} for i in range(50)]
+        assert walk_routes.simplify_route(points, 1.0) == [points[0], points[-1]]
+
+    def test_detour_beyond_tolerance_is_kept(self):
+        points = [{"lat": 45.0, "lng": 9.0}, {"lat": 45.0001, "lng": 9.0}, {"lat": 45.0, "lng": 9.0002}]
+        assert walk_routes.simplify_route(points, 5.0) == points
+        assert walk_routes.simplify_route(points, 20.0) == [points[0], points[-1]]
+
+    def test_zero_tolerance_is_identity(self):
+        points = route(random.Random(3), 5)
+        assert walk_routes.simplify_route(points, 0) == points
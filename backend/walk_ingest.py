@@ -0,0 +1,114 @@
+"""Streaming ingestion of GPS points while a walk is in progress.
+
+A client opens a walk with POST /api/walks/start, appends batches of points
+to /api/walks/{walk_id}/points while walking and closes it with
+/api/walks/{walk_id}/finish. Every point carries a client-side sequence
+number; points are stored one document each in ``walk_points`` under a
+unique (walk_id, seq) index, so a retried batch is deduplicated by the
+index and an append costs the same however long the walk already is.
+Finishing reads the points once in seq order, derives distance, duration,
+average speed and the route_analytics summary from them, stores the route
+in walk_routes and writes the walk document. Finishing twice returns the walk created the first time.
+
+Finishing first sets ``chiusa_at`` on the active walk, and an append only
+matches a walk without it. An append that was already past that check
+looks again once its points are stored and, if a finish started in the
+meantime and may have read the points without them, takes them back and
+is rejected like an append to a finished walk.
+"""
+import uuid
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+import rollups
+import route_analytics
+import walk_routes
+
+ACTIVE_COLLECTION = "active_walks"
+POINTS_COLLECTION = "walk_points"
+STRIDE_M = 0.65  # ~0.65 m stride for seniors, as in the web app
+
+
+def walk_totals(points: List[dict], started_at: datetime, now: datetime) -> dict:
+    """distanza_km, tempo_secondi, velocita_media_kmh and analisi of ``points``, sorted by seq."""
+    stamps = [p["timestamp"] for p in points if p.get("timestamp") is not None]
+    seconds = (max(stamps) - min(stamps)) / 1000 if len(stamps) >= 2 else (now - started_at).total_seconds()
+    seconds = max(int(round(seconds)), 0)
+    analisi = route_analytics.analyze_points(points, seconds)
+    km = analisi["distanza_km"]
+    return {
+        "distanza_km": km, "tempo_secondi": seconds,
+        "velocita_media_kmh": round(km / (seconds / 3600), 1) if seconds else 0, "analisi": analisi,
+    }
+
+
+async def start_walk(db, user_id: str, now: datetime) -> dict:
+    walk_id = f"walk_{uuid.uuid4().hex[:12]}"
+    await db[ACTIVE_COLLECTION].insert_one({
+        "_id": walk_id, "user_id": user_id, "data": now.isoformat(), "aggiornata_at": now.isoformat(),
+    })
+    return {"walk_id": walk_id, "data": now.isoformat()}
+
+
+async def append_points(db, walk_id: str, user_id: str, points: List[dict], now: datetime) -> Optional[dict]:
+    """Store a batch of ``{"seq", "lat", "lng", "timestamp"}`` points; None when the walk is not open."""
+    open_walk = {"_id": walk_id, "user_id": user_id, "chiusa_at": {"$exists": False}}
+    active = await db[ACTIVE_COLLECTION].find_one_and_update(
+        open_walk, {"$set": {"aggiornata_at": now.isoformat()}}, projection={"_id": 1})
+    if active is None:
+        return None
+    docs = [{"walk_id": walk_id, **p} for p in points]
+    duplicates = set()
+    if docs:
+        try:
+            await db[POINTS_COLLECTION].insert_many(docs, ordered=False)
+        except BulkWriteError as exc:
+            errors = exc.details.get("writeErrors", [])
+            if any(e.get("code") != 11000 for e in errors):
+                raise
+            # Sequence numbers already stored by an earlier, retried batch
+            duplicates = {e["index"] for e in errors}
+        if await db[ACTIVE_COLLECTION].find_one(open_walk, {"_id": 1}) is None:
+            # Finished while the batch was written: only this call's own points are taken back
+            own = [d["_id"] for i, d in enumerate(docs) if i not in duplicates]
+            await db[POINTS_COLLECTION].delete_many({"_id": {"$in": own}})
+            return None
+    inserted = len(docs) - len(duplicates)
+    return {"walk_id": walk_id, "ricevuti": len(docs), "nuovi": inserted, "duplicati": len(docs) - inserted}
+
+
+async def finish_walk(db, walk_id: str, user_id: str, now: datetime, passi: Optional[int] = None,
+                      note: Optional[str] = None, on_created: Optional[Callable[[dict], None]] = None) -> Optional[dict]:
+    """Close the walk and return its walk document; None when the walk does not exist.
+
+    ``on_created`` is called with the walk document only by the call that actually stored it.
+    """
+    active = await db[ACTIVE_COLLECTION].find_one_and_update(
+        {"_id": walk_id, "user_id": user_id}, {"$set": {"chiusa_at": now.isoformat()}})
+    if active is None:
+        # Finish retried after the first call went through
+        return await db.walks.find_one({"walk_id": walk_id, "user_id": user_id}, {"_id": 0})
+    points = await db[POINTS_COLLECTION].find(
+        {"walk_id": walk_id}, {"_id": 0, "lat": 1, "lng": 1, "timestamp": 1}).sort("seq", 1).to_list(None)
+    totals = walk_totals(points, datetime.fromisoformat(active["data"]), now)
+    walk_doc = {
+        "walk_id": walk_id, "user_id": user_id, **totals,
+        "passi": passi if passi is not None else round(totals["distanza_km"] * 1000 / STRIDE_M),
+        "punti_percorso": len(points), "note": note, "data": active["data"],
+    }
+    if points:
+        await walk_routes.save_route(db, walk_id, user_id, points)
+    try:
+        await db.walks.insert_one(walk_doc)
+        walk_doc.pop("_id", None)
+        await rollups.record_walk(db, walk_doc)
+        if on_created is not None:
+            on_created(walk_doc)
+    except DuplicateKeyError:
+        # A concurrent finish got there first
+        walk_doc = await db.walks.find_one({"walk_id": walk_id}, {"_id": 0})
+    await db[POINTS_COLLECTION].delete_many({"walk_id": walk_id})
+    await db[ACTIVE_COLLECTION].delete_one({"_id": walk_id})
+    return walk_doc
@@ -0,0 +1,173 @@
+"""Compact storage of walk GPS routes (percorso) outside the walk documents.
+
+Routes live in the ``walk_routes`` collection, one document per walk keyed
+by walk_id. Coordinates are quantized to ROUTE_DECIMALS decimals (~0.1 m,
+well below GPS accuracy), delta-encoded against the previous point and
+written as zigzag varints in a single binary field, so an hour-long walk
+takes a few kilobytes instead of a BSON array of hundreds of sub-documents.
+Routes whose points all carry a device timestamp (streamed walks) keep the
+timestamps too, delta-encoded in milliseconds, for route_analytics.
+Walk documents only keep ``punti_percorso``, the number of points, and
+the route itself is loaded by GET /api/walks/{walk_id}/route.
+``python walk_routes.py migrate`` moves legacy inline routes out of walks.
+"""
+import argparse
+import asyncio
+import math
+import os
+from typing import List, Optional
+
+from bson import Binary
+from pymongo import UpdateOne
+
+ROUTE_COLLECTION = "walk_routes"
+ROUTE_FORMAT = 1
+ROUTE_FORMAT_TIMED = 2
+ROUTE_DECIMALS = 6
+_SCALE = 10 ** ROUTE_DECIMALS
+_M_PER_DEG = 111_320
+
+
+# ===== CODEC =====
+
+def _put_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _get_varint(data: bytes, pos: int):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def encode_route(points: List[dict]) -> bytes:
+    """Pack ``[{"lat", "lng"[, "timestamp"]}, ...]`` as format byte, point count, then zigzag varint deltas."""
+    timed = bool(points) and all(p.get("timestamp") is not None for p in points)
+    out = bytearray([ROUTE_FORMAT_TIMED if timed else ROUTE_FORMAT])
+    _put_varint(out, len(points))
+    prev = (0, 0, 0)
+    for p in points:
+        curr = (round(p["lat"] * _SCALE), round(p["lng"] * _SCALE), int(p["timestamp"]) if timed else 0)
+        for value, before in zip(curr if timed else curr[:2], prev):
+            delta = value - before
+            _put_varint(out, (delta << 1) ^ (delta >> 63))
+        prev = curr
+    return bytes(out)
+
+
+def decode_route(data: bytes) -> List[dict]:
+    if data[0] not in (ROUTE_FORMAT, ROUTE_FORMAT_TIMED):
+        raise ValueError(f"Formato percorso sconosciuto: {data[0]}")
+    timed = data[0] == ROUTE_FORMAT_TIMED
+    count, pos = _get_varint(data, 1)
+    points = []
+    lat = lng = ts = 0
+    for _ in range(count):
+        zz, pos = _get_varint(data, pos)
+        lat += (zz >> 1) ^ -(zz & 1)
+        zz, pos = _get_varint(data, pos)
+        lng += (zz >> 1) ^ -(zz & 1)
+        if timed:
+            zz, pos = _get_varint(data, pos)
+            ts += (zz >> 1) ^ -(zz & 1)
+            points.append({"lat": lat / _SCALE, "lng": lng / _SCALE, "timestamp": ts})
+        else:
+            points.append({"lat": lat / _SCALE, "lng": lng / _SCALE})
+    return points
+
+
+# ===== SIMPLIFICATION =====
+
+def _segment_distance_m(p: tuple, a: tuple, b: tuple) -> float:
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    if dx == 0 and dy == 0:
+        return math.hypot(p[0] - a[0], p[1] - a[1])
+    t = max(0.0, min(1.0, ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / (dx * dx + dy * dy)))
+    return math.hypot(p[0] - a[0] - t * dx, p[1] - a[1] - t * dy)
+
+
+def simplify_route(points: List[dict], tolerance_m: float) -> List[dict]:
+    """Douglas-Peucker: drop the points that lie within ``tolerance_m`` metres of the simplified line."""
+    if tolerance_m <= 0 or len(points) < 3:
+        return points
+    # Equirectangular projection around the start: plenty for the extent of a walk
+    lat0 = math.radians(points[0]["lat"])
+    xy = [(p["lng"] * _M_PER_DEG * math.cos(lat0), p["lat"] * _M_PER_DEG) for p in points]
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        worst, worst_d = None, tolerance_m
+        for i in range(first + 1, last):
+            d = _segment_distance_m(xy[i], xy[first], xy[last])
+            if d > worst_d:
+                worst, worst_d = i, d
+        if worst is not None:
+            keep[worst] = True
+            stack.append((first, worst))
+            stack.append((worst, last))
+    return [p for p, k in zip(points, keep) if k]
+
+
+# ===== STORE =====
+
+def route_doc(walk_id: str, user_id: str, points: List[dict]) -> dict:
+    return {"_id": walk_id, "user_id": user_id, "punti": len(points), "percorso": Binary(encode_route(points))}
+
+
+async def save_route(db, walk_id: str, user_id: str, points: List[dict]) -> None:
+    await db[ROUTE_COLLECTION].replace_one({"_id": walk_id}, route_doc(walk_id, user_id, points), upsert=True)
+
+
+async def load_route(db, walk_id: str, user_id: str) -> Optional[List[dict]]:
+    """Route of one walk of ``user_id``; None when the walk does not exist."""
+    doc = await db[ROUTE_COLLECTION].find_one({"_id": walk_id, "user_id": user_id})
+    if doc is not None:
+        return decode_route(doc["percorso"])
+    # Walks saved before the split still carry their route inline
+    walk = await db.walks.find_one({"walk_id": walk_id, "user_id": user_id}, {"_id": 0, "percorso": 1})
+    if walk is None:
+        return None
+    return walk.get("percorso") or []
+
+
+async def migrate(db, batch_size: int = 500) -> int:
+    """Move inline routes into walk_routes; returns the number of walks migrated."""
+    moved = 0
+    walk_ops = []
+    cursor = db.walks.find({"percorso": {"$exists": True}}, {"_id": 0, "walk_id": 1, "user_id": 1, "percorso": 1})
+    async for walk in cursor:
+        points = walk.get("percorso") or []
+        if points:
+            await save_route(db, walk["walk_id"], walk["user_id"], points)
+        walk_ops.append(UpdateOne({"walk_id": walk["walk_id"]},
+                                  {"$set": {"punti_percorso": len(points)}, "$unset": {"percorso": ""}}))
+        moved += 1
+        if len(walk_ops) >= batch_size:
+            await db.walks.bulk_write(walk_ops, ordered=False)
+            walk_ops = []
+    if walk_ops:
+        await db.walks.bulk_write(walk_ops, ordered=False)
+    return moved
+
+
+if __name__ == "__main__":
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Percorsi GPS delle camminate")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("migrate", help="sposta i percorsi salvati nelle camminate in walk_routes")
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    moved = asyncio.run(migrate(client[os.environ.get("DB_NAME", "walt")]))
+    print(f"{moved} camminate migrate")
@@ -24,7 +24,7 @@ const CircuitPage = () => {
       try {
         const [exRes, histRes, plansRes] = await Promise.all([
           fetch(`${API_URL}/api/exercises`, { credentials: 'include' }),
-          fetch(`${API_URL}/api/circuits`, { credentials: 'include' }),
+          fetch(`${API_URL}/api/circuits?limit=5&fields=data,durata_minuti,esercizi.nome,esercizi.deviazioni`, { credentials: 'include' }),
           fetch(`${API_URL}/api/plans`, { credentials: 'include' }),
         ]);
         if (exRes.ok) setExercises(await exRes.json());
@@ -106,7 +106,7 @@ const CircuitPage = () => {
       });
       setStatus('idle');
       setTime(0);
-      const res = await fetch(`${API_URL}/api/circuits`, { credentials: 'include' });
+      const res = await fetch(`${API_URL}/api/circuits?limit=5&fields=data,durata_minuti,esercizi.nome,esercizi.deviazioni`, { credentials: 'include' });
       if (res.ok) setHistory(await res.json());
     } catch (err) { console.error(err); }
   }, [logs, time]);
@@ -18,7 +18,7 @@ const HomePage = ({ user }) => {
     const fetchData = async () => {
       try {
         const [statsRes, plansRes, sfideRes] = await Promise.all([
-          fetch(`${API_URL}/api/stats`, { credentials: 'include' }),
+          fetch(`${API_URL}/api/stats?sections=settimanale,record,totale,streak`, { credentials: 'include' }),
           fetch(`${API_URL}/api/plans`, { credentials: 'include' }),
           fetch(`${API_URL}/api/sfide`, { credentials: 'include' }),
         ]);
@@ -55,7 +55,7 @@ const HomePage = ({ user }) => {
     setRegenerating(false);
   };
 
-  const activeSfide = sfide.filter(s => !s.completata && !s.scaduta).slice(0, 2);
+  const activeSfide = sfide.filter(s => !s.completata && !s.scaduta && new Date(s.scadenza) > new Date()).slice(0, 2);
 
   return (
     <div className="min-h-screen bg-background pb-24" data-testid="home-page">
@@ -23,8 +23,6 @@ const SfidePage = () => {
   const fetchSfide = useCallback(async () => {
     setLoading(true);
     try {
-      // Check progress first
-      await fetch(`${API_URL}/api/sfide/check-progress`, { method: 'POST', credentials: 'include' });
       const res = await fetch(`${API_URL}/api/sfide`, { credentials: 'include' });
       if (res.ok) setSfide(await res.json());
     } catch (err) { /* ignore */ }
@@ -42,7 +40,8 @@ const SfidePage = () => {
     setGenerating(false);
   };
 
-  const activeSfide = sfide.filter(s => !s.completata && !s.scaduta);
+  // Progress is updated on the server as activities are saved; expired ones may not be flagged yet
+  const activeSfide = sfide.filter(s => !s.completata && !s.scaduta && new Date(s.scadenza) > new Date());
   const completedSfide = sfide.filter(s => s.completata);
 
   return (
@@ -104,7 +103,7 @@ const SfidePage = () => {
                   {/* Progress bar */}
                   <div>
                     <div className="flex items-center justify-between mb-1">
-                      <span className="text-text-secondary text-xs">{s.current_value} / {s.target_value}</span>
+                      <span className="text-text-secondary text-xs">{Math.round(s.current_value * 10) / 10} / {s.target_value}</span>
                       <span className="text-primary text-xs font-bold">{Math.round(progress)}%</span>
                     </div>
                     <div className="h-3 bg-surface-highlight rounded-full overflow-hidden">
@@ -16,6 +16,7 @@ const WalkPage = () => {
   const [gpsError, setGpsError] = useState(null);
   const [saveError, setSaveError] = useState(null);
   const [selectedWalk, setSelectedWalk] = useState(null);
+  const [route, setRoute] = useState(null);
   const intervalRef = useRef(null);
   const startTimeRef = useRef(null);
   const watchIdRef = useRef(null);
@@ -25,7 +26,7 @@ const WalkPage = () => {
   useEffect(() => {
     const fetchHistory = async () => {
       try {
-        const res = await fetch(`${API_URL}/api/walks`, { credentials: 'include' });
+        const res = await fetch(`${API_URL}/api/walks?limit=8&fields=data,passi,tempo_secondi,distanza_km,velocita_media_kmh,punti_percorso`, { credentials: 'include' });
         if (res.ok) setHistory(await res.json());
       } catch (err) { /* ignore */ }
     };
@@ -36,6 +37,21 @@ const WalkPage = () => {
     };
   }, []);
 
+  useEffect(() => {
+    setRoute(null);
+    if (!selectedWalk?.punti_percorso) return;
+    let cancelled = false;
+    const fetchRoute = async () => {
+      try {
+        // Simplified server-side: a few metres of tolerance are invisible at preview zoom
+        const res = await fetch(`${API_URL}/api/walks/${selectedWalk.walk_id}/route?tolleranza_m=3`, { credentials: 'include' });
+        if (res.ok && !cancelled) setRoute((await res.json()).percorso);
+      } catch (err) { /* ignore */ }
+    };
+    fetchRoute();
+    return () => { cancelled = true; };
+  }, [selectedWalk]);
+
   const formatTime = (seconds) => {
     const h = Math.floor(seconds / 3600);
     const m = Math.floor((seconds % 3600) / 60);
@@ -152,7 +168,7 @@ const WalkPage = () => {
         setPositions([]);
         distanceRef.current = 0;
         lastPosRef.current = null;
-        const res = await fetch(`${API_URL}/api/walks`, { credentials: 'include' });
+        const res = await fetch(`${API_URL}/api/walks?limit=8&fields=data,passi,tempo_secondi,distanza_km,velocita_media_kmh,punti_percorso`, { credentials: 'include' });
         if (res.ok) setHistory(await res.json());
       } else {
         setSaveError('Impossibile salvare la passeggiata. Riprova.');
@@ -269,11 +285,11 @@ const WalkPage = () => {
       </div>
 
       {/* Map placeholder - route preview */}
-      {selectedWalk?.percorso?.length > 1 && (
+      {route?.length > 1 && (
         <div className="px-6 mb-6">
           <div className="bg-surface border border-border rounded-3xl p-4">
             <h3 className="text-text-primary font-bold mb-2">Percorso</h3>
-            <MapPreview percorso={selectedWalk.percorso} />
+            <MapPreview key={selectedWalk?.walk_id} percorso={route} />
           </div>
         </div>
       )}
@@ -293,7 +309,7 @@ const WalkPage = () => {
                 <div className="text-left">
                   <p className="text-text-primary font-medium">{new Date(w.data).toLocaleDateString('it-IT', { weekday: 'short', day: 'numeric', month: 'short' })}</p>
                   <p className="text-text-secondary text-sm">{(w.passi || 0).toLocaleString('it-IT')} passi · {formatTime(w.tempo_secondi || 0)}</p>
-                  {w.percorso?.length > 0 && <p className="text-primary text-xs mt-1"><MapPin size={10} className="inline" /> Percorso GPS disponibile</p>}
+                  {w.punti_percorso > 0 && <p className="text-primary text-xs mt-1"><MapPin size={10} className="inline" /> Percorso GPS disponibile</p>}
                 </div>
                 <div className="text-right">
                   <p className="text-primary font-bold text-lg">{typeof w.distanza_km === 'number' ? w.distanza_km.toFixed(1) : w.distanza_km} km</p>